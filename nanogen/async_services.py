@@ -0,0 +1,201 @@
+import time
+import asyncio
+from asgiref.sync import sync_to_async
+from .services import (
+    get_ai_client, generate_video_with_kling,
+    _prepare_image_request, _image_content_kwargs, _parse_image_response, _image_api_error,
+    _new_image_failures, _image_model_attempts, _image_failure, _note_image_launch, _note_image_win,
+    _record_image_call, _record_prompt_call,
+    _prepare_veo_request, _veo_generate_kwargs, _veo_poll_timeout, _save_veo_operation, _veo_attempts,
+    _prepare_prompt_request, _prompt_parts, _prompt_content_kwargs, _prompt_attempts, _prompt_failure,
+)
+from .clients import genai_client_pool
+from .hedging import hedging_enabled, hedge_delay, image_request_latency
+from .poller import get_poller
+from .deadline import request_deadline
+from .batching import image_model_limiter
+from .veo_plan import record_veo_attempts
+
+
+# Async counterparts of the services.py generators, built on client.aio. Request
+# preparation and response handling are shared with the sync path; only the upstream
+# calls differ. Blocking steps (reference processing, Files API uploads, writing videos)
+# run briefly on the loop's default executor, the upstream wait itself holds no thread.
+
+def _in_thread(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def agenerate_image_with_gemini(prompt, config, reference_images=None, mask_image=None, deadline=None):
+    """
+    Async generate_image_with_gemini. Returns (image_bytes, mime_type).
+    """
+    deadline = deadline or request_deadline('image')
+    client = get_ai_client()
+    request = await _in_thread(_prepare_image_request)(client, prompt, config, reference_images, mask_image, deadline)
+    request['deadline'] = deadline
+    hedged = hedging_enabled(config.get('hedge')) and len(request['model_candidates']) > 1
+
+    started = time.monotonic()
+    try:
+        if hedged:
+            image = await _agenerate_image_hedged(client, request)
+        else:
+            failures = _new_image_failures()
+            for candidate_model in request['model_candidates']:
+                image = await _arun_image_model_attempts(client, request, candidate_model, failures)
+                if image:
+                    break
+            else:
+                raise _image_failure(request, failures)
+    except Exception as api_error:
+        raise _image_api_error(api_error)
+    image_request_latency.record('hedged' if hedged else 'sequential', time.monotonic() - started)
+    return image
+
+
+async def _arun_image_model_attempts(client, request, candidate_model, failures):
+    attempts = _image_model_attempts(request, candidate_model, failures)
+    outcome = None
+    try:
+        while True:
+            active_model_id, prompt_text = attempts.send(outcome)
+            call_started = time.monotonic()
+            try:
+                async with image_model_limiter.aslot(active_model_id, request['deadline']):
+                    # Latency excludes the wait for a slot.
+                    call_started = time.monotonic()
+                    response = await client.aio.models.generate_content(**_image_content_kwargs(request, active_model_id, prompt_text))
+                outcome = _parse_image_response(response)
+            except Exception as candidate_err:
+                genai_client_pool.report_error(client, candidate_err)
+                outcome = candidate_err
+            _record_image_call(request, active_model_id, outcome, time.monotonic() - call_started)
+    except StopIteration as finished:
+        return finished.value
+
+
+async def _agenerate_image_hedged(client, request):
+    """
+    Same schedule as services._generate_image_hedged; here losing calls are cancelled.
+    """
+    candidates = request['model_candidates']
+    failures = _new_image_failures()
+    pending = {}
+    launched = 0
+
+    try:
+        while True:
+            if launched < len(candidates):
+                hedge = _note_image_launch(pending)
+                task = asyncio.ensure_future(_arun_image_model_attempts(client, request, candidates[launched], failures))
+                pending[task] = (launched, hedge)
+                launched += 1
+            if not pending:
+                raise _image_failure(request, failures)
+            timeout = request['deadline'].remaining()
+            if launched < len(candidates):
+                timeout = min(timeout, hedge_delay(candidates[launched - 1]))
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                request['deadline'].check("an image model answered")
+            for task in done:
+                index, hedge = pending.pop(task)
+                image = task.result()
+                if image:
+                    _note_image_win(index, hedge)
+                    return image
+    finally:
+        for loser in pending:
+            loser.cancel()
+
+
+async def agenerate_video_with_veo(prompt, config, reference_images=None, deadline=None):
+    """
+    Async generate_video_with_veo. Operations are awaited on the shared poller instead of
+    blocking a thread. Returns (video_path, mime_type, used_model_id).
+    """
+    deadline = deadline or request_deadline('video')
+    client = get_ai_client()
+    request = await _in_thread(_prepare_veo_request)(prompt, config, reference_images)
+    request['deadline'] = deadline
+
+    async def _run_attempt(active_model_id, prompt_text, include_reference):
+        operation = await client.aio.models.generate_videos(
+            **_veo_generate_kwargs(request, active_model_id, prompt_text, include_reference)
+        )
+        if not operation.done:
+            def _check_operation():
+                nonlocal operation
+                operation = client.operations.get(operation)
+                return operation if operation.done else None
+
+            poll_timeout = _veo_poll_timeout(request)
+            await get_poller().track(
+                'veo',
+                getattr(operation, 'name', None) or active_model_id,
+                _check_operation,
+                timeout_sec=poll_timeout
+            ).wait_async(poll_timeout)
+
+        return await _in_thread(_save_veo_operation)(client, operation, deadline)
+
+    try:
+        attempts = _veo_attempts(request)
+        outcome = None
+        while True:
+            active_model, attempt_prompt, use_ref = attempts.send(outcome)
+            try:
+                outcome = await _run_attempt(active_model, attempt_prompt, use_ref)
+            except Exception as attempt_error:
+                genai_client_pool.report_error(client, attempt_error)
+                outcome = attempt_error
+    except StopIteration as finished:
+        return finished.value
+    except Exception as video_error:
+        print(f"VIDEO GENERATION FAILED: {video_error}")
+        raise video_error
+    finally:
+        await _in_thread(record_veo_attempts)(request['outcomes'])
+
+
+async def agenerate_video(prompt, config, reference_images=None, deadline=None):
+    """
+    Provider dispatch like jobs.generate_and_store_video, without saving.
+    Kling's HTTP client is synchronous, so Kling requests still occupy a worker thread.
+    """
+    config = config or {}
+    if (config.get('modelId', '') or '').startswith('kling'):
+        return await _in_thread(generate_video_with_kling)(
+            prompt=prompt, config=config, reference_images=reference_images, deadline=deadline
+        )
+    return await agenerate_video_with_veo(prompt, config, reference_images, deadline)
+
+
+async def agenerate_midjourney_prompt(data, raise_errors=False):
+    """
+    Async generate_midjourney_prompt, including the prompt cache lookup.
+    """
+    request = await _in_thread(_prepare_prompt_request)(data)
+    if request['cached_text'] is not None:
+        return request['cached_text']
+
+    client = get_ai_client()
+    parts = await _in_thread(_prompt_parts)(client, request)
+
+    try:
+        attempts = _prompt_attempts(request)
+        outcome = None
+        while True:
+            model_id = attempts.send(outcome)
+            call_started = time.monotonic()
+            try:
+                outcome = await client.aio.models.generate_content(**_prompt_content_kwargs(request, model_id, parts))
+            except Exception as e:
+                genai_client_pool.report_error(client, e)
+                outcome = e
+            _record_prompt_call(model_id, outcome, time.monotonic() - call_started)
+    except StopIteration as finished:
+        return finished.value
+    except Exception as e:
+        return _prompt_failure(e, raise_errors)
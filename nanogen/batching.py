@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import close_old_connections
+from .deadline import DeadlineExceeded
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: at most `rate` acquisitions per second, with bursts up to
+    `burst`. A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst if burst is not None else max(1.0, self.rate)))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._waited_sec = 0.0
+
+    def acquire(self):
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self._waited_sec += waited
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def stats(self):
+        with self._lock:
+            return {'rate_per_sec': self.rate, 'burst': self.burst, 'waited_sec': round(self._waited_sec, 3)}
+
+
+def _env_limiter(prefix, default_rate):
+    rate = float(os.environ.get(f'{prefix}_RATE_PER_SEC', default_rate))
+    burst = os.environ.get(f'{prefix}_BURST')
+    return RateLimiter(rate, float(burst) if burst else None)
+
+
+class ModelConcurrencyLimiter:
+    """
+    Caps in-flight upstream calls per model id across all requests. `limits` maps model
+    ids to their own cap; every other model gets `default_limit`. A limit of 0 means
+    uncapped: calls are only counted.
+    """
+
+    def __init__(self, default_limit, limits=None):
+        self.default_limit = max(0, int(default_limit))
+        self.limits = {key: max(0, int(value)) for key, value in (limits or {}).items()}
+        self._semaphores = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, model_id):
+        with self._lock:
+            if model_id not in self._semaphores:
+                limit = self.limits.get(model_id, self.default_limit)
+                self._semaphores[model_id] = threading.BoundedSemaphore(limit) if limit else None
+                self._in_flight[model_id] = 0
+            return self._semaphores[model_id]
+
+    def _slot_timeout_error(self, model_id):
+        return DeadlineExceeded(f"Request deadline exceeded while waiting for a {model_id} slot. Please try again.")
+
+    def _enter(self, model_id):
+        with self._lock:
+            self._in_flight[model_id] += 1
+
+    def _exit(self, model_id, semaphore):
+        with self._lock:
+            self._in_flight[model_id] -= 1
+        if semaphore is not None:
+            semaphore.release()
+
+    @contextmanager
+    def slot(self, model_id, deadline=None):
+        """
+        Holds one of model_id's slots for the block. With a deadline, waiting for a free
+        slot raises DeadlineExceeded once the deadline passes.
+        """
+        semaphore = self._semaphore(model_id)
+        if semaphore is not None:
+            if deadline is None:
+                semaphore.acquire()
+            elif not semaphore.acquire(timeout=deadline.remaining()):
+                raise self._slot_timeout_error(model_id)
+        self._enter(model_id)
+        try:
+            yield
+        finally:
+            self._exit(model_id, semaphore)
+
+    @asynccontextmanager
+    async def aslot(self, model_id, deadline=None):
+        """
+        Async slot(): polls for a free slot instead of blocking the event loop, so a
+        cancelled waiter never ends up holding one.
+        """
+        semaphore = self._semaphore(model_id)
+        while semaphore is not None and not semaphore.acquire(blocking=False):
+            if deadline is not None and deadline.expired():
+                raise self._slot_timeout_error(model_id)
+            await asyncio.sleep(0.05)
+        self._enter(model_id)
+        try:
+            yield
+        finally:
+            self._exit(model_id, semaphore)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model_id: {'in_flight': count, 'limit': self.limits.get(model_id, self.default_limit)}
+                for model_id, count in self._in_flight.items()
+            }
+
+
+def _env_model_limits(env_name):
+    try:
+        limits = json.loads(os.environ.get(env_name) or '{}')
+    except ValueError:
+        print(f"Ignoring invalid {env_name}; expected a JSON object of model id -> limit")
+        return {}
+    return limits if isinstance(limits, dict) else {}
+
+
+# Shared by every batch request so concurrent batches together stay under the quota.
+prompt_rate_limiter = _env_limiter('PROMPT_BATCH', '5')
+image_rate_limiter = _env_limiter('IMAGE_BATCH', '0')
+# Taken around every image generate_content call (services._run_image_model_attempts),
+# keyed on the model actually called, so fallbacks and hedges count against their own model.
+# It covers interactive, async, batch and workflow calls alike, so it is opt-in:
+# IMAGE_MODEL_CONCURRENCY (default 0 = uncapped) sets the per-model cap for the whole process,
+# and IMAGE_MODEL_CONCURRENCY_LIMITS ('{"model-id": n}') overrides it for single models.
+image_model_limiter = ModelConcurrencyLimiter(
+    os.environ.get('IMAGE_MODEL_CONCURRENCY', '0'),
+    _env_model_limits('IMAGE_MODEL_CONCURRENCY_LIMITS')
+)
+
+
+def batch_concurrency(requested, env_name, default, maximum_env_name, maximum_default):
+    """
+    Concurrency for one batch: the request may lower or raise the server default, capped
+    by the server maximum.
+    """
+    maximum = max(1, int(os.environ.get(maximum_env_name, maximum_default)))
+    try:
+        value = int(requested) if requested is not None else int(os.environ.get(env_name, default))
+    except (TypeError, ValueError):
+        value = int(os.environ.get(env_name, default))
+    return max(1, min(maximum, value))
+
+
+def iter_batch_results(items, func, concurrency, rate_limiter=None):
+    """
+    Runs func(item) for every item on up to `concurrency` threads and yields
+    (index, result, error) in completion order. Each call first takes a rate limiter token.
+    Closing the generator (client disconnect) cancels items that have not started.
+    """
+    def _call(item):
+        close_old_connections()
+        try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            return func(item)
+        finally:
+            close_old_connections()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1)), thread_name_prefix='batch')
+    try:
+        futures = {executor.submit(_call, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def ndjson_line(data):
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
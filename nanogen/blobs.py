@@ -0,0 +1,132 @@
+import os
+import re
+import base64
+import hashlib
+import binascii
+import mimetypes
+import threading
+from django.conf import settings
+
+
+BLOB_DIR = 'blobs'
+DATA_URI_RE = re.compile(r'^data:([\w.+-]+/[\w.+-]+)(?:;[\w=.+-]+)*;base64,', re.IGNORECASE)
+
+
+def _min_inline_bytes():
+    # Small data URIs (icons, tiny masks) are cheaper to keep inline than as files.
+    return int(os.environ.get('WORKFLOW_BLOB_MIN_BYTES', '4096'))
+
+
+def _blob_url_prefix():
+    return '/' + settings.MEDIA_URL.strip('/') + '/' + BLOB_DIR + '/'
+
+
+def _extension_for(mime_type):
+    ext = mimetypes.guess_extension(mime_type or '') or '.bin'
+    return '.jpg' if ext == '.jpe' else ext
+
+
+def store_blob(data, mime_type, write=True):
+    """
+    Stores bytes once under MEDIA_ROOT/blobs/<ab>/<sha256><ext> and returns the media URL.
+    With write=False only the URL is computed.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    relative = f"{BLOB_DIR}/{digest[:2]}/{digest}{_extension_for(mime_type)}"
+    path = os.path.join(settings.MEDIA_ROOT, *relative.split('/'))
+    if write:
+        try:
+            # Reusing an existing blob refreshes its mtime, so a concurrent prune's grace period covers it.
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+    return _blob_url_prefix() + relative[len(BLOB_DIR) + 1:]
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(_blob_url_prefix())
+
+
+def _blob_path(ref):
+    relative = ref[len(_blob_url_prefix()):]
+    blob_root = os.path.realpath(os.path.join(settings.MEDIA_ROOT, BLOB_DIR))
+    path = os.path.realpath(os.path.join(blob_root, relative))
+    if not path.startswith(blob_root + os.sep):
+        return None
+    return path
+
+
+def extract_inline_media(value, stats=None, write=True):
+    """
+    Returns a copy of a JSON value with every large base64 data URI replaced by a blob URL.
+    `stats` (optional dict) accumulates 'blobs' and 'inline_bytes' moved out.
+    write=False computes the result without creating blob files.
+    """
+    if isinstance(value, dict):
+        return {key: extract_inline_media(item, stats, write) for key, item in value.items()}
+    if isinstance(value, list):
+        return [extract_inline_media(item, stats, write) for item in value]
+    if not isinstance(value, str) or len(value) < _min_inline_bytes():
+        return value
+    match = DATA_URI_RE.match(value)
+    if not match:
+        return value
+    try:
+        data = base64.b64decode(value[match.end():], validate=False)
+    except (binascii.Error, ValueError):
+        return value
+    ref = store_blob(data, match.group(1).lower(), write=write)
+    if stats is not None:
+        stats['blobs'] = stats.get('blobs', 0) + 1
+        stats['inline_bytes'] = stats.get('inline_bytes', 0) + len(value) - len(ref)
+    return ref
+
+
+def expand_blob_refs(value):
+    """
+    Inverse of extract_inline_media: turns blob URLs back into data URIs.
+    Used only when a client explicitly asks for self-contained workflow JSON.
+    """
+    if isinstance(value, dict):
+        return {key: expand_blob_refs(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_blob_refs(item) for item in value]
+    if not is_blob_ref(value):
+        return value
+    path = _blob_path(value)
+    if not path or not os.path.isfile(path):
+        return value
+    with open(path, 'rb') as f:
+        data = f.read()
+    mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def collect_blob_refs(value, found=None):
+    found = set() if found is None else found
+    if isinstance(value, dict):
+        for item in value.values():
+            collect_blob_refs(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            collect_blob_refs(item, found)
+    elif is_blob_ref(value):
+        found.add(value)
+    return found
+
+
+def iter_blob_files():
+    root = os.path.join(settings.MEDIA_ROOT, BLOB_DIR)
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if not name.endswith('.tmp'):
+                yield os.path.join(directory, name)
+
+
+def blob_ref_for_path(path):
+    relative = os.path.relpath(path, os.path.join(settings.MEDIA_ROOT, BLOB_DIR)).replace(os.sep, '/')
+    return _blob_url_prefix() + relative
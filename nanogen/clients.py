@@ -0,0 +1,450 @@
+import io
+import os
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from google import genai
+from google.genai import types
+from .cache import BoundedLRUCache
+
+try:
+    import httpx
+    _TRANSPORT_ERRORS = (httpx.TransportError, ConnectionError)
+except ImportError:
+    _TRANSPORT_ERRORS = (ConnectionError,)
+
+
+class _PooledClient:
+    def __init__(self, client):
+        self.client = client
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+        self.uses = 0
+        self.healthy = True
+
+
+class GenaiClientPool:
+    """
+    Process-wide pool of genai.Client instances. Clients are thread-safe and keep
+    their HTTP connections alive, so requests share them round-robin instead of
+    paying connection setup and TLS handshakes on every call.
+
+    A client is replaced when it has been idle longer than the keep-alive window,
+    is older than the max age, was marked unhealthy after a transport error, or was
+    built with a rotated API key. Replaced clients may still be serving a call that
+    picked them up earlier, so their sync transport is closed once the client timeout
+    has passed since their last handout.
+    """
+
+    def __init__(self, size=None, keepalive_sec=None, max_age_sec=None, timeout_ms=600000):
+        self.size = max(1, int(size or os.environ.get('GENAI_CLIENT_POOL_SIZE', '4')))
+        self.keepalive_sec = float(keepalive_sec or os.environ.get('GENAI_CLIENT_KEEPALIVE_SEC', '300'))
+        self.max_age_sec = float(max_age_sec or os.environ.get('GENAI_CLIENT_MAX_AGE_SEC', '3600'))
+        self.timeout_ms = timeout_ms
+        self._slots = [None] * self.size
+        self._retired = []
+        self._next = 0
+        self._api_key = None
+        self._lock = threading.Lock()
+        # Counted per get(): a handout is one client given to a caller, not one HTTP connection.
+        self._stats = {
+            'handouts': 0, 'handouts_reused': 0, 'clients_created': 0, 'clients_recycled': 0,
+            'clients_marked_unhealthy': 0, 'clients_closed': 0,
+        }
+
+    def _is_usable(self, slot, now):
+        if slot is None or not slot.healthy:
+            return False
+        if now - slot.last_used_at > self.keepalive_sec:
+            return False
+        return now - slot.created_at <= self.max_age_sec
+
+    def _retire(self, slot):
+        if slot is not None:
+            self._retired.append(slot)
+
+    def _take_closable(self, now):
+        grace = self.timeout_ms / 1000
+        closable = [slot for slot in self._retired if now - slot.last_used_at > grace]
+        if closable:
+            self._retired = [slot for slot in self._retired if now - slot.last_used_at <= grace]
+        return closable
+
+    @staticmethod
+    def _close(client):
+        # Only the sync transport is closed here. get() also runs inside coroutines, and
+        # the client.aio transport belongs to whichever loop used it, so it is left to
+        # garbage collection rather than closed from a loop that doesn't own it.
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Failed to close retired genai client: {e}")
+
+    def get(self):
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env")
+
+        with self._lock:
+            if api_key != self._api_key:
+                # Key rotated: drop every client built with the old key.
+                for slot in self._slots:
+                    self._retire(slot)
+                self._slots = [None] * self.size
+                self._api_key = api_key
+
+            now = time.time()
+            index = self._next
+            self._next = (self._next + 1) % self.size
+            slot = self._slots[index]
+            self._stats['handouts'] += 1
+            if self._is_usable(slot, now):
+                self._stats['handouts_reused'] += 1
+            else:
+                if slot is not None:
+                    self._stats['clients_recycled'] += 1
+                    self._retire(slot)
+                slot = _PooledClient(genai.Client(api_key=api_key, http_options={'timeout': self.timeout_ms}))
+                self._slots[index] = slot
+                self._stats['clients_created'] += 1
+            slot.last_used_at = now
+            slot.uses += 1
+            closable = self._take_closable(now)
+            self._stats['clients_closed'] += len(closable)
+
+        for retired in closable:
+            self._close(retired.client)
+        return slot.client
+
+    def report_error(self, client, exc):
+        """
+        Marks the client unhealthy when the error came from the transport layer,
+        so the next request on that slot opens fresh connections.
+        """
+        if not isinstance(exc, _TRANSPORT_ERRORS):
+            return
+        with self._lock:
+            for slot in self._slots:
+                if slot is not None and slot.client is client and slot.healthy:
+                    slot.healthy = False
+                    self._stats['clients_marked_unhealthy'] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['size'] = self.size
+            data['live_clients'] = sum(1 for slot in self._slots if slot is not None and slot.healthy)
+            data['retired_clients_open'] = len(self._retired)
+        handouts = data['handouts']
+        data['handout_reuse_ratio'] = round(data['handouts_reused'] / handouts, 3) if handouts else None
+        return data
+
+
+genai_client_pool = GenaiClientPool()
+
+
+def _failed_before_sending(exc):
+    """
+    True when a request error means the server never received the request:
+    a connect timeout, a refused connection or a failed DNS lookup.
+    """
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError):
+        reason = exc.args[0] if exc.args else None
+        return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+    return False
+
+
+class PooledHttpClient:
+    """
+    REST client on a persistent, pooled requests.Session.
+    Retries 429/5xx and connection errors with jittered exponential backoff
+    (honouring Retry-After), and streams downloads to disk in chunks.
+    POST/PATCH are only retried when the server cannot have acted on them (429 or a
+    connect-phase error), so a timed-out task submission is never sent twice.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    NON_IDEMPOTENT_METHODS = {'POST', 'PATCH'}
+    NON_IDEMPOTENT_RETRY_STATUS = {429}
+
+    def __init__(self, base_url='', env_prefix='HTTP', pool_size=None, max_retries=None, backoff_sec=None, timeout_sec=None):
+        self.base_url = base_url.rstrip('/')
+        pool_size = int(pool_size or os.environ.get(f'{env_prefix}_POOL_SIZE', '10'))
+        self.max_retries = int(max_retries if max_retries is not None else os.environ.get(f'{env_prefix}_MAX_RETRIES', '4'))
+        self.backoff_sec = float(backoff_sec or os.environ.get(f'{env_prefix}_BACKOFF_SEC', '1.0'))
+        self.timeout_sec = float(timeout_sec or os.environ.get(f'{env_prefix}_TIMEOUT_SEC', '60'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'retries': 0, 'downloaded_bytes': 0}
+
+    def _bump(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _retry_delay(self, attempt, response=None, deadline=None):
+        """
+        Backoff before the next attempt, or None when the deadline would run out first.
+        """
+        delay = None
+        if response is not None:
+            try:
+                delay = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                delay = None
+        if delay is None:
+            # Full jitter keeps concurrent jobs from retrying in lockstep.
+            delay = random.uniform(0, self.backoff_sec * (2 ** attempt))
+        delay = min(delay, 30)
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+        return delay
+
+    def _sleep_before_retry(self, delay):
+        self._bump('retries')
+        time.sleep(delay)
+
+    def request(self, method, url, retries=None, deadline=None, **kwargs):
+        """
+        Sends a request with retries. With a `deadline`, every attempt's timeout (at most
+        `timeout`) and every backoff sleep come out of what is left of it, and no retry is
+        started that the deadline could not cover.
+        """
+        retries = self.max_retries if retries is None else retries
+        timeout = kwargs.pop('timeout', self.timeout_sec)
+        if not url.startswith('http'):
+            url = f"{self.base_url}/{url.lstrip('/')}"
+        idempotent = method.upper() not in self.NON_IDEMPOTENT_METHODS
+        retry_status = self.RETRY_STATUS if idempotent else self.NON_IDEMPOTENT_RETRY_STATUS
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check(f"{method} {url}")
+            self._bump('requests')
+            attempt_timeout = deadline.timeout(cap=timeout) if deadline is not None else timeout
+            try:
+                response = self.session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = None
+                if attempt < retries and (idempotent or _failed_before_sending(e)):
+                    delay = self._retry_delay(attempt, deadline=deadline)
+                if delay is None:
+                    raise
+                self._sleep_before_retry(delay)
+                attempt += 1
+                continue
+            if response.status_code in retry_status and attempt < retries:
+                delay = self._retry_delay(attempt, response, deadline)
+                if delay is not None:
+                    response.close()
+                    self._sleep_before_retry(delay)
+                    attempt += 1
+                    continue
+            return response
+
+    def download(self, url, dest_path, chunk_size=1024 * 1024, **kwargs):
+        """
+        Streams `url` into `dest_path` (written via a temp file in the same directory).
+        Returns the number of bytes written.
+        """
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.part"
+        written = 0
+        with self.request('GET', url, stream=True, **kwargs) as response:
+            if response.status_code != 200:
+                raise ValueError(f"Failed to download generated video ({response.status_code}).")
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+                os.replace(tmp_path, dest_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._bump('downloaded_bytes', written)
+        return written
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+class KlingClient(PooledHttpClient):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('base_url', 'https://api.klingai.com/v1')
+        kwargs.setdefault('env_prefix', 'KLING_HTTP')
+        super().__init__(**kwargs)
+
+
+kling_client = KlingClient()
+
+# Shared session for downloading generated media (e.g. finished Veo videos).
+media_http_client = PooledHttpClient(env_prefix='MEDIA_HTTP', timeout_sec=os.environ.get('MEDIA_HTTP_TIMEOUT_SEC', '300'))
+
+
+class KlingTokenCache:
+    """
+    Shares one signed Kling JWT across all concurrent jobs and re-signs it only
+    when it is within the refresh margin of `exp` (or the keys changed).
+    """
+
+    def __init__(self, ttl_sec=1800, refresh_margin_sec=None):
+        self.ttl_sec = ttl_sec
+        self.refresh_margin_sec = float(refresh_margin_sec or os.environ.get('KLING_TOKEN_REFRESH_MARGIN_SEC', '300'))
+        self._token = None
+        self._expires_at = 0
+        self._keys = None
+        self._lock = threading.Lock()
+        self._stats = {'signed': 0, 'served': 0, 'last_signed_at': None}
+
+    def _sign(self, ak, sk, now):
+        import jwt
+
+        headers = {
+            "alg": "HS256",
+            "typ": "JWT"
+        }
+        payload = {
+            "iss": ak,
+            "exp": int(now) + self.ttl_sec,
+            "nbf": int(now) - 5
+        }
+        return jwt.encode(payload, sk, headers=headers), payload['exp']
+
+    def get(self):
+        ak = os.environ.get('KLING_ACCESS_KEY')
+        sk = os.environ.get('KLING_SECRET_KEY')
+        if not ak or not sk:
+            raise ValueError("Missing KLING_ACCESS_KEY or KLING_SECRET_KEY in environment.")
+
+        with self._lock:
+            now = time.time()
+            if self._token is None or self._keys != (ak, sk) or now >= self._expires_at - self.refresh_margin_sec:
+                self._token, self._expires_at = self._sign(ak, sk, now)
+                self._keys = (ak, sk)
+                self._stats['signed'] += 1
+                self._stats['last_signed_at'] = int(now)
+            self._stats['served'] += 1
+            return self._token
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['expires_in_sec'] = max(0, int(self._expires_at - time.time())) if self._token else None
+        return data
+
+
+kling_token_cache = KlingTokenCache()
+
+
+class GeminiFileCache:
+    """
+    Optional (GEMINI_FILES_API=1) reuse of reference images through the Gemini Files API.
+    Each distinct image is uploaded once; the returned file handle is reused across
+    retries, fallback models and later requests until shortly before it expires.
+    Works with any client exposing files.upload()/files.get(), so it can run against a stub.
+    """
+
+    def __init__(self, enabled=None, reuse_margin_sec=None, max_entries=None):
+        if enabled is None:
+            enabled = os.environ.get('GEMINI_FILES_API', '0') == '1'
+        self.enabled = enabled
+        self.reuse_margin_sec = float(reuse_margin_sec or os.environ.get('GEMINI_FILES_REUSE_MARGIN_SEC', '3600'))
+        self._files = BoundedLRUCache(
+            max_entries=int(max_entries or os.environ.get('GEMINI_FILES_MAX_ENTRIES', '1024')),
+            sizeof=lambda value: 1
+        )
+        # Striped locks: concurrent requests for the same image wait for one upload.
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._lock = threading.Lock()
+        self._stats = {'uploads': 0, 'reused': 0, 'expired': 0, 'upload_failures': 0}
+
+    def _bump(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _key(self, data, mime_type):
+        # Files belong to the API key's project, so the key fingerprint is part of the cache key.
+        api_key = os.environ.get("GEMINI_API_KEY", "")
+        key_fp = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        return f"{key_fp}:{hashlib.sha256(data).hexdigest()}:{mime_type}"
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    @staticmethod
+    def _expires_at(uploaded):
+        expiration = getattr(uploaded, 'expiration_time', None)
+        if isinstance(expiration, datetime):
+            if expiration.tzinfo is None:
+                expiration = expiration.replace(tzinfo=timezone.utc)
+            return expiration.timestamp()
+        # Files API keeps uploads for 48 hours.
+        return time.time() + 48 * 3600
+
+    def _wait_until_active(self, client, uploaded, timeout_sec=30, deadline=None):
+        # Waiting never outlasts the request deadline; the caller then falls back to inline bytes.
+        if deadline is not None:
+            timeout_sec = min(timeout_sec, deadline.remaining())
+        started_at = time.time()
+        while True:
+            state = str(getattr(uploaded, 'state', '') or '')
+            if 'PROCESSING' not in state:
+                if 'FAILED' in state:
+                    raise ValueError(f"Uploaded reference file {uploaded.name} failed processing.")
+                return uploaded
+            left = timeout_sec - (time.time() - started_at)
+            if left <= 0:
+                raise ValueError(f"Uploaded reference file {uploaded.name} is still processing.")
+            time.sleep(min(1, left))
+            uploaded = client.files.get(name=uploaded.name)
+
+    def get_part(self, client, data, mime_type, deadline=None):
+        key = self._key(data, mime_type)
+        with self._key_lock(key):
+            entry = self._files.get(key)
+            if entry is not None:
+                if time.time() < entry['expires_at'] - self.reuse_margin_sec:
+                    self._bump('reused')
+                    return types.Part.from_uri(file_uri=entry['uri'], mime_type=entry['mime_type'])
+                self._files.pop(key)
+                self._bump('expired')
+
+            try:
+                uploaded = client.files.upload(file=io.BytesIO(data), config={'mime_type': mime_type})
+                uploaded = self._wait_until_active(client, uploaded, deadline=deadline)
+            except Exception:
+                self._bump('upload_failures')
+                raise
+            self._bump('uploads')
+            entry = {
+                'uri': uploaded.uri,
+                'mime_type': getattr(uploaded, 'mime_type', None) or mime_type,
+                'expires_at': self._expires_at(uploaded),
+            }
+            self._files.set(key, entry)
+            return types.Part.from_uri(file_uri=entry['uri'], mime_type=entry['mime_type'])
+
+    def forget_all(self):
+        self._files.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data['enabled'] = self.enabled
+        data['cached_files'] = len(self._files)
+        return data
+
+
+gemini_file_cache = GeminiFileCache()
@@ -0,0 +1,64 @@
+import os
+import time
+
+
+class DeadlineExceeded(ValueError):
+    pass
+
+
+class Deadline:
+    """
+    Wall-clock budget for one generation request. Every retry, fallback model, upstream
+    call and poll under the request takes its timeout from the same budget, so the time
+    a worker spends on a request has a hard upper bound.
+    """
+
+    def __init__(self, budget_sec):
+        self.budget_sec = max(0.0, float(budget_sec))
+        self.expires_at = time.monotonic() + self.budget_sec
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, step='continuing'):
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline of {int(self.budget_sec)}s exceeded before {step}. Please try again.")
+
+    def timeout(self, cap=None, minimum=0.1):
+        """
+        Seconds the next step may take: what is left of the budget, at most `cap`, and
+        at least `minimum` so a step started just before expiry is not given zero.
+        """
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, float(cap))
+        return max(minimum, remaining)
+
+    def timeout_ms(self, cap=None):
+        # google-genai HttpOptions take milliseconds.
+        return int(self.timeout(cap) * 1000)
+
+
+_DEFAULT_BUDGETS = {
+    'image': ('IMAGE_REQUEST_DEADLINE_SEC', '300'),
+    'video': ('VIDEO_REQUEST_DEADLINE_SEC', '1500'),
+}
+
+
+def request_deadline(kind, requested=None):
+    """
+    Deadline for a new `kind` ('image' or 'video') request. The server budget comes from
+    IMAGE_REQUEST_DEADLINE_SEC / VIDEO_REQUEST_DEADLINE_SEC; a client may ask for less
+    (e.g. `deadlineSec` in the request body) but never more.
+    """
+    env_name, default = _DEFAULT_BUDGETS[kind]
+    budget = float(os.environ.get(env_name, default))
+    try:
+        if requested is not None and float(requested) > 0:
+            budget = min(budget, float(requested))
+    except (TypeError, ValueError):
+        pass
+    return Deadline(budget)
@@ -0,0 +1,219 @@
+import os
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+
+# Longest edge in pixels for each image derivative.
+IMAGE_SIZES = {
+    'thumb': int(os.environ.get('DERIVATIVE_THUMB_PX', '384')),
+    'preview': int(os.environ.get('DERIVATIVE_PREVIEW_PX', '1280')),
+}
+POSTER_SIZE = 'poster'
+DERIVATIVE_DIR = 'derivatives'
+
+_locks = [threading.Lock() for _ in range(32)]
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _image_format():
+    fmt = os.environ.get('DERIVATIVE_FORMAT', 'webp').lower()
+    return ('JPEG', 'jpg') if fmt in ('jpg', 'jpeg') else ('WEBP', 'webp')
+
+
+def _quality():
+    return int(os.environ.get('DERIVATIVE_QUALITY', '80'))
+
+
+def _ffmpeg_binary():
+    return os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+
+
+def derivative_name(source_name, size):
+    """
+    Storage name of a derivative: derivatives/<size>/<source path without extension>.<ext>
+    """
+    stem = os.path.splitext(source_name)[0]
+    ext = 'jpg' if size == POSTER_SIZE else _image_format()[1]
+    return f"{DERIVATIVE_DIR}/{size}/{stem}.{ext}"
+
+
+def _media_path(name):
+    return os.path.join(settings.MEDIA_ROOT, *name.split('/'))
+
+
+def _is_fresh(dest_path, source_path):
+    try:
+        return os.path.getmtime(dest_path) >= os.path.getmtime(source_path)
+    except OSError:
+        return False
+
+
+def _lock_for(name):
+    return _locks[hash(name) % len(_locks)]
+
+
+def _write_atomic(dest_path, write):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _prepare_mode(img, pil_format):
+    has_alpha = 'A' in img.getbands() or (img.mode == 'P' and 'transparency' in img.info)
+    if pil_format == 'WEBP':
+        target = 'RGBA' if has_alpha else 'RGB'
+        return img if img.mode == target else img.convert(target)
+    if has_alpha:
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (0, 0, 0))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+
+def ensure_image_derivative(source_name, size):
+    """
+    Returns the storage name of the `size` derivative of an image, generating it if missing or stale.
+    Returns None if the source is missing or cannot be decoded.
+    """
+    if size not in IMAGE_SIZES or not source_name:
+        return None
+    source_path = _media_path(source_name)
+    name = derivative_name(source_name, size)
+    dest_path = _media_path(name)
+    if _is_fresh(dest_path, source_path):
+        return name
+    if not os.path.isfile(source_path):
+        return None
+
+    with _lock_for(name):
+        if _is_fresh(dest_path, source_path):
+            return name
+        pil_format, _ = _image_format()
+        max_px = IMAGE_SIZES[size]
+        try:
+            with Image.open(source_path) as img:
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+                img = _prepare_mode(img, pil_format)
+                save_kwargs = {'quality': _quality()}
+                if pil_format == 'WEBP':
+                    save_kwargs['method'] = 4
+                else:
+                    save_kwargs['optimize'] = True
+                _write_atomic(dest_path, lambda path: img.save(path, format=pil_format, **save_kwargs))
+        except Exception as e:
+            print(f"Derivative generation failed for {source_name} ({size}): {e}")
+            return None
+    return name
+
+
+def ensure_video_poster(source_name):
+    """
+    Returns the storage name of a JPEG poster frame for a video, extracting it with ffmpeg.
+    Returns None when ffmpeg is not available or extraction fails.
+    """
+    ffmpeg = _ffmpeg_binary()
+    if not ffmpeg or not source_name:
+        return None
+    source_path = _media_path(source_name)
+    name = derivative_name(source_name, POSTER_SIZE)
+    dest_path = _media_path(name)
+    if _is_fresh(dest_path, source_path):
+        return name
+    if not os.path.isfile(source_path):
+        return None
+
+    max_px = IMAGE_SIZES['preview']
+
+    def extract(path):
+        subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-ss', '0.5', '-i', source_path, '-frames:v', '1', '-update', '1',
+             '-vf', f"scale='min({max_px},iw)':-2", '-q:v', '4', '-f', 'image2', path],
+            check=True,
+            timeout=int(os.environ.get('DERIVATIVE_FFMPEG_TIMEOUT_SEC', '60'))
+        )
+
+    with _lock_for(name):
+        if _is_fresh(dest_path, source_path):
+            return name
+        try:
+            _write_atomic(dest_path, extract)
+        except Exception as e:
+            print(f"Poster extraction failed for {source_name}: {e}")
+            return None
+    return name
+
+
+def ensure_derivative(source_name, size):
+    if size == POSTER_SIZE:
+        return ensure_video_poster(source_name)
+    return ensure_image_derivative(source_name, size)
+
+
+def derivative_urls(item_key, source_name, media_type):
+    """
+    URLs for the list endpoints: the cached file when it already exists,
+    otherwise the lazy endpoint that generates it and redirects.
+    """
+    sizes = [POSTER_SIZE] if media_type == 'video' else list(IMAGE_SIZES)
+    if media_type == 'video' and not _ffmpeg_binary():
+        return {'poster_url': None}
+    source_path = _media_path(source_name)
+    urls = {}
+    for size in sizes:
+        name = derivative_name(source_name, size)
+        if _is_fresh(_media_path(name), source_path):
+            url = default_storage.url(name)
+        else:
+            url = reverse('media_derivative', args=[item_key, size])
+        urls[f"{size}_url"] = url
+    return urls
+
+
+def delete_derivatives(source_name):
+    if not source_name:
+        return
+    for size in list(IMAGE_SIZES) + [POSTER_SIZE]:
+        try:
+            os.remove(_media_path(derivative_name(source_name, size)))
+        except OSError:
+            pass
+
+
+def _generate_all(source_name, media_type):
+    try:
+        if media_type == 'video':
+            ensure_video_poster(source_name)
+        else:
+            for size in IMAGE_SIZES:
+                ensure_image_derivative(source_name, size)
+    except Exception as e:
+        print(f"Background derivative generation failed for {source_name}: {e}")
+
+
+def schedule_derivatives(source_name, media_type='image'):
+    """
+    Generates derivatives in the background right after a save (DERIVATIVES_EAGER=1, default).
+    Anything not generated here is still produced lazily on first request.
+    """
+    global _executor
+    if os.environ.get('DERIVATIVES_EAGER', '1') != '1' or not source_name:
+        return
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, int(os.environ.get('DERIVATIVE_WORKERS', '2')))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives')
+    _executor.submit(_generate_all, source_name, media_type)
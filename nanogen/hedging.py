@@ -0,0 +1,92 @@
+import os
+import math
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent latencies (seconds) per key, with nearest-rank percentiles.
+    """
+
+    def __init__(self, window):
+        self.window = max(1, int(window))
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, key):
+        with self._lock:
+            return len(self._samples.get(key) or ())
+
+    def percentile(self, key, pct):
+        with self._lock:
+            samples = sorted(self._samples.get(key) or ())
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, math.ceil(pct / 100.0 * len(samples)) - 1))
+        return samples[rank]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        data = {}
+        for key in keys:
+            data[key] = {'count': self.count(key)}
+            for pct in (50, 90, 95, 99):
+                data[key][f'p{pct}_ms'] = int(self.percentile(key, pct) * 1000)
+            data[key]['max_ms'] = int(self.percentile(key, 100) * 1000)
+        return data
+
+
+_window = int(os.environ.get('IMAGE_LATENCY_WINDOW', '200'))
+# Upstream generate_content latency per model id (answered calls only; errors are excluded).
+image_call_latency = LatencyTracker(_window)
+# End-to-end generate_image_with_gemini latency, keyed by 'hedged' / 'sequential'.
+image_request_latency = LatencyTracker(_window)
+
+_stats_lock = threading.Lock()
+_stats = {'hedges_fired': 0, 'hedges_skipped': 0, 'primary_wins': 0, 'hedge_wins': 0, 'fallback_wins': 0}
+
+
+def bump_hedge_stat(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def hedging_enabled(requested=None):
+    """
+    Hedging is opt-in: IMAGE_HEDGING_ENABLED=1 turns it on by default, and a request can
+    opt in or out explicitly with `hedge: true|false` in its config.
+    """
+    if requested is not None:
+        return bool(requested)
+    return os.environ.get('IMAGE_HEDGING_ENABLED', '0') == '1'
+
+
+def hedge_delay(model_id):
+    """
+    How long to wait on model_id before firing the next candidate: its
+    IMAGE_HEDGE_PERCENTILE latency once IMAGE_HEDGE_MIN_SAMPLES calls have been seen,
+    IMAGE_HEDGE_DELAY_SEC until then, never below IMAGE_HEDGE_MIN_DELAY_SEC.
+    """
+    minimum = float(os.environ.get('IMAGE_HEDGE_MIN_DELAY_SEC', '2'))
+    delay = float(os.environ.get('IMAGE_HEDGE_DELAY_SEC', '45'))
+    if image_call_latency.count(model_id) >= int(os.environ.get('IMAGE_HEDGE_MIN_SAMPLES', '20')):
+        delay = image_call_latency.percentile(model_id, float(os.environ.get('IMAGE_HEDGE_PERCENTILE', '95')))
+    return max(minimum, delay)
+
+
+def hedging_stats():
+    with _stats_lock:
+        data = dict(_stats)
+    data['enabled_by_default'] = hedging_enabled()
+    data['model_latency'] = image_call_latency.stats()
+    data['request_latency'] = image_request_latency.stats()
+    return data
@@ -0,0 +1,185 @@
+import os
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import GeneratedImage, GeneratedVideo, VideoJob
+from .services import generate_image_with_gemini, generate_video_with_veo, generate_video_with_kling, video_extension
+from .derivatives import schedule_derivatives
+from .pagination import invalidate_count
+from .deadline import request_deadline
+from .leases import lease_fields, recover_stale, register_recovery
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """
+    Lazily creates the process-wide worker pool for video jobs and starts heartbeating
+    the jobs this process owns (see leases.py).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = max(1, int(os.environ.get('VIDEO_JOB_WORKERS', '4')))
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='video-job')
+            register_recovery(VideoJob, recover_interrupted_jobs)
+        return _executor
+
+
+def recover_interrupted_jobs():
+    """
+    Marks queued/running jobs failed when the process that owned them stopped heartbeating.
+    Jobs of live worker processes are left alone. Returns the number of jobs failed.
+    """
+    return recover_stale(
+        VideoJob,
+        'Interrupted by server restart. Please submit the video again.',
+        reference_images=[]
+    )
+
+
+def store_generated_image(image_bytes, mime_type, prompt):
+    """
+    Saves generated image bytes as a GeneratedImage and queues its derivatives.
+    """
+    ext = mime_type.split('/')[-1]
+    generated_image = GeneratedImage.objects.create(
+        image=ContentFile(image_bytes, name=f"generated_{uuid.uuid4()}.{ext}"),
+        prompt=prompt
+    )
+    schedule_derivatives(generated_image.image.name)
+    invalidate_count('generated_images')
+    return generated_image
+
+
+def generate_and_store_image(prompt, config, reference_images, mask_image=None, deadline=None):
+    """
+    Generates one image and saves it. Each upstream call takes a slot of the model it
+    actually calls (see batching.image_model_limiter); the deadline (default
+    IMAGE_REQUEST_DEADLINE_SEC) also covers waiting for those slots.
+    Returns (generated_image, mime_type).
+    """
+    deadline = deadline or request_deadline('image')
+    image_bytes, mime_type = generate_image_with_gemini(prompt, config, reference_images, mask_image, deadline)
+    return store_generated_image(image_bytes, mime_type, prompt), mime_type
+
+
+def generate_and_store_video(prompt, config, reference_images, deadline=None):
+    """
+    Runs the provider attempt plan (Kling or Veo with fallbacks) and saves the result.
+    Returns (GeneratedVideo, mime_type, used_model).
+    """
+    config = config or {}
+    model_id = config.get('modelId', '') or ''
+
+    if model_id.startswith('kling'):
+        video, mime_type, used_model = generate_video_with_kling(
+            prompt=prompt,
+            config=config,
+            reference_images=reference_images,
+            deadline=deadline
+        )
+    else:
+        video, mime_type, used_model = generate_video_with_veo(
+            prompt=prompt,
+            config=config,
+            reference_images=reference_images,
+            deadline=deadline
+        )
+
+    return store_generated_video(video, mime_type, prompt), mime_type, used_model
+
+
+def store_generated_video(video, mime_type, prompt):
+    """
+    Saves provider output (raw bytes or a path under MEDIA_ROOT) as a GeneratedVideo.
+    """
+    if isinstance(video, (bytes, bytearray)):
+        filename = f"generated_video_{uuid.uuid4()}.{video_extension(mime_type)}"
+        video_field = ContentFile(video, name=filename)
+    else:
+        # Providers that stream to disk return a path already inside MEDIA_ROOT.
+        video_field = os.path.relpath(video, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    generated_video = GeneratedVideo.objects.create(
+        video=video_field,
+        prompt=prompt
+    )
+    schedule_derivatives(generated_video.video.name, 'video')
+    invalidate_count('generated_videos')
+    return generated_video
+
+
+def _run_video_job(job_id):
+    close_old_connections()
+    try:
+        job = VideoJob.objects.filter(id=job_id, status='queued').first()
+        if not job:
+            return
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        try:
+            generated_video, mime_type, used_model = generate_and_store_video(
+                job.prompt,
+                job.config,
+                job.reference_images
+            )
+            job.status = 'succeeded'
+            job.video = generated_video
+            job.mime_type = mime_type or ''
+            job.used_model = used_model or ''
+        except Exception as e:
+            traceback.print_exc()
+            job.status = 'failed'
+            job.error = str(e)
+
+        # Reference payloads can be several MB; they are not needed once the job is done.
+        job.reference_images = []
+        job.finished_at = timezone.now()
+        job.save()
+    finally:
+        close_old_connections()
+
+
+def submit_video_job(prompt, config, reference_images):
+    """
+    Persists a queued VideoJob and hands it to the worker pool. Returns the job.
+    """
+    executor = _get_executor()
+    job = VideoJob.objects.create(
+        prompt=prompt,
+        config=config or {},
+        reference_images=reference_images or [],
+        **lease_fields()
+    )
+    executor.submit(_run_video_job, job.id)
+    return job
+
+
+def serialize_video_job(job):
+    data = {
+        'jobId': str(job.id),
+        'status': job.status,
+        'model': job.used_model or None,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == 'succeeded' and job.video_id:
+        data['url'] = job.video.video.url
+        data['mimeType'] = job.mime_type or None
+        data['saved_video'] = {
+            'id': job.video_id,
+            'url': job.video.video.url
+        }
+    return data
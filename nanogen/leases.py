@@ -0,0 +1,115 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from datetime import timedelta
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+
+# Background work rows (VideoJob, WorkflowRun) record the process running them in `owner` and
+# refresh `heartbeat_at` while it is alive. Only rows whose heartbeat has gone stale
+# are treated as interrupted, so one worker process never fails another's live work.
+ACTIVE_STATUSES = ('queued', 'running')
+
+_owner = None
+_owner_pid = None
+_recoveries = []
+_heartbeat_pid = None
+_lock = threading.Lock()
+
+
+def worker_id():
+    """
+    Identifies this process. Recomputed after a fork, so pre-forked server workers
+    that imported this module in the parent don't share one id.
+    """
+    global _owner, _owner_pid
+    pid = os.getpid()
+    if _owner_pid != pid:
+        _owner = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+        _owner_pid = pid
+    return _owner
+
+
+def heartbeat_interval():
+    return max(1.0, float(os.environ.get('WORKER_HEARTBEAT_SEC', '15')))
+
+
+def stale_after():
+    # Several missed heartbeats before anyone else may take over a row.
+    return max(3 * heartbeat_interval(), float(os.environ.get('WORKER_STALE_SEC', '120')))
+
+
+def lease_fields():
+    """
+    Fields to set on a row this process is about to run.
+    """
+    return {'owner': worker_id(), 'heartbeat_at': timezone.now()}
+
+
+def recover_stale(model, error, **fields):
+    """
+    Marks queued/running rows of `model` failed when their owner has stopped heartbeating
+    for WORKER_STALE_SEC (or never recorded one). Returns the number of rows failed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after())
+    return model.objects.filter(status__in=ACTIVE_STATUSES).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True)
+    ).update(status='failed', error=error, finished_at=timezone.now(), **fields)
+
+
+def register_recovery(model, recover):
+    """
+    Adds `model` to the rows this process heartbeats; `recover()` is its stale sweep,
+    which the heartbeat thread runs every WORKER_STALE_SEC.
+    """
+    with _lock:
+        if not any(entry[0] is model for entry in _recoveries):
+            _recoveries.append((model, recover))
+    _start_heartbeat()
+
+
+def _sweep():
+    for model, recover in list(_recoveries):
+        try:
+            count = recover()
+            if count:
+                print(f"Marked {count} interrupted {model.__name__} row(s) failed (owner stopped heartbeating)")
+        except Exception as e:
+            print(f"Failed to recover interrupted {model.__name__} rows: {e}")
+
+
+def _beat():
+    now = timezone.now()
+    for model, _ in list(_recoveries):
+        try:
+            model.objects.filter(owner=worker_id(), status__in=ACTIVE_STATUSES).update(heartbeat_at=now)
+        except Exception as e:
+            print(f"Failed to refresh {model.__name__} heartbeats: {e}")
+
+
+def _heartbeat_loop():
+    last_sweep = None
+    while True:
+        close_old_connections()
+        try:
+            _beat()
+            if last_sweep is None or time.monotonic() - last_sweep >= stale_after():
+                last_sweep = time.monotonic()
+                _sweep()
+        finally:
+            close_old_connections()
+        time.sleep(heartbeat_interval())
+
+
+def _start_heartbeat():
+    global _heartbeat_pid
+    with _lock:
+        # Threads don't survive a fork; each worker process runs its own.
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat_loop, name='worker-heartbeat', daemon=True).start()
@@ -0,0 +1,127 @@
+import io
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from google.genai import types
+from nanogen import services, async_services
+from nanogen.batching import ModelConcurrencyLimiter
+
+
+STUB_IMAGE = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def _stub_response():
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role='model', parts=[types.Part.from_bytes(data=STUB_IMAGE, mime_type='image/png')])
+    )])
+
+
+class _StubModels:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, **kwargs):
+        time.sleep(self.latency)
+        return _stub_response()
+
+
+class _StubAsyncModels(_StubModels):
+    async def generate_content(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _stub_response()
+
+
+def _stub_client(latency):
+    return SimpleNamespace(models=_StubModels(latency), aio=SimpleNamespace(models=_StubAsyncModels(latency)))
+
+
+class _ThreadSampler:
+    """
+    Records the peak number of live threads while the benchmark runs.
+    """
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        # The sampler itself is not part of the measured path.
+        self.peak -= 1
+
+
+class Command(BaseCommand):
+    help = ('Compares the sync (thread per request) and async (client.aio) image paths against a '
+            'stub upstream with fixed latency. No API calls are made and nothing is saved.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Concurrent generations to run.')
+        parser.add_argument('--latency', type=float, default=1.0, help='Stub upstream latency in seconds.')
+        parser.add_argument('--threads', type=int, default=16, help='Thread budget for both paths.')
+        parser.add_argument('--model-concurrency', type=int, default=0,
+                            help='Per-model cap on in-flight calls (default: no cap, so it does not mask the comparison).')
+
+    def handle(self, *args, **options):
+        count = max(1, options['requests'])
+        latency = max(0.0, options['latency'])
+        threads = max(1, options['threads'])
+        client = _stub_client(latency)
+        config = {'modelId': 'gemini-3-pro-image-preview'}
+        limiter = ModelConcurrencyLimiter(options['model_concurrency'])
+
+        # self.stdout keeps the real stream; redirecting hides the per-request service logging.
+        with mock.patch.object(services, 'get_ai_client', return_value=client), \
+                mock.patch.object(async_services, 'get_ai_client', return_value=client), \
+                mock.patch.object(services, 'image_model_limiter', limiter), \
+                mock.patch.object(async_services, 'image_model_limiter', limiter), \
+                redirect_stdout(io.StringIO()):
+            self._report('sync', count, *self._run_sync(count, config, threads))
+            self._report('async', count, *self._run_async(count, config, threads))
+
+        self.stdout.write(f"{count} requests, {latency:.2f}s stub latency, {threads} threads each; "
+                          f"ideal wall time {latency:.2f}s")
+
+    def _run_sync(self, count, config, threads):
+        with _ThreadSampler() as sampler:
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(
+                    lambda i: services.generate_image_with_gemini(f'benchmark {i}', config), range(count)
+                ))
+            elapsed = time.monotonic() - started
+        return elapsed, sampler.peak, len(results)
+
+    def _run_async(self, count, config, threads):
+        async def _main():
+            # sync_to_async(thread_sensitive=False) uses the loop's default executor.
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads))
+            return await asyncio.gather(*(
+                async_services.agenerate_image_with_gemini(f'benchmark {i}', config) for i in range(count)
+            ))
+
+        with _ThreadSampler() as sampler:
+            started = time.monotonic()
+            results = asyncio.run(_main())
+            elapsed = time.monotonic() - started
+        return elapsed, sampler.peak, len(results)
+
+    def _report(self, label, count, elapsed, peak_threads, completed):
+        self.stdout.write(self.style.SUCCESS(
+            f"{label:>5}: {completed}/{count} in {elapsed:.2f}s "
+            f"({completed / elapsed if elapsed else 0:.1f} req/s), peak threads {peak_threads}"
+        ))
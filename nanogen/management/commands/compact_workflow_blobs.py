@@ -0,0 +1,114 @@
+import os
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from nanogen.models import Workflow, WorkflowStore, WorkflowRun
+from nanogen.blobs import extract_inline_media, collect_blob_refs, iter_blob_files, blob_ref_for_path
+
+
+def _json_size(value):
+    return len(json.dumps(value, separators=(',', ':')))
+
+
+class Command(BaseCommand):
+    help = 'Moves inline base64 media out of saved workflows into deduplicated blob storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report savings without writing anything.')
+        parser.add_argument('--prune', action='store_true', help='Also delete blob files no workflow or run references.')
+        parser.add_argument(
+            '--prune-grace-sec', type=float, default=float(os.environ.get('WORKFLOW_BLOB_PRUNE_GRACE_SEC', '3600')),
+            help='Keep blob files written or reused within this many seconds; a save in progress may not be committed yet.'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        before_total = 0
+        after_total = 0
+        blob_count = 0
+        touched = 0
+        skipped = 0
+
+        for workflow in Workflow.objects.all().iterator():
+            stats = {}
+            before = _json_size(workflow.graph)
+            compacted = extract_inline_media(workflow.graph, stats, write=not dry_run)
+            after = _json_size(compacted)
+            if stats.get('blobs'):
+                if not dry_run:
+                    # Same content, different representation: keep the version so open editors don't conflict.
+                    # Only written if nobody saved the workflow since it was read.
+                    if not Workflow.objects.filter(id=workflow.id, version=workflow.version).update(graph=compacted):
+                        skipped += 1
+                        self.stdout.write(f"{workflow.id}: changed while compacting, skipped")
+                        continue
+                touched += 1
+                blob_count += stats['blobs']
+                self.stdout.write(f"{workflow.id}: {before:,} -> {after:,} bytes ({stats['blobs']} inline media)")
+            before_total += before
+            after_total += after
+
+        for store in WorkflowStore.objects.all():
+            # Pre-migration style stores that still embed full workflow documents.
+            if not isinstance(store.data, dict) or 'workflows' not in store.data:
+                continue
+            stats = {}
+            before = _json_size(store.data)
+            compacted = extract_inline_media(store.data, stats, write=not dry_run)
+            after = _json_size(compacted)
+            if stats.get('blobs'):
+                if not dry_run:
+                    changed = WorkflowStore.objects.filter(id=store.id, updated_at=store.updated_at).update(
+                        data=compacted, updated_at=timezone.now()
+                    )
+                    if not changed:
+                        skipped += 1
+                        self.stdout.write(f"store {store.key}: changed while compacting, skipped")
+                        continue
+                touched += 1
+                blob_count += stats['blobs']
+                self.stdout.write(f"store {store.key}: {before:,} -> {after:,} bytes ({stats['blobs']} inline media)")
+            before_total += before
+            after_total += after
+
+        pruned_files = 0
+        pruned_bytes = 0
+        if options['prune']:
+            referenced = set()
+            for graph in Workflow.objects.values_list('graph', flat=True).iterator():
+                collect_blob_refs(graph, referenced)
+            for data in WorkflowStore.objects.values_list('data', flat=True):
+                collect_blob_refs(data, referenced)
+            # Runs keep the graph snapshot they executed and node results in reference form.
+            for graph, node_states in WorkflowRun.objects.values_list('graph', 'node_states').iterator():
+                collect_blob_refs(graph, referenced)
+                collect_blob_refs(node_states, referenced)
+            cutoff = time.time() - options['prune_grace_sec']
+            for path in list(iter_blob_files()):
+                if blob_ref_for_path(path) in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                pruned_files += 1
+                pruned_bytes += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Compacted {touched} workflow record(s), {blob_count} inline media; "
+            f"stored JSON {before_total:,} -> {after_total:,} bytes, reclaimed {before_total - after_total:,} bytes."
+        ))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {skipped} record(s) that changed while compacting; run the command again to compact them."
+            ))
+        if options['prune']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefix}Pruned {pruned_files} unreferenced blob file(s), {pruned_bytes:,} bytes."
+            ))
+
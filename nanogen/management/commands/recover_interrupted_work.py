@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from nanogen.jobs import recover_interrupted_jobs
+from nanogen.workflow_engine import recover_interrupted_runs
+
+
+class Command(BaseCommand):
+    help = ('Marks background video jobs and workflow runs failed when the worker process that owned them stopped '
+            'heartbeating. Safe to run at startup while other workers are serving.')
+
+    def handle(self, *args, **options):
+        jobs = recover_interrupted_jobs()
+        runs = recover_interrupted_runs()
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked {jobs} interrupted video job(s) and {runs} workflow run(s) failed."
+        ))
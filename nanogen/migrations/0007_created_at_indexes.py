@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nanogen', '0006_videojob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(fields=['-created_at', '-id'], name='generatedimage_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='generatedvideo',
+            index=models.Index(fields=['-created_at', '-id'], name='generatedvideo_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sourceimage',
+            index=models.Index(fields=['-created_at', '-id'], name='sourceimage_created_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 6.0.1 on 2026-10-18 05:30
+
+from django.db import migrations, models
+
+
+def split_workflow_store(apps, schema_editor):
+    WorkflowStore = apps.get_model('nanogen', 'WorkflowStore')
+    Workflow = apps.get_model('nanogen', 'Workflow')
+    store = WorkflowStore.objects.filter(key='default').first()
+    if not store or not isinstance(store.data, dict):
+        return
+    workflows = store.data.get('workflows')
+    seen = set()
+    for position, item in enumerate(workflows if isinstance(workflows, list) else []):
+        if not isinstance(item, dict) or not item.get('id'):
+            continue
+        # Dedupe on the stored primary key, not the raw id (1 vs '1', ids longer than 100 chars).
+        workflow_id = str(item['id'])[:100]
+        if workflow_id in seen:
+            continue
+        seen.add(workflow_id)
+        Workflow.objects.create(
+            id=workflow_id,
+            name=str(item.get('name') or 'Untitled Workflow')[:255],
+            graph=item.get('graph') if isinstance(item.get('graph'), dict) else {},
+            position=position
+        )
+    store.data = {'activeId': store.data.get('activeId')}
+    store.save()
+
+
+def merge_workflow_store(apps, schema_editor):
+    WorkflowStore = apps.get_model('nanogen', 'WorkflowStore')
+    Workflow = apps.get_model('nanogen', 'Workflow')
+    store, _ = WorkflowStore.objects.get_or_create(key='default', defaults={'data': {}})
+    data = store.data if isinstance(store.data, dict) else {}
+    store.data = {
+        'workflows': [
+            {
+                'id': workflow.id,
+                'name': workflow.name,
+                'updatedAt': workflow.updated_at.isoformat(),
+                'graph': workflow.graph
+            }
+            for workflow in Workflow.objects.order_by('position', 'created_at')
+        ],
+        'activeId': data.get('activeId')
+    }
+    store.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nanogen', '0007_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Workflow',
+            fields=[
+                ('id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('name', models.CharField(default='Untitled Workflow', max_length=255)),
+                ('graph', models.JSONField(default=dict)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('position', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['position', 'created_at'],
+            },
+        ),
+        migrations.RunPython(split_workflow_store, merge_workflow_store),
+    ]
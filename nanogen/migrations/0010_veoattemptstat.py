@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nanogen', '0009_workflowrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VeoAttemptStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_id', models.CharField(max_length=100)),
+                ('with_reference', models.BooleanField(default=False)),
+                ('prompt_variant', models.CharField(max_length=32)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('successes', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('failure_counts', models.JSONField(default=dict)),
+                ('last_failure_category', models.CharField(blank=True, default='', max_length=32)),
+                ('last_failure', models.TextField(blank=True, default='')),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True)),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('model_id', 'with_reference', 'prompt_variant')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nanogen', '0010_veoattemptstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videojob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AddIndex(
+            model_name='videojob',
+            index=models.Index(fields=['status', 'heartbeat_at'], name='videojob_heartbeat_idx'),
+        ),
+    ]
@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Failure kinds. 'unsupported' (the model itself is not found or not available for this
+# call) is remembered for much longer than transient errors: retrying it will not help.
+UNSUPPORTED = 'unsupported'
+TEXT_ONLY = 'text_only'
+ERROR = 'error'
+
+_UNAVAILABLE_PHRASES = ('not found', 'not_found', 'not supported', 'does not support')
+
+
+def classify_failure(exc, model_id=None):
+    """
+    UNSUPPORTED only when the error is about the model: a 404/400 whose message names the
+    model (or a models/ resource) as not found or not supported. Other 404s, such as an
+    expired Files API upload, are problems with one request's input and count as ERROR.
+    """
+    code = getattr(exc, 'code', None)
+    message = str(exc).lower()
+    names_model = 'models/' in message or bool(model_id and model_id.lower() in message)
+    if names_model and code in (404, 400, None) and any(phrase in message for phrase in _UNAVAILABLE_PHRASES):
+        return UNSUPPORTED
+    return ERROR
+
+
+class _ModelHealth:
+    def __init__(self, now):
+        self.state = CLOSED
+        self.successes = 0.0
+        self.failures = 0.0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.updated_at = now
+        self.opened_at = None
+        self.open_until = None
+        self.probe_until = None
+        self.last_failure = None
+
+    def decay(self, now, half_life):
+        factor = 0.5 ** (max(0.0, now - self.updated_at) / half_life)
+        self.successes *= factor
+        self.failures *= factor
+        self.updated_at = now
+
+    def success_rate(self):
+        total = self.successes + self.failures
+        return self.successes / total if total >= 0.5 else None
+
+
+class ModelHealthRegistry:
+    """
+    Shared per-(capability, model id) health for the fallback chains.
+
+    Success/failure counts decay with a half-life so old outcomes fade out. After
+    `failure_threshold` consecutive failures (or one 'unsupported' answer) the circuit
+    opens and the model is skipped until its cooldown ends; it then half-opens and one
+    request at a time may probe it. A success closes the circuit, a failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown_sec=120, unsupported_cooldown_sec=3600,
+                 half_life_sec=600, probe_window_sec=60):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_sec = float(cooldown_sec)
+        self.unsupported_cooldown_sec = float(unsupported_cooldown_sec)
+        self.half_life_sec = max(1.0, float(half_life_sec))
+        self.probe_window_sec = float(probe_window_sec)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, capability, model_id, now, create=True):
+        key = (capability, model_id)
+        entry = self._models.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = self._models[key] = _ModelHealth(now)
+        entry.decay(now, self.half_life_sec)
+        if entry.state == OPEN and now >= entry.open_until:
+            entry.state = HALF_OPEN
+        return entry
+
+    def record_success(self, capability, model_id, latency_sec=None):
+        with self._lock:
+            entry = self._entry(capability, model_id, time.time())
+            entry.successes += 1
+            entry.consecutive_failures = 0
+            entry.state = CLOSED
+            entry.probe_until = None
+            if latency_sec is not None:
+                entry.latency_ewma = latency_sec if entry.latency_ewma is None else 0.8 * entry.latency_ewma + 0.2 * latency_sec
+
+    def record_failure(self, capability, model_id, kind=ERROR, detail=''):
+        with self._lock:
+            now = time.time()
+            entry = self._entry(capability, model_id, now)
+            entry.failures += 1
+            entry.consecutive_failures += 1
+            entry.last_failure = {'kind': kind, 'detail': str(detail)[:200], 'at': int(now)}
+            if kind == UNSUPPORTED or entry.state == HALF_OPEN or entry.consecutive_failures >= self.failure_threshold:
+                cooldown = self.unsupported_cooldown_sec if kind == UNSUPPORTED else self.cooldown_sec
+                entry.state = OPEN
+                entry.opened_at = now
+                entry.open_until = now + cooldown
+                entry.probe_until = None
+                print(f"Circuit opened for {capability} model {model_id} ({kind}) for {int(cooldown)}s")
+
+    def order(self, capability, candidates):
+        """
+        Returns the candidates to try, best first. Open circuits are dropped; a
+        half-open model keeps its place for one probing request per probe window.
+        The first (requested) model stays first unless its success rate is clearly
+        worse than a fallback's; fallbacks are ordered by success rate, then latency.
+        If every circuit is open, the one that reopens soonest is still tried.
+        """
+        candidates = list(dict.fromkeys(candidates))
+        if not candidates:
+            return candidates
+        with self._lock:
+            now = time.time()
+            usable = []
+            for index, model_id in enumerate(candidates):
+                entry = self._entry(capability, model_id, now, create=False)
+                if entry is None:
+                    usable.append((index, model_id, None, None))
+                    continue
+                if entry.state == OPEN:
+                    continue
+                if entry.state == HALF_OPEN:
+                    if entry.probe_until and now < entry.probe_until:
+                        continue
+                    entry.probe_until = now + self.probe_window_sec
+                usable.append((index, model_id, entry.success_rate(), entry.latency_ewma))
+            if not usable:
+                soonest = min(candidates, key=lambda model_id: self._models[(capability, model_id)].open_until or 0)
+                return [soonest]
+
+        def _rate(item):
+            return item[2] if item[2] is not None else 1.0
+
+        def _rank(item):
+            return (-_rate(item), item[3] if item[3] is not None else float('inf'), item[0])
+
+        head = usable[:1] if usable[0][0] == 0 else []
+        tail = sorted(usable[len(head):], key=_rank)
+        if head and tail and _rate(tail[0]) - _rate(head[0]) > 0.5:
+            head, tail = tail[:1], head + tail[1:]
+        return [model_id for _, model_id, _, _ in head + tail]
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            data = {}
+            for capability, model_id in sorted(self._models):
+                entry = self._entry(capability, model_id, now)
+                rate = entry.success_rate()
+                data.setdefault(capability, {})[model_id] = {
+                    'state': entry.state,
+                    'success_rate': round(rate, 3) if rate is not None else None,
+                    'weighted_successes': round(entry.successes, 2),
+                    'weighted_failures': round(entry.failures, 2),
+                    'consecutive_failures': entry.consecutive_failures,
+                    'latency_ms': int(entry.latency_ewma * 1000) if entry.latency_ewma is not None else None,
+                    'reopens_in_sec': max(0, int(entry.open_until - now)) if entry.state == OPEN else None,
+                    'last_failure': entry.last_failure,
+                }
+            return data
+
+
+model_health = ModelHealthRegistry(
+    failure_threshold=os.environ.get('MODEL_CIRCUIT_FAILURES', '3'),
+    cooldown_sec=os.environ.get('MODEL_CIRCUIT_COOLDOWN_SEC', '120'),
+    unsupported_cooldown_sec=os.environ.get('MODEL_CIRCUIT_UNSUPPORTED_COOLDOWN_SEC', '3600'),
+    half_life_sec=os.environ.get('MODEL_HEALTH_HALF_LIFE_SEC', '600'),
+    probe_window_sec=os.environ.get('MODEL_CIRCUIT_PROBE_WINDOW_SEC', '60'),
+)
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 class GeneratedImage(models.Model):
@@ -5,6 +7,11 @@ class GeneratedImage(models.Model):
     prompt = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='generatedimage_created_idx'),
+        ]
+
     def __str__(self):
         return f"Image {self.id} - {self.created_at}"
 
@@ -12,6 +19,11 @@ class SourceImage(models.Model):
     image = models.ImageField(upload_to='source_images/')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='sourceimage_created_idx'),
+        ]
+
     def __str__(self):
         return f"Source {self.id} - {self.created_at}"
 
@@ -21,9 +33,46 @@ class GeneratedVideo(models.Model):
     prompt = models.TextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='generatedvideo_created_idx'),
+        ]
+
     def __str__(self):
         return f"Video {self.id} - {self.created_at}"
 
+
+class VideoJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    prompt = models.TextField()
+    config = models.JSONField(default=dict)
+    reference_images = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True, default='')
+    used_model = models.CharField(max_length=100, blank=True, default='')
+    mime_type = models.CharField(max_length=100, blank=True, default='')
+    video = models.ForeignKey(GeneratedVideo, null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs')
+    # Worker process running the job and its last sign of life; see leases.py.
+    owner = models.CharField(max_length=128, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'heartbeat_at'], name='videojob_heartbeat_idx')]
+
+    def __str__(self):
+        return f"VideoJob {self.id} [{self.status}]"
+
 class MidjourneyOption(models.Model):
     CATEGORY_CHOICES = [
         ('styles', 'Style / Look'),
@@ -58,3 +107,84 @@ class WorkflowStore(models.Model):
 
     def __str__(self):
         return f"WorkflowStore<{self.key}>"
+
+
+class Workflow(models.Model):
+    """
+    A single saved workflow graph. `version` increases on every write and backs the
+    ETag/If-Match conflict checks in the workflow API.
+    """
+    id = models.CharField(max_length=100, primary_key=True)
+    name = models.CharField(max_length=255, default='Untitled Workflow')
+    graph = models.JSONField(default=dict)
+    version = models.PositiveIntegerField(default=1)
+    position = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['position', 'created_at']
+
+    def __str__(self):
+        return f"Workflow<{self.id}> v{self.version}"
+
+
+class WorkflowRun(models.Model):
+    """
+    A server-side execution of a workflow graph. `graph` is the snapshot that was run;
+    `node_states` maps node id -> {status, result, resultType, urls, error, ...}.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    workflow = models.ForeignKey(Workflow, null=True, blank=True, on_delete=models.SET_NULL, related_name='runs')
+    graph = models.JSONField(default=dict)
+    target_node = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    node_states = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default='')
+    cancel_requested = models.BooleanField(default=False)
+    # Worker process running the run and its last sign of life; see leases.py.
+    owner = models.CharField(max_length=128, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'heartbeat_at'], name='workflowrun_heartbeat_idx')]
+
+    def __str__(self):
+        return f"WorkflowRun {self.id} [{self.status}]"
+
+
+class VeoAttemptStat(models.Model):
+    """
+    Outcome history of one Veo attempt shape: (model, with reference image, prompt variant).
+    `failure_counts` maps failure category -> count; see veo_plan.py.
+    """
+    model_id = models.CharField(max_length=100)
+    with_reference = models.BooleanField(default=False)
+    prompt_variant = models.CharField(max_length=32)
+    attempts = models.PositiveIntegerField(default=0)
+    successes = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    failure_counts = models.JSONField(default=dict)
+    last_failure_category = models.CharField(max_length=32, blank=True, default='')
+    last_failure = models.TextField(blank=True, default='')
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('model_id', 'with_reference', 'prompt_variant')]
+
+    def __str__(self):
+        return f"VeoAttemptStat<{self.model_id} ref={self.with_reference} {self.prompt_variant}> {self.successes}/{self.attempts}"
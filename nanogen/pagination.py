@@ -0,0 +1,73 @@
+import os
+import json
+import base64
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(*values):
+    """
+    Encodes the sort key of the last row on a page as an opaque URL-safe cursor.
+    Datetimes are stored as ISO strings.
+    """
+    raw = [v.isoformat() if hasattr(v, 'isoformat') else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decodes a cursor into a list of `size` values; the first one is parsed as a datetime.
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    created_at = parse_datetime(values[0]) if isinstance(values[0], str) else None
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    values[0] = created_at
+    return values
+
+
+def keyset_before(created_at, item_id):
+    """
+    Filter for rows strictly after (created_at, id) in `-created_at, -id` order.
+    """
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=item_id)
+
+
+def parse_limit(value, default=20, maximum=200):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(maximum, limit))
+
+
+def _count_cache_key(name):
+    return f"nanogen:count:{name}"
+
+
+def cached_count(name, queryset):
+    """
+    COUNT(*) for a listing, cached for LIBRARY_COUNT_CACHE_SEC seconds (0 disables caching).
+    Writers call invalidate_count(name) so totals stay exact between expiries.
+    """
+    ttl = int(os.environ.get('LIBRARY_COUNT_CACHE_SEC', '60'))
+    if ttl <= 0:
+        return queryset.count()
+    key = _count_cache_key(name)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, ttl)
+    return total
+
+
+def invalidate_count(*names):
+    cache.delete_many([_count_cache_key(name) for name in names])
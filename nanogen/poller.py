@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TransientPollError(Exception):
+    """
+    Raised by a status check to signal a temporary failure (HTTP error, bad payload).
+    The operation stays tracked and is retried with error backoff.
+    """
+
+
+class PollTimeoutError(ValueError):
+    pass
+
+
+def _provider_settings(provider):
+    prefix = f"{provider.upper()}_POLL"
+    defaults = {
+        'veo': (os.environ.get('VIDEO_GENERATION_POLL_INTERVAL_SEC', '8'), '30', '1.5'),
+        'kling': ('10', '30', '1.5'),
+    }
+    initial, maximum, backoff = defaults.get(provider, ('5', '30', '1.5'))
+    return {
+        'initial': float(os.environ.get(f"{prefix}_INITIAL_SEC", initial)),
+        'max': float(os.environ.get(f"{prefix}_MAX_SEC", maximum)),
+        'backoff': float(os.environ.get(f"{prefix}_BACKOFF", backoff)),
+    }
+
+
+class PollHandle:
+    """
+    One outstanding provider operation. `check()` returns None while pending and the
+    final value once done; any exception other than TransientPollError fails the handle.
+    """
+
+    def __init__(self, provider, key, check, timeout_sec):
+        self.provider = provider
+        self.key = key
+        self.check = check
+        self.created_at = time.time()
+        self.expires_at = self.created_at + timeout_sec if timeout_sec else None
+        self.polls = 0
+        self.errors = 0
+        self.interval = None
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self._event.is_set()
+
+    def add_done_callback(self, fn):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.result = result
+            self.error = error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                print(f"Poll callback failed ({self.provider}:{self.key}): {e}")
+        return True
+
+    def cancel(self):
+        self.cancelled = True
+        self._finish(error=PollTimeoutError(f"{self.provider} operation {self.key} was cancelled."))
+
+    def wait(self, timeout=None):
+        if not self._event.wait(timeout):
+            self.cancel()
+            raise PollTimeoutError("Video generation timed out. Please try again.")
+        if self.error:
+            raise self.error
+        return self.result
+
+    async def wait_async(self, timeout=None):
+        """
+        Awaitable form of wait(): the poller thread resolves it through the event loop,
+        so an async caller holds no thread while the operation runs.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _resolve(handle):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        self.add_done_callback(_resolve)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.cancel()
+            raise PollTimeoutError("Video generation timed out. Please try again.")
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class OperationPoller:
+    """
+    Single scheduler for every in-flight long-running provider operation.
+    Due operations are grouped per provider on each tick, and every status check in
+    the batch runs as its own task on a small thread pool, so one slow check doesn't
+    hold up the rest. Each provider has its own interval/backoff settings.
+    """
+
+    def __init__(self, max_workers=None):
+        max_workers = max_workers or int(os.environ.get('VIDEO_POLLER_THREADS', '4'))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='video-poller')
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._settings = {}
+        self._active = set()
+        self._expected_duration = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {'tracked': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'checks': 0, 'batches': 0, 'transient_errors': 0}
+        self._thread = threading.Thread(target=self._run, name='video-poller-scheduler', daemon=True)
+        self._thread.start()
+
+    def _provider(self, provider):
+        if provider not in self._settings:
+            self._settings[provider] = _provider_settings(provider)
+        return self._settings[provider]
+
+    def track(self, provider, key, check, timeout_sec=None):
+        handle = PollHandle(provider, key, check, timeout_sec)
+        handle.interval = self._provider(provider)['initial']
+        self._bump('tracked')
+        with self._cond:
+            self._active.add(handle)
+            self._push(handle, handle.created_at + handle.interval)
+            self._cond.notify()
+        handle.add_done_callback(self._forget)
+        return handle
+
+    def _forget(self, handle):
+        with self._cond:
+            self._active.discard(handle)
+
+    def _bump(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _push(self, handle, due_at):
+        heapq.heappush(self._heap, (due_at, next(self._seq), handle))
+
+    def _next_interval(self, handle, had_error):
+        settings = self._provider(handle.provider)
+        interval = handle.interval * settings['backoff']
+        if had_error:
+            interval *= 2
+        # Tighten polling again once we approach the typical completion time.
+        expected = self._expected_duration.get(handle.provider)
+        elapsed = time.time() - handle.created_at
+        if expected and not had_error and elapsed >= expected * 0.8:
+            interval = settings['initial']
+        return min(interval, settings['max'] * (2 if had_error else 1))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due_at = self._heap[0][0]
+                now = time.time()
+                if due_at > now:
+                    self._cond.wait(due_at - now)
+                    continue
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+
+            batches = {}
+            for handle in due:
+                if handle.done:
+                    continue
+                if handle.expires_at and now >= handle.expires_at:
+                    self._bump('timed_out')
+                    handle._finish(error=PollTimeoutError("Video generation timed out. Please try again."))
+                    continue
+                batches.setdefault(handle.provider, []).append(handle)
+
+            for provider, handles in batches.items():
+                self._bump('batches')
+                for handle in handles:
+                    self._executor.submit(self._check_handle, handle)
+
+    def _check_handle(self, handle):
+        # A handle is off the heap until this check reschedules it, so it is never checked twice at once.
+        if handle.done:
+            return
+        had_error = False
+        try:
+            handle.polls += 1
+            self._bump('checks')
+            result = handle.check()
+            if result is not None:
+                self._record_duration(handle)
+                self._bump('completed')
+                handle._finish(result=result)
+                return
+        except TransientPollError as e:
+            had_error = True
+            handle.errors += 1
+            self._bump('transient_errors')
+            print(f"Transient poll error ({handle.provider}:{handle.key}): {e}")
+        except Exception as e:
+            self._bump('failed')
+            handle._finish(error=e)
+            return
+
+        handle.interval = self._next_interval(handle, had_error)
+        with self._cond:
+            self._push(handle, time.time() + handle.interval)
+            self._cond.notify()
+
+    def _record_duration(self, handle):
+        duration = time.time() - handle.created_at
+        previous = self._expected_duration.get(handle.provider)
+        self._expected_duration[handle.provider] = duration if previous is None else (0.8 * previous + 0.2 * duration)
+
+    def stats(self):
+        with self._cond:
+            in_flight = len(self._active)
+        with self._stats_lock:
+            data = dict(self._stats)
+        data['in_flight'] = in_flight
+        data['expected_duration_sec'] = {k: round(v, 1) for k, v in self._expected_duration.items()}
+        return data
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = OperationPoller()
+        return _poller
+
+
+def poller_stats():
+    """
+    Returns scheduler statistics without starting the poller if it is not running yet.
+    """
+    with _poller_lock:
+        poller = _poller
+    return poller.stats() if poller else {'in_flight': 0}
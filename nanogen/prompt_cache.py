@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+import threading
+from django.core.cache import caches
+
+
+PROMPT_CACHE_ALIAS = 'prompts'
+_KEY_PREFIX = 'nanogen:prompt:'
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+
+def _bump(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def prompt_cache_enabled(requested=None):
+    """
+    The cache is opt-in: PROMPT_CACHE_ENABLED=1 turns it on by default, and a request
+    can still opt in or out explicitly with `cache: true|false`.
+    """
+    if requested is not None:
+        return bool(requested)
+    return os.environ.get('PROMPT_CACHE_ENABLED', '0') == '1'
+
+
+def prompt_cache_key(models, system_instruction, user_message, temperature, reference_digests):
+    """
+    Canonical hash of everything sent to the model: the candidate model chain, the full
+    instruction and message text, sampling temperature and the processed reference bytes.
+    """
+    payload = json.dumps({
+        'models': list(models),
+        'system': system_instruction,
+        'message': user_message,
+        'temperature': temperature,
+        'references': list(reference_digests),
+    }, sort_keys=True, separators=(',', ':'))
+    return _KEY_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def reference_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_cached_prompt(key):
+    try:
+        text = caches[PROMPT_CACHE_ALIAS].get(key)
+    except Exception as e:
+        print(f"Prompt cache read failed: {e}")
+        text = None
+    _bump('hits' if text is not None else 'misses')
+    return text
+
+
+def store_cached_prompt(key, text):
+    try:
+        caches[PROMPT_CACHE_ALIAS].set(key, text)
+        _bump('stores')
+    except Exception as e:
+        print(f"Prompt cache write failed: {e}")
+
+
+def prompt_cache_stats():
+    with _stats_lock:
+        data = dict(_stats)
+    lookups = data['hits'] + data['misses']
+    data['hit_ratio'] = round(data['hits'] / lookups, 3) if lookups else None
+    data['enabled_by_default'] = prompt_cache_enabled()
+    return data
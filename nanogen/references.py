@@ -0,0 +1,203 @@
+import os
+import base64
+import hashlib
+import threading
+import mimetypes
+from urllib.parse import urlparse, unquote
+from django.conf import settings
+from .cache import BoundedLRUCache
+
+
+def _read_media_file(relative_path):
+    """
+    Reads a file under MEDIA_ROOT, refusing paths that escape it.
+    """
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    full_path = os.path.realpath(os.path.join(media_root, relative_path))
+    if not full_path.startswith(media_root + os.sep) or not os.path.isfile(full_path):
+        return None, None
+    mime_type = mimetypes.guess_type(full_path)[0] or 'image/jpeg'
+    with open(full_path, 'rb') as f:
+        return f.read(), mime_type
+
+
+def _read_field_file(field_file):
+    if not field_file or not field_file.name:
+        return None, None
+    return _read_media_file(field_file.name)
+
+
+def load_reference_source(ref):
+    """
+    Resolves a reference image to (raw_bytes, mime_type).
+
+    Accepted forms:
+        data:<mime>;base64,...   inline image
+        img:<id> / src:<id>      GeneratedImage / SourceImage library items
+        /media/<path> or URL     file under MEDIA_ROOT
+    Returns (None, None) when the reference cannot be resolved.
+    """
+    if not isinstance(ref, str) or not ref:
+        return None, None
+
+    if ref.startswith('data:'):
+        header, data = ref.split(',', 1)
+        mime_type = header.split(':')[1].split(';')[0]
+        return base64.b64decode(data), mime_type
+
+    prefix, _, raw_id = ref.partition(':')
+    if prefix in ('img', 'src') and raw_id.isdigit():
+        from .models import GeneratedImage, SourceImage
+        model = GeneratedImage if prefix == 'img' else SourceImage
+        item = model.objects.filter(id=int(raw_id)).only('image').first()
+        return _read_field_file(item.image) if item else (None, None)
+
+    path = unquote(urlparse(ref).path)
+    media_url = '/' + settings.MEDIA_URL.strip('/') + '/'
+    if path.startswith(media_url):
+        return _read_media_file(path[len(media_url):])
+
+    return None, None
+
+
+class ProcessedReferenceCache:
+    """
+    Content-addressed cache of processed reference images, keyed by the SHA-256 of
+    the source bytes plus the processing variant.
+
+    Memory tier: size-bounded LRU (REFERENCE_CACHE_MAX_MB).
+    Disk tier (optional, REFERENCE_CACHE_DISK=1): MEDIA_ROOT/cache/references/,
+    trimmed oldest-first to REFERENCE_CACHE_DISK_MAX_MB.
+    """
+
+    def __init__(self, variant):
+        self.variant = variant
+        max_mb = float(os.environ.get('REFERENCE_CACHE_MAX_MB', '128'))
+        self.memory = BoundedLRUCache(
+            max_entries=int(os.environ.get('REFERENCE_CACHE_MAX_ENTRIES', '512')),
+            max_bytes=int(max_mb * 1024 * 1024),
+            sizeof=lambda value: len(value[0])
+        )
+        self.disk_enabled = os.environ.get('REFERENCE_CACHE_DISK', '0') == '1'
+        self.disk_max_bytes = int(float(os.environ.get('REFERENCE_CACHE_DISK_MAX_MB', '1024')) * 1024 * 1024)
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'disk_hits': 0, 'disk_writes': 0, 'disk_evictions': 0, 'processed': 0}
+
+    def _bump(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def key_for(self, raw_bytes):
+        return hashlib.sha256(raw_bytes).hexdigest() + '-' + self.variant
+
+    def _disk_dir(self):
+        return os.path.join(settings.MEDIA_ROOT, 'cache', 'references')
+
+    def _disk_path(self, key, mime_type):
+        ext = (mimetypes.guess_extension(mime_type) or '.bin') if mime_type else '.bin'
+        return os.path.join(self._disk_dir(), key[:2], key + ext)
+
+    def _disk_get(self, key):
+        directory = os.path.join(self._disk_dir(), key[:2])
+        if not os.path.isdir(directory):
+            return None
+        for name in os.listdir(directory):
+            if name.startswith(key + '.'):
+                path = os.path.join(directory, name)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    os.utime(path)
+                except OSError:
+                    return None
+                return data, mimetypes.guess_type(path)[0] or 'image/jpeg'
+        return None
+
+    def _disk_usage(self):
+        if self._disk_bytes is None:
+            total = 0
+            for root, _, files in os.walk(self._disk_dir()):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+            self._disk_bytes = total
+        return self._disk_bytes
+
+    def _disk_put(self, key, value):
+        data, mime_type = value
+        path = self._disk_path(key, mime_type)
+        with self._disk_lock:
+            try:
+                usage = self._disk_usage()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._bump('disk_writes')
+                self._disk_bytes = usage + len(data)
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._trim_disk()
+            except OSError as e:
+                print(f"Reference cache disk write failed: {e}")
+
+    def _trim_disk(self):
+        entries = []
+        for root, _, files in os.walk(self._disk_dir()):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self._bump('disk_evictions')
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def get_or_process(self, raw_bytes, mime_type, process):
+        """
+        Returns the cached (bytes, mime_type) for raw_bytes, running process(raw_bytes, mime_type) on a miss.
+        """
+        key = self.key_for(raw_bytes)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+
+        if self.disk_enabled:
+            cached = self._disk_get(key)
+            if cached is not None:
+                self._bump('disk_hits')
+                self.memory.set(key, cached)
+                return cached
+
+        result = process(raw_bytes, mime_type)
+        self._bump('processed')
+        if result and result[0]:
+            self.memory.set(key, result)
+            if self.disk_enabled:
+                self._disk_put(key, result)
+        return result
+
+    def stats(self):
+        data = self.memory.stats()
+        with self._stats_lock:
+            data.update(self._stats)
+        data['disk_enabled'] = self.disk_enabled
+        if self.disk_enabled:
+            data['disk_bytes'] = self._disk_bytes
+        return data
+
+
+# Bump the variant whenever _resize_reference_image (services.py) changes its output.
+reference_cache = ProcessedReferenceCache(variant='max1024-jpeg85')
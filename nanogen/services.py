@@ -1,63 +1,107 @@
 import os
 import io
-import base64
 import time
-import tempfile
 import re
-from google import genai
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from google.genai import types
 from google.genai import errors
 from PIL import Image
+from .poller import get_poller, TransientPollError, PollTimeoutError
+from .references import load_reference_source, reference_cache
+from .hedging import hedging_enabled, hedge_delay, bump_hedge_stat, image_call_latency, image_request_latency
+from .model_health import model_health, classify_failure, TEXT_ONLY
+from .veo_plan import (
+    plan_veo_attempts, record_veo_attempts, classify_veo_failure, PRIMARY as VEO_PRIMARY, COMPRESSED as VEO_COMPRESSED,
+    MODEL_UNSUPPORTED as VEO_MODEL_UNSUPPORTED, REFERENCE_UNSUPPORTED as VEO_REFERENCE_UNSUPPORTED, SAFETY as VEO_SAFETY,
+)
+from .deadline import request_deadline, DeadlineExceeded
+from .batching import image_model_limiter
+from .prompt_cache import prompt_cache_enabled, prompt_cache_key, reference_digest, get_cached_prompt, store_cached_prompt
+from .clients import genai_client_pool, kling_client, kling_token_cache, media_http_client, gemini_file_cache
 
 def get_ai_client():
-    # Nanobanana (Image Gen) uses GEMINI_API_KEY
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env")
+    # Nanobanana (Image Gen) uses GEMINI_API_KEY.
+    # Clients come from a shared pool (10 minute timeout) so connections are reused across requests.
+    return genai_client_pool.get()
+
+
+def new_generated_video_path(ext='mp4'):
+    """
+    Returns an absolute path under MEDIA_ROOT/generated_videos/ for a new video file.
+    """
+    from django.conf import settings
+    directory = os.path.join(settings.MEDIA_ROOT, 'generated_videos')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"generated_video_{uuid.uuid4()}.{ext}")
+
+
+def video_extension(mime_type):
+    ext = 'mp4'
+    if isinstance(mime_type, str):
+        lower = mime_type.lower()
+        if 'webm' in lower:
+            ext = 'webm'
+        elif 'quicktime' in lower or 'mov' in lower:
+            ext = 'mov'
+    return ext
+
+
+def _resize_reference_image(image_bytes, mime_type):
+    # Open with PIL
+    img = Image.open(io.BytesIO(image_bytes))
     
-    # Increase timeout to 10 minutes (600 seconds)
-    return genai.Client(api_key=api_key, http_options={'timeout': 600000})
+    # Resize if side is > 1024
+    max_size = 1024
+    if img.width > max_size or img.height > max_size:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        # Save back to bytes
+        buffer = io.BytesIO()
+        # Convert to RGB if necessary for JPEG, or keep original format if supported
+        # For simplicity and size reduction, let's use JPEG for photos
+        if img.mode in ('RGBA', 'P'):
+            img = img.convert('RGB')
+        
+        img.save(buffer, format="JPEG", quality=85)
+        buffer.seek(0)
+        return buffer.getvalue(), "image/jpeg"
+    
+    return image_bytes, mime_type
 
 
 def process_reference_image(img_str):
     """
-    Decodes a base64 image string, resizes it to max 1024x1024,
-    and returns bytes and mime_type.
+    Resolves a reference image (base64 data URI, img:/src: library id, or media path),
+    resizes it to max 1024x1024, and returns bytes and mime_type.
+    Processed results are cached by content hash, so repeated runs skip the PIL work.
     """
-    if not img_str.startswith('data:'):
-        return None, None
-        
     try:
-        header, data = img_str.split(',', 1)
-        mime_type = header.split(':')[1].split(';')[0]
-        image_bytes = base64.b64decode(data)
-        
-        # Open with PIL
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        # Resize if side is > 1024
-        max_size = 1024
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Save back to bytes
-            buffer = io.BytesIO()
-            # Convert to RGB if necessary for JPEG, or keep original format if supported
-            # For simplicity and size reduction, let's use JPEG for photos
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            img.save(buffer, format="JPEG", quality=85)
-            buffer.seek(0)
-            return buffer.getvalue(), "image/jpeg"
-        
-        return image_bytes, mime_type
+        image_bytes, mime_type = load_reference_source(img_str)
+        if not image_bytes:
+            return None, None
+        return reference_cache.get_or_process(image_bytes, mime_type, _resize_reference_image)
         
     except Exception as e:
         print(f"Error processing reference image: {e}")
         return None, None
 
 
+def build_reference_part(client, data, mime_type, deadline=None):
+    """
+    Builds the request part for a processed reference image: a reused Files API
+    handle when GEMINI_FILES_API=1, otherwise inline bytes. Waiting for an upload to
+    finish processing never outlasts `deadline`.
+    """
+    if gemini_file_cache.enabled:
+        try:
+            return gemini_file_cache.get_part(client, data, mime_type, deadline)
+        except Exception as e:
+            print(f"Files API upload failed, sending reference inline: {e}")
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+
 def extract_image_focused_prompt(prompt):
     """
     Convert mixed video/image script text into an image-focused prompt.
@@ -265,18 +309,11 @@ def extract_video_focused_prompt(prompt, duration_seconds=8):
         
     return "\n\n".join(final_prompt_parts)[:2500]
 
-def generate_image_with_gemini(prompt, config, reference_images=None, mask_image=None):
+def _prepare_image_request(client, prompt, config, reference_images=None, mask_image=None, deadline=None):
     """
-    Generates an image using Gemini 3 Pro.
-    
-    Args:
-        prompt (str): The text prompt.
-        config (dict): Configuration containing aspectRatio, imageSize, useGrounding.
-        reference_images (list): List of base64 data URIs.
-        mask_image (str): Base64 data URI of the mask image (white strokes on transparent/black).
+    Resolves the model, reference parts and final prompt for an image request.
+    Shared by the sync and async image paths; does blocking reference processing.
     """
-    client = get_ai_client()
-    
     # Priority: 1. Frontend config, 2. .env file, 3. Default safe model
     env_model_id = os.environ.get('IMAGE_MODEL_ID', 'gemini-3-pro-image-preview')
     requested_model_id = config.get('modelId') if config.get('modelId') else env_model_id
@@ -314,13 +351,13 @@ def generate_image_with_gemini(prompt, config, reference_images=None, mask_image
     for img_str in reference_images:
         processed_bytes, processed_mime = process_reference_image(img_str)
         if processed_bytes:
-            parts.append(types.Part.from_bytes(data=processed_bytes, mime_type=processed_mime))
+            parts.append(build_reference_part(client, processed_bytes, processed_mime, deadline))
 
     # 2. Add Mask Image if present
     if mask_image:
         processed_mask_bytes, processed_mask_mime = process_reference_image(mask_image)
         if processed_mask_bytes:
-            parts.append(types.Part.from_bytes(data=processed_mask_bytes, mime_type=processed_mask_mime))
+            parts.append(build_reference_part(client, processed_mask_bytes, processed_mask_mime, deadline))
             print("Mask image appended to parts.")
     
     # 3. Add text prompt
@@ -361,137 +398,411 @@ def generate_image_with_gemini(prompt, config, reference_images=None, mask_image
     if suffixes:
         final_prompt = f"{final_prompt} {', '.join(suffixes)}"
 
-    def call_image_model(active_model_id, prompt_text):
-        call_parts = list(parts)
-        call_parts.append(types.Part.from_text(text=prompt_text))
-        response = client.models.generate_content(
-            model=active_model_id,
-            contents=[types.Content(parts=call_parts)],
-            config=types.GenerateContentConfig(
-                tools=tools if tools else None,
-            )
+    fallback_model = os.environ.get('IMAGE_FALLBACK_MODEL', 'gemini-3-pro-image-preview')
+    model_candidates = [model_id]
+    if fallback_model and fallback_model not in model_candidates:
+        model_candidates.append(fallback_model)
+    if 'gemini-3-pro-image-preview' not in model_candidates:
+        model_candidates.append('gemini-3-pro-image-preview')
+
+    return {
+        'requested_model_id': requested_model_id,
+        'model_candidates': model_health.order('image', model_candidates),
+        'final_prompt': final_prompt,
+        'parts': parts,
+        'tools': tools,
+    }
+
+
+def _image_content_kwargs(request, active_model_id, prompt_text, call_timeout_sec=None):
+    call_parts = list(request['parts'])
+    call_parts.append(types.Part.from_text(text=prompt_text))
+    return {
+        'model': active_model_id,
+        'contents': [types.Content(parts=call_parts)],
+        'config': types.GenerateContentConfig(
+            tools=request['tools'] if request['tools'] else None,
+            http_options=types.HttpOptions(timeout=request['deadline'].timeout_ms(call_timeout_sec)),
         )
+    }
 
-        text_parts = []
-        diagnostics = {
-            'finish_reasons': [],
-            'prompt_feedback': '',
-            'safety': []
-        }
-        try:
-            pf = getattr(response, 'prompt_feedback', None)
-            if pf:
-                diagnostics['prompt_feedback'] = str(pf)
-        except Exception:
-            pass
-        if response.candidates:
-            for candidate in response.candidates:
-                try:
-                    fr = getattr(candidate, 'finish_reason', None)
-                    if fr is not None:
-                        diagnostics['finish_reasons'].append(str(fr))
-                except Exception:
-                    pass
-                try:
-                    sr_list = getattr(candidate, 'safety_ratings', None) or []
-                    for sr in sr_list:
-                        diagnostics['safety'].append(str(sr))
-                except Exception:
-                    pass
-                if not candidate.content or not candidate.content.parts:
-                    continue
-                for part in candidate.content.parts:
-                    if getattr(part, 'inline_data', None):
-                        mime_type = part.inline_data.mime_type
-                        data = part.inline_data.data
-                        b64_data = base64.b64encode(data).decode('utf-8')
-                        return f"data:{mime_type};base64,{b64_data}", text_parts, diagnostics
-                    if hasattr(part, 'text') and part.text:
-                        text_parts.append(part.text.strip())
-        return None, text_parts, diagnostics
-
-    # Execute generation with retries/fallbacks for text-only responses.
+
+def _parse_image_response(response):
+    """
+    Returns ((data, mime) or None, text_parts, diagnostics) for a generate_content response.
+    """
+    text_parts = []
+    diagnostics = {
+        'finish_reasons': [],
+        'prompt_feedback': '',
+        'safety': []
+    }
     try:
-        strict_suffix = "\n\n[OUTPUT FORMAT]\nGenerate an image only. Do not return explanatory text."
-        fallback_model = os.environ.get('IMAGE_FALLBACK_MODEL', 'gemini-3-pro-image-preview')
-        model_candidates = [model_id]
-        if fallback_model and fallback_model not in model_candidates:
-            model_candidates.append(fallback_model)
-        if 'gemini-3-pro-image-preview' not in model_candidates:
-            model_candidates.append('gemini-3-pro-image-preview')
-
-        last_text_parts = []
-        last_diagnostics = None
-        errors_list = []
-        for candidate_model in model_candidates:
+        pf = getattr(response, 'prompt_feedback', None)
+        if pf:
+            diagnostics['prompt_feedback'] = str(pf)
+    except Exception:
+        pass
+    if response.candidates:
+        for candidate in response.candidates:
             try:
-                image_uri, text_parts, diagnostics = call_image_model(candidate_model, final_prompt)
-                if image_uri:
-                    return image_uri
-                last_text_parts = text_parts or last_text_parts
-                last_diagnostics = diagnostics or last_diagnostics
-
-                # Retry once with a strict image-only instruction if text-only answer came back.
-                if text_parts:
-                    image_uri, text_parts_retry, diagnostics_retry = call_image_model(candidate_model, f"{final_prompt}{strict_suffix}")
-                    if image_uri:
-                        return image_uri
-                    if text_parts_retry:
-                        last_text_parts = text_parts_retry
-                    last_diagnostics = diagnostics_retry or last_diagnostics
-            except Exception as candidate_err:
-                # Try next candidate model instead of hard-failing on first 404/unsupported model.
-                print(f"Image model failed ({candidate_model}): {candidate_err}")
-                errors_list.append(f"{candidate_model}: {candidate_err}")
+                fr = getattr(candidate, 'finish_reason', None)
+                if fr is not None:
+                    diagnostics['finish_reasons'].append(str(fr))
+            except Exception:
+                pass
+            try:
+                sr_list = getattr(candidate, 'safety_ratings', None) or []
+                for sr in sr_list:
+                    diagnostics['safety'].append(str(sr))
+            except Exception:
+                pass
+            if not candidate.content or not candidate.content.parts:
                 continue
+            for part in candidate.content.parts:
+                if getattr(part, 'inline_data', None) and part.inline_data.data:
+                    return (part.inline_data.data, part.inline_data.mime_type or 'image/png'), text_parts, diagnostics
+                if hasattr(part, 'text') and part.text:
+                    text_parts.append(part.text.strip())
+    return None, text_parts, diagnostics
 
-        if last_text_parts:
-            sample = last_text_parts[0][:500]
-            print(f">>> Gemini image model returned text: {last_text_parts}")
-            print(f">>> Diagnostics: {last_diagnostics}")
-            raise ValueError(
-                f"Model returned text-only response (requested: {requested_model_id}, used: {model_candidates[-1]}). "
-                f"Sample: {sample}"
-            )
-        diag_msg = ""
-        if last_diagnostics:
-            finish = ", ".join(last_diagnostics.get('finish_reasons') or [])
-            prompt_fb = (last_diagnostics.get('prompt_feedback') or '')[:240]
-            safety = ", ".join((last_diagnostics.get('safety') or [])[:3])
-            parts_diag = []
-            if finish:
-                parts_diag.append(f"finish={finish}")
-            if prompt_fb:
-                parts_diag.append(f"prompt_feedback={prompt_fb}")
-            if safety:
-                parts_diag.append(f"safety={safety}")
-            if parts_diag:
-                diag_msg = " Details: " + " | ".join(parts_diag)
-                
-        error_reason = f"No image found in response (requested: {requested_model_id}, tried: {', '.join(model_candidates)})."
-        if errors_list:
-            error_details = " | ".join(errors_list)
-            error_reason += f" API Errors: [{error_details}]"
+
+def _new_image_failures():
+    return {'text_parts': [], 'diagnostics': None, 'errors': []}
+
+
+def _image_model_attempts(request, candidate_model, failures):
+    """
+    Retry plan for one candidate model, written as a generator so the sync and async
+    paths share it: yields (model_id, prompt_text) and receives the parsed response or
+    the exception the call raised. The prompt is retried once with a strict image-only
+    instruction if only text came back. Returns the image or None, recording why into
+    `failures`. Sequential requests run candidates one after another, hedged requests
+    overlap them; once a hedged request is settled its losers make no further calls.
+    """
+    final_prompt = request['final_prompt']
+    strict_suffix = "\n\n[OUTPUT FORMAT]\nGenerate an image only. Do not return explanatory text."
+
+    if request.get('settled'):
+        return None
+    request['deadline'].check(f"trying {candidate_model}")
+    outcome = yield candidate_model, final_prompt
+    if isinstance(outcome, Exception):
+        # Try next candidate model instead of hard-failing on first 404/unsupported model.
+        print(f"Image model failed ({candidate_model}): {outcome}")
+        failures['errors'].append(f"{candidate_model}: {outcome}")
+        return None
+    image, text_parts, diagnostics = outcome
+    if image:
+        return image
+    failures['text_parts'] = text_parts or failures['text_parts']
+    failures['diagnostics'] = diagnostics or failures['diagnostics']
+
+    # Retry once with a strict image-only instruction if text-only answer came back.
+    if text_parts and not request.get('settled'):
+        request['deadline'].check(f"retrying {candidate_model}")
+        outcome = yield candidate_model, f"{final_prompt}{strict_suffix}"
+        if isinstance(outcome, Exception):
+            print(f"Image model failed ({candidate_model}): {outcome}")
+            failures['errors'].append(f"{candidate_model}: {outcome}")
+            return None
+        image, text_parts_retry, diagnostics_retry = outcome
+        if image:
+            return image
+        if text_parts_retry:
+            failures['text_parts'] = text_parts_retry
+        failures['diagnostics'] = diagnostics_retry or failures['diagnostics']
+    model_health.record_failure('image', candidate_model, TEXT_ONLY, 'no image in response')
+    return None
+
+
+def _record_image_call(request, model_id, outcome, latency_sec):
+    """
+    Feeds one generate_content result (parsed response or exception) into the latency
+    and health trackers. Text-only answers are judged per model once its retry is done;
+    calls cut short by the request deadline say nothing about the model.
+    """
+    if isinstance(outcome, Exception):
+        if request['deadline'].expired():
+            return
+        model_health.record_failure('image', model_id, classify_failure(outcome, model_id), outcome)
+        return
+    image_call_latency.record(model_id, latency_sec)
+    if outcome[0]:
+        model_health.record_success('image', model_id, latency_sec)
+
+
+def _image_failure(request, failures):
+    """
+    The ValueError raised when no candidate produced an image.
+    """
+    model_candidates = request['model_candidates']
+    requested_model_id = request['requested_model_id']
+    last_text_parts = failures['text_parts']
+    last_diagnostics = failures['diagnostics']
+    errors_list = failures['errors']
+
+    if last_text_parts:
+        sample = last_text_parts[0][:500]
+        print(f">>> Gemini image model returned text: {last_text_parts}")
+        print(f">>> Diagnostics: {last_diagnostics}")
+        return ValueError(
+            f"Model returned text-only response (requested: {requested_model_id}, used: {model_candidates[-1]}). "
+            f"Sample: {sample}"
+        )
+    diag_msg = ""
+    if last_diagnostics:
+        finish = ", ".join(last_diagnostics.get('finish_reasons') or [])
+        prompt_fb = (last_diagnostics.get('prompt_feedback') or '')[:240]
+        safety = ", ".join((last_diagnostics.get('safety') or [])[:3])
+        parts_diag = []
+        if finish:
+            parts_diag.append(f"finish={finish}")
+        if prompt_fb:
+            parts_diag.append(f"prompt_feedback={prompt_fb}")
+        if safety:
+            parts_diag.append(f"safety={safety}")
+        if parts_diag:
+            diag_msg = " Details: " + " | ".join(parts_diag)
             
-        raise ValueError(error_reason + diag_msg)
+    error_reason = f"No image found in response (requested: {requested_model_id}, tried: {', '.join(model_candidates)})."
+    if errors_list:
+        error_details = " | ".join(errors_list)
+        error_reason += f" API Errors: [{error_details}]"
+        
+    return ValueError(error_reason + diag_msg)
+
 
-    except errors.ServerError as e:
+def _image_api_error(e):
+    """
+    Maps Gemini server errors to user-facing messages; other errors pass through.
+    """
+    if isinstance(e, errors.ServerError):
         print(f"GOOGLE API SERVER ERROR: {e}")
         if e.code == 503 or 'overloaded' in str(e).lower():
-            raise ValueError("Google AI Server is currently busy (Overloaded). Please try again in about 1 minute.")
+            return ValueError("Google AI Server is currently busy (Overloaded). Please try again in about 1 minute.")
         if e.code == 500:
-            raise ValueError("Google AI Server Internal Error. This might be due to complex prompt or large reference images.")
-        raise e
-    except Exception as api_error:
-        print(f"GOOGLE API CALL FAILED: {api_error}")
-        raise api_error
+            return ValueError("Google AI Server Internal Error. This might be due to complex prompt or large reference images.")
+        return e
+    print(f"GOOGLE API CALL FAILED: {e}")
+    return e
 
 
-def generate_video_with_veo(prompt, config, reference_images=None):
+def generate_image_with_gemini(prompt, config, reference_images=None, mask_image=None, deadline=None):
     """
-    Generates a video using Veo models and returns (video_bytes, mime_type, used_model_id).
+    Generates an image using Gemini 3 Pro.
+    
+    Args:
+        prompt (str): The text prompt.
+        config (dict): Configuration containing aspectRatio, imageSize, useGrounding.
+        reference_images (list): List of base64 data URIs.
+        mask_image (str): Base64 data URI of the mask image (white strokes on transparent/black).
+        deadline (Deadline): Budget for the whole request, retries and fallbacks included.
+            Defaults to IMAGE_REQUEST_DEADLINE_SEC.
+
+    Returns:
+        tuple: (image_bytes, mime_type) exactly as returned by the model.
     """
+    deadline = deadline or request_deadline('image')
     client = get_ai_client()
+    request = _prepare_image_request(client, prompt, config, reference_images, mask_image, deadline)
+    request['deadline'] = deadline
+    hedged = hedging_enabled(config.get('hedge')) and len(request['model_candidates']) > 1
+
+    started = time.monotonic()
+    try:
+        if hedged:
+            image = _generate_image_hedged(client, request)
+        else:
+            failures = _new_image_failures()
+            for candidate_model in request['model_candidates']:
+                image = _run_image_model_attempts(client, request, candidate_model, failures)
+                if image:
+                    break
+            else:
+                raise _image_failure(request, failures)
+    except Exception as api_error:
+        raise _image_api_error(api_error)
+    image_request_latency.record('hedged' if hedged else 'sequential', time.monotonic() - started)
+    return image
+
+
+def _run_image_model_attempts(client, request, candidate_model, failures, call_timeout_sec=None):
+    attempts = _image_model_attempts(request, candidate_model, failures)
+    outcome = None
+    try:
+        while True:
+            active_model_id, prompt_text = attempts.send(outcome)
+            call_started = time.monotonic()
+            try:
+                with image_model_limiter.slot(active_model_id, request['deadline']):
+                    # Latency excludes the wait for a slot.
+                    call_started = time.monotonic()
+                    response = client.models.generate_content(
+                        **_image_content_kwargs(request, active_model_id, prompt_text, call_timeout_sec)
+                    )
+                outcome = _parse_image_response(response)
+            except Exception as candidate_err:
+                genai_client_pool.report_error(client, candidate_err)
+                outcome = candidate_err
+            _record_image_call(request, active_model_id, outcome, time.monotonic() - call_started)
+    except StopIteration as finished:
+        return finished.value
+
+
+_hedge_executor = None
+_hedge_workers = 0
+_hedges_in_flight = 0
+_hedge_executor_lock = threading.Lock()
+
+
+def _submit_hedge(func, *args):
+    """
+    Runs a hedge on the bounded hedge pool, or returns None when every worker is busy:
+    a queued hedge could only add latency, so the request keeps waiting on its own calls.
+    """
+    global _hedge_executor, _hedge_workers, _hedges_in_flight
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_workers = max(1, int(os.environ.get('IMAGE_HEDGE_WORKERS', '16')))
+            _hedge_executor = ThreadPoolExecutor(max_workers=_hedge_workers, thread_name_prefix='image-hedge')
+        if _hedges_in_flight >= _hedge_workers:
+            return None
+        _hedges_in_flight += 1
+
+    def _run():
+        global _hedges_in_flight
+        try:
+            return func(*args)
+        finally:
+            with _hedge_executor_lock:
+                _hedges_in_flight -= 1
+
+    return _hedge_executor.submit(_run)
+
+
+def _start_image_candidate(func, *args):
+    """
+    Runs a non-hedge candidate (the primary, or a fallback once everything before it failed)
+    on its own thread. It never waits behind hedges or abandoned losers for a pool worker.
+    It doesn't run on the request thread itself because that thread has to be free to
+    return a hedge's image while this call is still in flight.
+    """
+    future = Future()
+
+    def _run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_run, name='image-candidate', daemon=True).start()
+    return future
+
+
+def _hedge_call_timeout():
+    # Hedge calls get a short cap so a losing hedge releases its pool worker quickly.
+    return float(os.environ.get('IMAGE_HEDGE_CALL_TIMEOUT_SEC', '60'))
+
+
+def _generate_image_hedged(client, request):
+    """
+    Starts the first candidate and, each time the newest candidate outlives its hedge
+    delay or a candidate fails, starts the next one alongside. The first image wins.
+    Hedges run on the bounded hedge pool, with calls capped at IMAGE_HEDGE_CALL_TIMEOUT_SEC,
+    and are skipped while the pool is full. Synchronous calls cannot be aborted, so losing
+    calls finish in the background. Once the request is settled they make no further
+    calls, and their results are dropped.
+    """
+    candidates = request['model_candidates']
+    failures = _new_image_failures()
+    pending = {}
+    launched = 0
+
+    try:
+        while True:
+            if launched < len(candidates):
+                if pending:
+                    future = _submit_hedge(
+                        _run_image_model_attempts, client, request, candidates[launched], failures, _hedge_call_timeout()
+                    )
+                else:
+                    future = _start_image_candidate(_run_image_model_attempts, client, request, candidates[launched], failures)
+                if future is None:
+                    bump_hedge_stat('hedges_skipped')
+                else:
+                    pending[future] = (launched, _note_image_launch(pending))
+                    launched += 1
+            if not pending:
+                raise _image_failure(request, failures)
+            timeout = request['deadline'].remaining()
+            if launched < len(candidates):
+                timeout = min(timeout, hedge_delay(candidates[launched - 1]))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                request['deadline'].check("an image model answered")
+            for future in done:
+                index, hedge = pending.pop(future)
+                image = future.result()
+                if image:
+                    _note_image_win(index, hedge)
+                    return image
+    finally:
+        request['settled'] = True
+        for loser in pending:
+            loser.cancel()
+
+
+def _note_image_launch(pending):
+    # A candidate started while an earlier one is still running is a hedge; otherwise a plain fallback.
+    hedge = bool(pending)
+    if hedge:
+        bump_hedge_stat('hedges_fired')
+    return hedge
+
+
+def _note_image_win(index, hedge):
+    if index == 0:
+        bump_hedge_stat('primary_wins')
+    elif hedge:
+        bump_hedge_stat('hedge_wins')
+    else:
+        bump_hedge_stat('fallback_wins')
+
+
+def _store_veo_video(client, video_obj, dest_path, timeout_sec=None):
+    """
+    Writes a finished Veo video to dest_path exactly once and returns the byte count.
+    Remote videos are streamed from their download URI in chunks; inline bytes are written as-is.
+    """
+    if not getattr(video_obj, 'video_bytes', None) and getattr(video_obj, 'uri', None):
+        try:
+            download_kwargs = {'timeout': timeout_sec} if timeout_sec else {}
+            return media_http_client.download(
+                video_obj.uri,
+                dest_path,
+                headers={'x-goog-api-key': os.environ.get("GEMINI_API_KEY", "")},
+                **download_kwargs
+            )
+        except Exception as e:
+            print(f"Streaming Veo download failed, falling back to SDK download: {e}")
+            client.files.download(file=video_obj)
+
+    video_bytes = getattr(video_obj, 'video_bytes', None)
+    if not video_bytes:
+        return 0
+    with open(dest_path, 'wb') as f:
+        f.write(video_bytes)
+    return len(video_bytes)
+
+
+def _prepare_veo_request(prompt, config, reference_images=None):
+    """
+    Validates a Veo request and builds its attempt plan: (model, prompt, use_reference,
+    prompt_variant) tuples tried in order. Shared by the sync and async video paths.
+    """
     reference_images = reference_images or []
 
     requested_model_id = config.get('modelId') if isinstance(config, dict) else None
@@ -560,144 +871,239 @@ def generate_video_with_veo(prompt, config, reference_images=None):
         durationSeconds=duration_seconds
     )
 
-    def _extract_operation_error(op):
-        op_error = getattr(op, 'error', None)
-        if op_error:
-            return str(op_error)
-        response = getattr(op, 'response', None)
-        if response is not None:
-            blocked = getattr(response, 'rai_media_filtered_count', None)
-            if blocked:
-                return f"filtered by safety policy (count={blocked})"
-        return ""
+    model_candidates = [model_id]
+    for candidate in ['veo-3.1-fast-generate-preview', 'veo-3.1-generate-preview']:
+        if candidate not in model_candidates:
+            model_candidates.append(candidate)
+
+    # Without a usable reference image the "with reference" attempts would repeat the plain ones.
+    has_ref = processed_ref is not None
+    attempt_plan = []
+    for m in model_candidates:
+        for text, use_ref in ((primary_prompt, has_ref), (fallback_prompt, has_ref), (fallback_prompt, False)):
+            variant = VEO_PRIMARY if text == primary_prompt else VEO_COMPRESSED
+            if not any(a[0] == m and a[2] == use_ref and a[3] == variant for a in attempt_plan):
+                attempt_plan.append((m, text, use_ref, variant))
+    attempt_plan, skipped = plan_veo_attempts(attempt_plan, model_id)
+
+    return {
+        'attempt_plan': attempt_plan,
+        'skipped': skipped,
+        'outcomes': [],
+        'generate_config': generate_config,
+        'processed_ref': processed_ref,
+    }
 
-    def _run_attempt(active_model_id, prompt_text, include_reference):
-        source_kwargs = {'prompt': prompt_text}
-        if include_reference and processed_ref:
-            source_kwargs['image'] = types.Image(imageBytes=processed_ref[0], mimeType=processed_ref[1])
-        source = types.GenerateVideosSource(**source_kwargs)
-        operation = client.models.generate_videos(
-            model=active_model_id,
-            source=source,
-            config=generate_config
-        )
-        timeout_sec = int(os.environ.get('VIDEO_GENERATION_TIMEOUT_SEC', '900'))
-        poll_interval_sec = int(os.environ.get('VIDEO_GENERATION_POLL_INTERVAL_SEC', '8'))
-        started_at = time.time()
 
-        while not operation.done:
-            if time.time() - started_at > timeout_sec:
-                raise ValueError("Video generation timed out. Please try again.")
-            time.sleep(poll_interval_sec)
-            operation = client.operations.get(operation)
+def _veo_generate_kwargs(request, active_model_id, prompt_text, include_reference):
+    processed_ref = request['processed_ref']
+    source_kwargs = {'prompt': prompt_text}
+    if include_reference and processed_ref:
+        source_kwargs['image'] = types.Image(imageBytes=processed_ref[0], mimeType=processed_ref[1])
+    return {
+        'model': active_model_id,
+        'source': types.GenerateVideosSource(**source_kwargs),
+        'config': request['generate_config'].model_copy(update={
+            'http_options': types.HttpOptions(timeout=request['deadline'].timeout_ms())
+        })
+    }
 
-        op_error = _extract_operation_error(operation)
-        if op_error:
-            return None, op_error
 
-        response = getattr(operation, 'response', None)
-        if not response or not getattr(response, 'generated_videos', None):
-            return None, "operation finished but generated_videos was empty"
+def _veo_poll_timeout(request):
+    # Each attempt may poll for VIDEO_GENERATION_TIMEOUT_SEC, but never past the request deadline.
+    return request['deadline'].timeout(cap=int(os.environ.get('VIDEO_GENERATION_TIMEOUT_SEC', '900')))
 
-        generated = response.generated_videos[0]
-        video_obj = getattr(generated, 'video', None)
-        if not video_obj:
-            return None, "generated video object missing"
 
-        try:
-            client.files.download(file=video_obj)
-        except Exception:
-            # Some SDK/runtime combinations still allow .save without explicit download.
-            pass
+def _video_download_timeout(deadline):
+    # A finished video is still fetched shortly after the deadline rather than thrown away.
+    return deadline.timeout(minimum=float(os.environ.get('VIDEO_DOWNLOAD_GRACE_SEC', '60')))
 
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp:
-            tmp_path = tmp.name
 
-        try:
-            video_obj.save(tmp_path)
-            with open(tmp_path, 'rb') as f:
-                video_bytes = f.read()
-        finally:
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+def _veo_operation_error(op):
+    op_error = getattr(op, 'error', None)
+    if op_error:
+        return str(op_error)
+    response = getattr(op, 'response', None)
+    if response is not None:
+        blocked = getattr(response, 'rai_media_filtered_count', None)
+        if blocked:
+            return f"filtered by safety policy (count={blocked})"
+    return ""
 
-        if not video_bytes:
-            return None, "generated video bytes are empty"
 
-        mime_type = getattr(video_obj, 'mimeType', None) or getattr(video_obj, 'mime_type', None) or 'video/mp4'
-        return (video_bytes, mime_type), ""
+def _save_veo_operation(client, operation, deadline=None):
+    """
+    Stores the video of a finished Veo operation. Returns ((video_path, mime_type), "")
+    or (None, reason).
+    """
+    op_error = _veo_operation_error(operation)
+    if op_error:
+        return None, op_error
+
+    response = getattr(operation, 'response', None)
+    if not response or not getattr(response, 'generated_videos', None):
+        return None, "operation finished but generated_videos was empty"
+
+    generated = response.generated_videos[0]
+    video_obj = getattr(generated, 'video', None)
+    if not video_obj:
+        return None, "generated video object missing"
 
+    mime_type = getattr(video_obj, 'mimeType', None) or getattr(video_obj, 'mime_type', None) or 'video/mp4'
+    video_path = new_generated_video_path(video_extension(mime_type))
     try:
-        model_candidates = [model_id]
-        for candidate in ['veo-3.1-fast-generate-preview', 'veo-3.1-generate-preview']:
-            if candidate not in model_candidates:
-                model_candidates.append(candidate)
-
-        attempt_plan = []
-        for m in model_candidates:
-            attempt_plan.append((m, primary_prompt, True))
-            if fallback_prompt != primary_prompt:
-                attempt_plan.append((m, fallback_prompt, True))
-            attempt_plan.append((m, fallback_prompt, False))
-
-        reasons = []
-        for active_model, attempt_prompt, use_ref in attempt_plan:
-            try:
-                result, reason = _run_attempt(active_model, attempt_prompt, use_ref)
-                if result:
-                    video_bytes, mime_type = result
-                    return video_bytes, mime_type, active_model
-                reasons.append(f"{active_model} ref={use_ref}: {reason}")
-            except Exception as attempt_error:
-                reasons.append(f"{active_model} ref={use_ref}: {attempt_error}")
-                continue
+        written = _store_veo_video(client, video_obj, video_path, _video_download_timeout(deadline) if deadline else None)
+    except Exception:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        raise
 
-        reasons_text = "; ".join(reasons[:4])
-        raise ValueError(
-            "Video generation finished but no video was returned. "
-            f"Tried {len(attempt_plan)} attempts. Details: {reasons_text}"
+    if not written:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        return None, "generated video bytes are empty"
+
+    return (video_path, mime_type), ""
+
+
+def _veo_attempts(request):
+    """
+    Runs the learned attempt plan as a generator shared by the sync and async paths:
+    yields (model_id, prompt_text, include_reference) and receives the
+    _save_veo_operation result or the exception the attempt raised. Returns
+    (video_path, mime_type, model_id) or raises the no-video error.
+
+    A failure also prunes the rest of this plan: a model that is not available drops its
+    remaining attempts, a rejected reference image drops that model's reference attempts,
+    and a safety block drops other attempts with the same prompt and reference.
+    Outcomes are collected in request['outcomes'] for record_veo_attempts. No attempt
+    starts once the request deadline has passed.
+    """
+    reasons = []
+    pruned = []
+    for active_model, attempt_prompt, use_ref, variant in request['attempt_plan']:
+        prune_reason = next((why for matches, why in pruned if matches(active_model, attempt_prompt, use_ref)), None)
+        if prune_reason:
+            reasons.append(f"{active_model} ref={use_ref}: skipped ({prune_reason})")
+            continue
+        if request['deadline'].expired():
+            raise DeadlineExceeded(
+                f"Video request deadline of {int(request['deadline'].budget_sec)}s exceeded after "
+                f"{len(request['outcomes'])} attempts. Details: {'; '.join(reasons[:4])}"
+            )
+
+        started = time.monotonic()
+        outcome = yield active_model, attempt_prompt, use_ref
+        record = {
+            'model_id': active_model,
+            'with_reference': use_ref,
+            'prompt_variant': variant,
+            'seconds': time.monotonic() - started,
+        }
+        if not isinstance(outcome, Exception):
+            result, reason = outcome
+            if result:
+                request['outcomes'].append(dict(record, success=True))
+                video_path, mime_type = result
+                return video_path, mime_type, active_model
+        else:
+            reason = str(outcome)
+        reasons.append(f"{active_model} ref={use_ref}: {reason}")
+        if request['deadline'].expired():
+            # Cut short by the deadline: says nothing about this combination.
+            continue
+        category = classify_veo_failure(reason)
+        request['outcomes'].append(dict(record, category=category, reason=reason))
+
+        if category == VEO_MODEL_UNSUPPORTED:
+            pruned.append((lambda m, p, r, failed=active_model: m == failed, f"{active_model} unavailable"))
+        elif category == VEO_REFERENCE_UNSUPPORTED:
+            pruned.append((lambda m, p, r, failed=active_model: m == failed and r, f"{active_model} rejects reference images"))
+        elif category == VEO_SAFETY:
+            pruned.append((
+                lambda m, p, r, text=attempt_prompt, ref=use_ref: p == text and r == ref,
+                "same prompt was safety filtered"
+            ))
+
+    raise _veo_no_video_error(request, reasons)
+
+
+def _veo_no_video_error(request, reasons):
+    reasons = reasons + request['skipped']
+    reasons_text = "; ".join(reasons[:4])
+    return ValueError(
+        "Video generation finished but no video was returned. "
+        f"Tried {len(request['outcomes'])} attempts. Details: {reasons_text}"
+    )
+
+
+def generate_video_with_veo(prompt, config, reference_images=None, deadline=None):
+    """
+    Generates a video using Veo models and returns (video_path, mime_type, used_model_id).
+    The video is written once, directly under MEDIA_ROOT/generated_videos/.
+    All attempts share `deadline` (default VIDEO_REQUEST_DEADLINE_SEC).
+    """
+    deadline = deadline or request_deadline('video')
+    client = get_ai_client()
+    request = _prepare_veo_request(prompt, config, reference_images)
+    request['deadline'] = deadline
+
+    def _run_attempt(active_model_id, prompt_text, include_reference):
+        operation = client.models.generate_videos(
+            **_veo_generate_kwargs(request, active_model_id, prompt_text, include_reference)
         )
 
+        if not operation.done:
+            def _check_operation():
+                nonlocal operation
+                operation = client.operations.get(operation)
+                return operation if operation.done else None
+
+            # The poller only notices expiry on its next check, so the wait is bounded too.
+            poll_timeout = _veo_poll_timeout(request)
+            # The shared poller checks all in-flight operations; this thread only waits.
+            get_poller().track(
+                'veo',
+                getattr(operation, 'name', None) or active_model_id,
+                _check_operation,
+                timeout_sec=poll_timeout
+            ).wait(poll_timeout)
+
+        return _save_veo_operation(client, operation, deadline)
+
+    try:
+        attempts = _veo_attempts(request)
+        outcome = None
+        while True:
+            active_model, attempt_prompt, use_ref = attempts.send(outcome)
+            try:
+                outcome = _run_attempt(active_model, attempt_prompt, use_ref)
+            except Exception as attempt_error:
+                genai_client_pool.report_error(client, attempt_error)
+                outcome = attempt_error
+    except StopIteration as finished:
+        return finished.value
     except Exception as video_error:
         print(f"VIDEO GENERATION FAILED: {video_error}")
         raise video_error
+    finally:
+        record_veo_attempts(request['outcomes'])
 
 
 
 
 def get_kling_jwt_token():
-    import jwt
-    import time
-    
-    ak = os.environ.get('KLING_ACCESS_KEY')
-    sk = os.environ.get('KLING_SECRET_KEY')
-    
-    if not ak or not sk:
-        raise ValueError("Missing KLING_ACCESS_KEY or KLING_SECRET_KEY in environment.")
-        
-    headers = {
-        "alg": "HS256",
-        "typ": "JWT"
-    }
-    payload = {
-        "iss": ak,
-        "exp": int(time.time()) + 1800, # valid for 30 minutes
-        "nbf": int(time.time()) - 5
-    }
-    
-    token = jwt.encode(payload, sk, headers=headers)
-    return token
-
+    # Tokens are valid for 30 minutes; the shared cache re-signs shortly before expiry.
+    return kling_token_cache.get()
 
-def generate_video_with_kling(prompt, config, reference_images=None):
-    import json
-    import time
-    import urllib.request
-    import urllib.error
-    import requests # Required for easier multi-part and JSON operations
 
+def generate_video_with_kling(prompt, config, reference_images=None, deadline=None):
+    """
+    Generates a video with Kling and streams it straight into MEDIA_ROOT/generated_videos/.
+    Returns (video_path, mime_type, used_model_id). Submit, polling and download share
+    `deadline` (default VIDEO_REQUEST_DEADLINE_SEC).
+    """
+    deadline = deadline or request_deadline('video')
     reference_images = reference_images or []
 
     if not prompt or not isinstance(prompt, str):
@@ -720,7 +1126,6 @@ def generate_video_with_kling(prompt, config, reference_images=None):
 
     # 3. Check for I2V vs T2V
     base_endpoint = "text2video"
-    api_url = f"https://api.klingai.com/v1/videos/{base_endpoint}"
     
     model_id = config.get('modelId', 'kling-v2-6') if isinstance(config, dict) else 'kling-v2-6'
     # Fallback if old 'kling-ai' string somehow comes through
@@ -761,11 +1166,11 @@ def generate_video_with_kling(prompt, config, reference_images=None):
             b64_data = base64.b64encode(img_bytes).decode('utf-8')
             
             base_endpoint = "image2video"
-            api_url = f"https://api.klingai.com/v1/videos/{base_endpoint}"
             payload["image"] = b64_data
 
     # 4. Submit Task
-    response = requests.post(api_url, headers=headers, json=payload)
+    deadline.check("submitting to Kling AI")
+    response = kling_client.request('POST', f"videos/{base_endpoint}", headers=headers, json=payload, deadline=deadline)
     if response.status_code != 200:
         raise ValueError(f"Kling AI Task Submit Failed ({response.status_code}): {response.text}")
     
@@ -777,66 +1182,62 @@ def generate_video_with_kling(prompt, config, reference_images=None):
     if not task_id:
         raise ValueError("Kling AI did not return a task_id.")
 
-    # 5. Poll Task Status
-    poll_url = f"https://api.klingai.com/v1/videos/{base_endpoint}/{task_id}"
-    timeout_sec = 1200 # 20 minutes max
-    poll_interval_sec = 10
-    started_at = time.time()
+    # 5. Poll Task Status (via the shared poller)
+    poll_url = f"videos/{base_endpoint}/{task_id}"
+    timeout_sec = deadline.timeout(cap=1200) # 20 minutes max
 
-    video_url = None
-    while time.time() - started_at < timeout_sec:
-        # Re-generate token to ensure it doesn't expire during long polling
+    def _check_task():
+        # Cached token; refreshed by the cache before it expires during long polling
         poll_headers = {
             "Authorization": f"Bearer {get_kling_jwt_token()}"
         }
-        poll_resp = requests.get(poll_url, headers=poll_headers)
-        if poll_resp.status_code == 200:
-            p_data = poll_resp.json()
-            if p_data.get('code') == 0:
-                status = p_data.get('data', {}).get('task_status')
-                if status == 'succeed':
-                    video_results = p_data.get('data', {}).get('task_result', {}).get('videos', [])
-                    if video_results:
-                        video_url = video_results[0].get('url')
-                    break
-                elif status == 'failed':
-                    err_msg = p_data.get('data', {}).get('task_status_msg', 'Unknown Error')
-                    raise ValueError(f"Kling AI Video Generation Failed: {err_msg}")
-            else:
-                print(f"Kling API Polling Error Data: {p_data}")
-        else:
-            print(f"Kling API Polling HTTP Error {poll_resp.status_code}: {poll_resp.text}")
-            
-        time.sleep(poll_interval_sec)
+        # No in-request retries here: the poller applies its own error backoff.
+        poll_resp = kling_client.request('GET', poll_url, retries=0, headers=poll_headers)
+        if poll_resp.status_code != 200:
+            raise TransientPollError(f"Kling API Polling HTTP Error {poll_resp.status_code}: {poll_resp.text}")
+        p_data = poll_resp.json()
+        if p_data.get('code') != 0:
+            raise TransientPollError(f"Kling API Polling Error Data: {p_data}")
+        status = p_data.get('data', {}).get('task_status')
+        if status == 'succeed':
+            video_results = p_data.get('data', {}).get('task_result', {}).get('videos', [])
+            return {'url': video_results[0].get('url') if video_results else None}
+        if status == 'failed':
+            err_msg = p_data.get('data', {}).get('task_status_msg', 'Unknown Error')
+            raise ValueError(f"Kling AI Video Generation Failed: {err_msg}")
+        return None
+
+    try:
+        task_result = get_poller().track('kling', task_id, _check_task, timeout_sec=timeout_sec).wait(timeout_sec)
+    except PollTimeoutError:
+        task_result = None
+    video_url = task_result.get('url') if task_result else None
 
     if not video_url:
+        deadline.check("Kling AI returned a video")
         raise ValueError("Kling AI Video generation timed out or returned no URL.")
 
-    # 6. Download Video
-    vid_resp = requests.get(video_url)
-    if vid_resp.status_code != 200:
-        raise ValueError("Failed to download generated video from Kling AI.")
-
-    video_bytes = vid_resp.content
-    mime_type = "video/mp4"
+    # 6. Stream the video to its final location in chunks
+    video_path = new_generated_video_path('mp4')
+    try:
+        kling_client.download(video_url, video_path, timeout=_video_download_timeout(deadline))
+    except Exception as e:
+        raise ValueError(f"Failed to download generated video from Kling AI: {e}")
 
-    return video_bytes, mime_type, "kling-ai"
+    return video_path, "video/mp4", "kling-ai"
 
-def generate_midjourney_prompt(data):
+def _prepare_prompt_request(data):
     """
-    Executes a custom prompt generation task based on user-provided instructions (Execution Prompt)
-    and reference data (Knowledge & Brief).
+    Builds the prompt-agent request (instructions, model chain, processed references) and
+    looks it up in the prompt cache. Shared by the sync and async prompt paths.
     """
-    client = get_ai_client()
-    
-    parts = []
-    
-    # 1. Attach Reference Images if any
+    # 1. Process Reference Images if any
     reference_images = data.get('referenceImages', [])
+    processed_refs = []
     for img_str in reference_images:
         processed_bytes, processed_mime = process_reference_image(img_str)
         if processed_bytes:
-            parts.append(types.Part.from_bytes(data=processed_bytes, mime_type=processed_mime))
+            processed_refs.append((processed_bytes, processed_mime))
             
     # 2. Extract Text Inputs
     execution_prompt = (data.get('executionPrompt') or '').strip()
@@ -875,49 +1276,130 @@ def generate_midjourney_prompt(data):
     {requested_output_count}
     """
     
+    # Prompt model fallback chain. Prefer gemini-2.5-flash for prompts.
+    default_prompt_model = "gemini-2.5-flash"
+    preferred_model = config.get('modelId') or os.environ.get("PROMPT_MODEL_ID", default_prompt_model)
+    candidate_models = []
+    for m in [preferred_model, os.environ.get("PROMPT_MODEL_ID"), "gemini-2.5-flash", "gemini-2.0-flash", "gemini-1.5-flash"]:
+        if m and m not in candidate_models:
+            candidate_models.append(m)
+    temperature = 0.2
+
+    cache_key = None
+    cached_text = None
+    if prompt_cache_enabled(data.get('cache')):
+        cache_key = prompt_cache_key(
+            candidate_models, system_instruction, user_message, temperature,
+            [reference_digest(ref_bytes) for ref_bytes, _ in processed_refs]
+        )
+        cached_text = get_cached_prompt(cache_key)
+
+    # Health ordering happens after the cache key so the key stays stable.
+    return {
+        'processed_refs': processed_refs,
+        'system_instruction': system_instruction,
+        'user_message': user_message,
+        'candidate_models': model_health.order('prompt', candidate_models) if cached_text is None else candidate_models,
+        'temperature': temperature,
+        'cache_key': cache_key,
+        'cached_text': cached_text,
+    }
+
+
+def _prompt_parts(client, request):
+    parts = [build_reference_part(client, ref_bytes, ref_mime) for ref_bytes, ref_mime in request['processed_refs']]
     # Text part must be appended as well
-    parts.append(types.Part.from_text(text=user_message))
+    parts.append(types.Part.from_text(text=request['user_message']))
+    return parts
+
+
+def _prompt_content_kwargs(request, model_id, parts):
+    return {
+        'model': model_id,
+        'contents': [types.Content(parts=parts)],
+        'config': types.GenerateContentConfig(
+            system_instruction=request['system_instruction'],
+            temperature=request['temperature']
+        )
+    }
+
+
+def _prompt_attempts(request):
+    """
+    Model fallback chain as a generator shared by the sync and async paths: yields model
+    ids and receives each response or the exception the call raised. Returns the text.
+    """
+    response = None
+    last_error = None
+    for model_id in request['candidate_models']:
+        outcome = yield model_id
+        if isinstance(outcome, Exception):
+            last_error = outcome
+            print(f"Prompt model failed ({model_id}): {outcome}")
+            continue
+        response = outcome
+        if response and getattr(response, "text", None):
+            break
+
+    if not response or not getattr(response, "text", None):
+        if last_error:
+            raise last_error
+        raise ValueError("Prompt generation failed: no response text from candidate models.")
+
+    generated_text = response.text.strip()
+    if request['cache_key']:
+        store_cached_prompt(request['cache_key'], generated_text)
+    return generated_text
+
+
+def _record_prompt_call(model_id, outcome, latency_sec):
+    if isinstance(outcome, Exception):
+        model_health.record_failure('prompt', model_id, classify_failure(outcome, model_id), outcome)
+    elif outcome and getattr(outcome, "text", None):
+        model_health.record_success('prompt', model_id, latency_sec)
+    else:
+        model_health.record_failure('prompt', model_id, TEXT_ONLY, 'empty response')
+
+
+PROMPT_ERROR_PREFIX = "Error generating prompt:"
+
+
+def _prompt_failure(e, raise_errors):
+    if raise_errors:
+        raise e
+    import traceback
+    traceback.print_exc()
+    print(f"Gemini Prompt Gen Error: {e}")
+    return f"{PROMPT_ERROR_PREFIX} {str(e)}"
+
+
+def generate_midjourney_prompt(data, raise_errors=False):
+    """
+    Executes a custom prompt generation task based on user-provided instructions (Execution Prompt)
+    and reference data (Knowledge & Brief).
+    Identical requests are answered from the prompt cache when it is enabled (see prompt_cache.py).
+    Failures come back as an "Error generating prompt" string unless raise_errors is set.
+    """
+    request = _prepare_prompt_request(data)
+    if request['cached_text'] is not None:
+        return request['cached_text']
+
+    client = get_ai_client()
+    parts = _prompt_parts(client, request)
     
     try:
-        # Prompt model fallback chain. Prefer gemini-2.5-flash for prompts.
-        default_prompt_model = "gemini-2.5-flash"
-        preferred_model = config.get('modelId') or os.environ.get("PROMPT_MODEL_ID", default_prompt_model)
-        candidate_models = []
-        for m in [preferred_model, os.environ.get("PROMPT_MODEL_ID"), "gemini-2.5-flash", "gemini-2.0-flash", "gemini-1.5-flash"]:
-            if m and m not in candidate_models:
-                candidate_models.append(m)
-
-        response = None
-        last_error = None
-        for model_id in candidate_models:
+        attempts = _prompt_attempts(request)
+        outcome = None
+        while True:
+            model_id = attempts.send(outcome)
+            call_started = time.monotonic()
             try:
-                temperature = 0.2
-                response = client.models.generate_content(
-                    model=model_id,
-                    contents=[types.Content(parts=parts)],
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_instruction,
-                        temperature=temperature
-                    )
-                )
-                if response and getattr(response, "text", None):
-                    break
+                outcome = client.models.generate_content(**_prompt_content_kwargs(request, model_id, parts))
             except Exception as e:
-                last_error = e
-                print(f"Prompt model failed ({model_id}): {e}")
-                continue
-
-        if not response or not getattr(response, "text", None):
-            if last_error:
-                raise last_error
-            raise ValueError("Prompt generation failed: no response text from candidate models.")
-
-        generated_text = response.text.strip()
-        
-        return generated_text
-
+                genai_client_pool.report_error(client, e)
+                outcome = e
+            _record_prompt_call(model_id, outcome, time.monotonic() - call_started)
+    except StopIteration as finished:
+        return finished.value
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Gemini Prompt Gen Error: {e}")
-        return f"Error generating prompt: {str(e)}"
+        return _prompt_failure(e, raise_errors)
@@ -203,6 +203,24 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     };
 
+    // Generated images arrive either as data URIs or as saved media files.
+    const isImageResultUrl = (url) => typeof url === 'string'
+        && (url.startsWith('data:image') || /\.(png|jpe?g|webp|gif|bmp)(\?|$)/i.test(url));
+
+    // Same-origin media files are sent by path and resolved server-side,
+    // instead of being downloaded and re-uploaded as base64.
+    const toServerMediaRef = (url) => {
+        if (typeof url !== 'string' || !url || url.startsWith('data:')) return null;
+        if (/^(img|src):\d+$/.test(url)) return url;
+        try {
+            const parsed = new URL(url, window.location.href);
+            if (parsed.origin !== window.location.origin) return null;
+            return parsed.pathname.startsWith('/media/') ? decodeURIComponent(parsed.pathname) : null;
+        } catch (e) {
+            return null;
+        }
+    };
+
     // --- Preset Logic ---
     const loadPresets = () => {
         try {
@@ -468,7 +486,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 <!-- Run Pipeline Button -->
                 <div class="absolute top-4 right-4 z-10">
-                    <button id="runWorkflowBtn" class="px-4 py-2 bg-gradient-to-r from-yellow-500 to-amber-600 border border-yellow-500/50 rounded-xl text-sm font-bold text-black hover:shadow-yellow-500/20 shadow-2xl flex items-center gap-2 transform hover:scale-105 transition-all">
+                    <button id="runWorkflowBtn" title="Unchanged nodes reuse their last result. Shift+click to regenerate everything." class="px-4 py-2 bg-gradient-to-r from-yellow-500 to-amber-600 border border-yellow-500/50 rounded-xl text-sm font-bold text-black hover:shadow-yellow-500/20 shadow-2xl flex items-center gap-2 transform hover:scale-105 transition-all">
                         <i data-lucide="play" class="w-5 h-5"></i> Run Pipeline
                     </button>
                 </div>
@@ -649,7 +667,9 @@ document.addEventListener('DOMContentLoaded', () => {
                         id: w.id,
                         name: w.name || 'Untitled Workflow',
                         updatedAt: w.updatedAt || new Date().toISOString(),
-                        graph: (w.graph && typeof w.graph === 'object') ? w.graph : getEmptyWorkflowGraph()
+                        version: w.version || null,
+                        // Graphs are fetched per workflow on load (see fetchWorkflowGraph).
+                        graph: (w.graph && typeof w.graph === 'object') ? w.graph : null
                     }));
 
                 const base = {
@@ -686,21 +706,101 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             };
 
-            const persistWorkflowStore = async (store) => {
+            // Last saved JSON of each Drawflow node, per workflow, used to send node-level deltas.
+            const workflowSavedNodes = new Map();
+            const workflowUrl = (workflowId) => `/api/workflow/workflows/${encodeURIComponent(workflowId)}`;
+
+            const snapshotWorkflowNodes = (workflow) => {
+                const nodes = workflow?.graph?.drawflow?.Home?.data;
+                if (!nodes || typeof nodes !== 'object') {
+                    workflowSavedNodes.delete(workflow.id);
+                    return;
+                }
+                const snapshot = {};
+                Object.keys(nodes).forEach((nodeId) => {
+                    snapshot[nodeId] = JSON.stringify(nodes[nodeId]);
+                });
+                workflowSavedNodes.set(workflow.id, snapshot);
+            };
+
+            const buildWorkflowNodeDelta = (workflow) => {
+                const saved = workflowSavedNodes.get(workflow.id);
+                const drawflow = workflow?.graph?.drawflow;
+                if (!saved || !drawflow || Object.keys(drawflow).some((module) => module !== 'Home')) return null;
+                const nodes = (drawflow.Home && drawflow.Home.data) || {};
+                const delta = {};
+                Object.keys(nodes).forEach((nodeId) => {
+                    if (saved[nodeId] !== JSON.stringify(nodes[nodeId])) delta[nodeId] = nodes[nodeId];
+                });
+                Object.keys(saved).forEach((nodeId) => {
+                    if (!(nodeId in nodes)) delta[nodeId] = null;
+                });
+                return delta;
+            };
+
+            const fetchWorkflowGraph = async (workflow) => {
+                const res = await fetch(workflowUrl(workflow.id), { cache: 'no-store' });
+                const payload = await res.json().catch(() => ({}));
+                if (!res.ok || !payload.workflow) {
+                    throw new Error(payload.error || `HTTP ${res.status}`);
+                }
+                workflow.name = payload.workflow.name || workflow.name;
+                workflow.version = payload.workflow.version;
+                workflow.updatedAt = payload.workflow.updatedAt || workflow.updatedAt;
+                workflow.graph = (payload.workflow.graph && typeof payload.workflow.graph === 'object')
+                    ? payload.workflow.graph
+                    : getEmptyWorkflowGraph();
+                snapshotWorkflowNodes(workflow);
+                return workflow;
+            };
+
+            // Saves one workflow. Known versions are sent as If-Match and, when possible,
+            // only the Drawflow nodes that changed since the last save are uploaded.
+            const persistWorkflow = async (workflow, options = {}) => {
+                const { activate = true, force = false } = options;
                 try {
                     lastWorkflowPersistError = '';
-                    const res = await fetch('/api/workflow/store', {
-                        method: 'POST',
+                    const headers = { 'Content-Type': 'application/json' };
+                    let method = 'PUT';
+                    let body = { name: workflow.name, graph: workflow.graph || getEmptyWorkflowGraph(), activate };
+                    if (workflow.version && !force) {
+                        headers['If-Match'] = `"v${workflow.version}"`;
+                        if (!workflow.graph) {
+                            method = 'PATCH';
+                            body = { name: workflow.name, activate };
+                        } else {
+                            const nodes = buildWorkflowNodeDelta(workflow);
+                            if (nodes) {
+                                method = 'PATCH';
+                                body = { name: workflow.name, nodes, activate };
+                            }
+                        }
+                    }
+                    const res = await fetch(workflowUrl(workflow.id), {
+                        method,
                         cache: 'no-store',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ store })
+                        headers,
+                        body: JSON.stringify(body)
                     });
+                    const payload = await res.json().catch(() => ({}));
+                    if (res.status === 412) {
+                        const overwrite = workflow.graph && confirm(
+                            `"${workflow.name}" was changed in another tab or window.\nOverwrite it with the version in this editor?`
+                        );
+                        if (overwrite) return persistWorkflow(workflow, { activate, force: true });
+                        lastWorkflowPersistError = 'Workflow was modified elsewhere. Load it again to get the latest version.';
+                        return false;
+                    }
                     if (!res.ok) {
-                        const errBody = await res.json().catch(() => ({}));
-                        lastWorkflowPersistError = errBody?.error || `HTTP ${res.status}`;
+                        lastWorkflowPersistError = payload?.error || `HTTP ${res.status}`;
                         console.error('Server workflow save failed:', lastWorkflowPersistError);
                         return false;
                     }
+                    if (payload.workflow) {
+                        workflow.version = payload.workflow.version;
+                        workflow.updatedAt = payload.workflow.updatedAt || workflow.updatedAt;
+                    }
+                    if (workflow.graph) snapshotWorkflowNodes(workflow);
                     return true;
                 } catch (err) {
                     lastWorkflowPersistError = err?.message || 'Network error';
@@ -709,6 +809,39 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             };
 
+            const deleteWorkflowOnServer = async (workflow) => {
+                try {
+                    lastWorkflowPersistError = '';
+                    const headers = workflow.version ? { 'If-Match': `"v${workflow.version}"` } : {};
+                    const res = await fetch(workflowUrl(workflow.id), { method: 'DELETE', cache: 'no-store', headers });
+                    if (!res.ok && res.status !== 404) {
+                        const errBody = await res.json().catch(() => ({}));
+                        lastWorkflowPersistError = res.status === 412
+                            ? 'Workflow was modified elsewhere. Load it again before deleting.'
+                            : (errBody?.error || `HTTP ${res.status}`);
+                        return false;
+                    }
+                    workflowSavedNodes.delete(workflow.id);
+                    return true;
+                } catch (err) {
+                    lastWorkflowPersistError = err?.message || 'Network error';
+                    return false;
+                }
+            };
+
+            const persistActiveWorkflowId = async (workflowId) => {
+                try {
+                    await fetch('/api/workflow/store', {
+                        method: 'PATCH',
+                        cache: 'no-store',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ activeId: workflowId || null })
+                    });
+                } catch (err) {
+                    console.warn('Failed to persist active workflow:', err);
+                }
+            };
+
             const renderWorkflowOptions = (store) => {
                 workflowSelect.innerHTML = '';
                 if (!store.workflows || store.workflows.length === 0) {
@@ -860,6 +993,7 @@ document.addEventListener('DOMContentLoaded', () => {
                             }
                         }
                         if (statusEl) statusEl.textContent = data.statusText || 'Waiting...';
+                        dom.dataset.resultSignature = data.resultSignature || '';
                         setGeneratorView(dom, data.generatorView || 'prompt');
                         refreshGeneratorAttachmentBar(dom);
                         if (data.nodeWidth || data.nodeHeight) applyNodeSize(dom, data.nodeWidth, data.nodeHeight);
@@ -946,6 +1080,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         data.generatedVideoUrl = '';
                         data.generatedTextResult = '';
                         data.resultType = '';
+                        data.resultSignature = dom.dataset.resultSignature || '';
                         if (resultContainer && !resultContainer.classList.contains('hidden')) {
                             const videoEl = resultContainer.querySelector('video');
                             const videoSrc = videoEl ? (videoEl.getAttribute('src') || '') : '';
@@ -1009,6 +1144,15 @@ document.addEventListener('DOMContentLoaded', () => {
             const loadWorkflowToEditor = async (store, workflowId) => {
                 const workflow = store.workflows.find(w => w.id === workflowId);
                 if (!workflow) return;
+                if (!workflow.graph) {
+                    try {
+                        await fetchWorkflowGraph(workflow);
+                    } catch (err) {
+                        console.error('Failed to fetch workflow graph:', err);
+                        alert(`Failed to load workflow from server.\nReason: ${err?.message || err}`);
+                        return;
+                    }
+                }
 
                 const normalizeGraph = (graph) => {
                     if (!graph || typeof graph !== 'object') return getEmptyWorkflowGraph();
@@ -1061,7 +1205,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     console.error('Failed to load workflow. Resetting graph:', err);
                     try {
                         workflow.graph = getEmptyWorkflowGraph();
-                        await persistWorkflowStore(store);
+                        await persistWorkflow(workflow);
                         window.editor.import(workflow.graph);
                         decorateAllPorts();
                         applyNoDragGuards(container);
@@ -1088,7 +1232,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 target.graph = graph;
                 target.updatedAt = new Date().toISOString();
                 store.updatedAt = target.updatedAt;
-                const saved = await persistWorkflowStore(store);
+                const saved = await persistWorkflow(target);
                 if (!saved) {
                     const detail = lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : '';
                     alert('Failed to save workflow to server.' + detail);
@@ -1113,7 +1257,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const created = createWorkflowEntry((name || suggested).trim(), graph);
                 workflowStore.workflows.push(created);
                 workflowStore.activeId = created.id;
-                const saved = await persistWorkflowStore(workflowStore);
+                const saved = await persistWorkflow(created);
                 if (!saved) {
                     const detail = lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : '';
                     alert('Failed to create workflow on server.' + detail);
@@ -1194,7 +1338,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     const created = createWorkflowEntry((name || suggested).trim(), getEmptyWorkflowGraph());
                     workflowStore.workflows.push(created);
                     workflowStore.activeId = created.id;
-                    const saved = await persistWorkflowStore(workflowStore);
+                    const saved = await persistWorkflow(created);
                     if (!saved) {
                         const detail = lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : '';
                         alert('Failed to create workflow on server.' + detail);
@@ -1257,7 +1401,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     const created = createWorkflowEntry((name || suggested).trim(), getEmptyWorkflowGraph());
                     workflowStore.workflows.push(created);
                     workflowStore.activeId = created.id;
-                    const saved = await persistWorkflowStore(workflowStore);
+                    const saved = await persistWorkflow(created);
                     if (!saved) {
                         const detail = lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : '';
                         alert('Failed to create workflow on server.' + detail);
@@ -1290,7 +1434,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     const created = createWorkflowEntry((name || suggested).trim(), copiedGraph);
                     workflowStore.workflows.push(created);
                     workflowStore.activeId = created.id;
-                    await persistWorkflowStore(workflowStore);
+                    await persistWorkflow(created);
                     renderWorkflowOptions(workflowStore);
                     await loadWorkflowToEditor(workflowStore, workflowStore.activeId);
                     alert(`Saved as: ${created.name}`);
@@ -1325,7 +1469,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     workflowStore.updatedAt = target.updatedAt;
                     workflowStore.activeId = target.id;
 
-                    const saved = await persistWorkflowStore(workflowStore);
+                    const saved = await persistWorkflow(target);
                     if (!saved) {
                         const detail = lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : '';
                         alert('Failed to rename workflow on server.' + detail);
@@ -1353,9 +1497,14 @@ document.addEventListener('DOMContentLoaded', () => {
                     const ok = confirm(`Delete workflow "${target.name}"?`);
                     if (!ok) return;
 
+                    const deleted = await deleteWorkflowOnServer(target);
+                    if (!deleted) {
+                        alert('Failed to delete workflow on server.' + (lastWorkflowPersistError ? `\nReason: ${lastWorkflowPersistError}` : ''));
+                        return;
+                    }
                     workflowStore.workflows = workflowStore.workflows.filter(w => w.id !== target.id);
                     workflowStore.activeId = workflowStore.workflows[0].id;
-                    await persistWorkflowStore(workflowStore);
+                    await persistActiveWorkflowId(workflowStore.activeId);
                     renderWorkflowOptions(workflowStore);
                     await loadWorkflowToEditor(workflowStore, workflowStore.activeId);
                 };
@@ -1845,6 +1994,81 @@ document.addEventListener('DOMContentLoaded', () => {
                 return lines.map((line) => (line.startsWith('- ') ? line : `- ${line}`)).join('\n');
             }
 
+            // Submits a video job and polls until it finishes, so no request stays open
+            // for the whole generation run.
+            async function runVideoJob(reqBody, onStatus) {
+                const submitRes = await fetch('/api/generate-video/jobs', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(reqBody)
+                });
+                const submitted = await submitRes.json();
+                if (!submitRes.ok || !submitted.jobId) {
+                    throw new Error(submitted.error || `Video generation failed (${submitRes.status})`);
+                }
+
+                const pollIntervalMs = 3000;
+                while (true) {
+                    await new Promise((resolve) => setTimeout(resolve, pollIntervalMs));
+                    const statusRes = await fetch(`/api/generate-video/jobs/${submitted.jobId}`, { cache: 'no-store' });
+                    const job = await statusRes.json();
+                    if (!statusRes.ok) {
+                        throw new Error(job.error || `Video job status failed (${statusRes.status})`);
+                    }
+                    if (typeof onStatus === 'function') onStatus(job);
+                    if (job.status === 'succeeded') return job;
+                    if (job.status === 'failed') {
+                        throw new Error(job.error || 'Video generation failed');
+                    }
+                }
+            }
+
+            // Generates several images in one request; the server runs them concurrently and
+            // streams one NDJSON event per finished image. Returns URLs in request order.
+            async function runImageBatch(items, defaults, onProgress) {
+                const res = await fetch('/api/generate/batch', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ items, ...defaults })
+                });
+                if (!res.ok || !res.body) {
+                    const data = await res.json().catch(() => ({}));
+                    throw new Error(data.error || `Image generation failed (${res.status})`);
+                }
+
+                const urls = new Array(items.length).fill(null);
+                const errors = [];
+                const handleEvent = (event) => {
+                    if (event.event === 'result') {
+                        urls[event.index] = event.url;
+                    } else if (event.event === 'error') {
+                        errors.push(event.error);
+                    }
+                    if (typeof onProgress === 'function' && event.total) onProgress(event);
+                };
+
+                const reader = res.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    let newline;
+                    while ((newline = buffer.indexOf('\n')) >= 0) {
+                        const line = buffer.slice(0, newline).trim();
+                        buffer = buffer.slice(newline + 1);
+                        if (line) handleEvent(JSON.parse(line));
+                    }
+                    if (done) break;
+                }
+                if (buffer.trim()) handleEvent(JSON.parse(buffer));
+
+                if (errors.length > 0) {
+                    throw new Error(errors[0]);
+                }
+                return urls.filter(Boolean);
+            }
+
             function splitVideoScenarios(rawText) {
                 const text = String(rawText || '').trim();
                 if (!text) return [];
@@ -2975,7 +3199,42 @@ document.addEventListener('DOMContentLoaded', () => {
                 return null;
             };
 
-            const runWorkflowPipeline = async (targetNodeId = null) => {
+            // Node data that determines a node's output (mirrors NODE_SIGNATURE_FIELDS in workflow_engine.py).
+            const NODE_SIGNATURE_FIELDS = [
+                'generatorKind', 'outputType', 'modelId', 'agentPrompt', 'agentOutputFormat', 'textPrompt',
+                'count', 'style', 'aspectRatio', 'resolution', 'durationSeconds', 'klingMode', 'cameraMovement',
+                'localReferenceImage', 'text', 'imageBase64', 'videoUrl'
+            ];
+
+            // 53-bit string hash run with two seeds; crypto.subtle is unavailable on plain-http LAN hosts.
+            const hashString = (str) => {
+                const hashWithSeed = (seed) => {
+                    let h1 = 0xdeadbeef ^ seed;
+                    let h2 = 0x41c6ce57 ^ seed;
+                    for (let i = 0; i < str.length; i++) {
+                        const ch = str.charCodeAt(i);
+                        h1 = Math.imul(h1 ^ ch, 2654435761);
+                        h2 = Math.imul(h2 ^ ch, 1597334677);
+                    }
+                    h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+                    h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+                    return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(16).padStart(14, '0');
+                };
+                return hashWithSeed(0) + hashWithSeed(0x9e3779b9);
+            };
+
+            // Hash of a node's type, output-relevant config and its inputs' [displayName, resultHash] pairs.
+            // Inputs are hashed by value, so regenerating an upstream node invalidates everything below it.
+            const computeNodeSignature = (node, inputs) => {
+                const data = (node && node.data && typeof node.data === 'object') ? node.data : {};
+                const config = NODE_SIGNATURE_FIELDS
+                    .filter((field) => data[field] !== undefined && data[field] !== null && data[field] !== '')
+                    .map((field) => [field, data[field]]);
+                return hashString(JSON.stringify([node?.name || '', config, inputs]));
+            };
+
+            const runWorkflowPipeline = async (targetNodeId = null, options = {}) => {
+                const forceRerun = Boolean(options.force);
                 await saveActiveWorkflow(workflowStore, false);
                 // Use captured UI state for execution so node-run cache decisions
                 // reflect the latest in-node edits before running.
@@ -3016,10 +3275,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 };
 
                 clearCacheBadges();
-                if (targetNodeId) {
+                if (targetNodeId && !forceRerun) {
+                    // Results saved before signatures existed are reused as-is; signed results
+                    // are checked against their current inputs when the node becomes ready.
                     executionScope.forEach((id) => {
                         const strId = String(id);
                         if (strId === String(targetNodeId)) return;
+                        if (nodes[strId]?.data?.resultSignature) return;
                         const cached = getReusableNodeResult(nodes[strId]);
                         if (cached !== null && cached !== undefined && cached !== '') {
                             nodeResults[strId] = cached;
@@ -3052,6 +3314,7 @@ document.addEventListener('DOMContentLoaded', () => {
                             let canRun = true;
                             let referenceImages = [];
                             let mentionValues = {};
+                            const signatureInputs = [];
 
                             // Dependency Resolution
                             for (let inputKey in node.inputs) {
@@ -3069,6 +3332,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                         if (sourceNode) {
                                             const name = getNodeDisplayName(sourceNodeId, sourceNode);
                                             mentionValues[name] = result;
+                                            signatureInputs.push([name, hashString(JSON.stringify(result ?? null))]);
                                         }
                                     }
                                 }
@@ -3080,6 +3344,23 @@ document.addEventListener('DOMContentLoaded', () => {
                                 if (!dom) {
                                     throw new Error(`Node DOM not found: ${id}`);
                                 }
+
+                                const signature = computeNodeSignature(node, signatureInputs);
+                                const isGeneratorNode = ['generator', 'prompt_gen', 'image_gen', 'video_gen', 'base_gen', 'modifier'].includes(node.name);
+                                if (isGeneratorNode) {
+                                    const isTarget = targetNodeId && String(id) === String(targetNodeId);
+                                    const memoized = getReusableNodeResult(node);
+                                    if (!forceRerun && !isTarget && memoized && node.data.resultSignature === signature) {
+                                        nodeResults[id] = memoized;
+                                        reusedNodeIds.add(String(id));
+                                        showCacheBadge(id);
+                                        pending.delete(id);
+                                        executedInThisPass = true;
+                                        continue;
+                                    }
+                                    // Drop the stale signature until this run stores a new result.
+                                    dom.dataset.resultSignature = '';
+                                }
                                 const resultContainer = dom.querySelector('.node-result-container');
                                 if (resultContainer) {
                                     resultContainer.innerHTML = '<div class="w-full h-full flex items-center justify-center bg-black/20 backdrop-blur-sm z-50"><div class="text-xs font-semibold text-yellow-500 animate-pulse px-4 py-2 bg-zinc-900/90 rounded-full shadow-[0_0_15px_rgba(234,179,8,0.15)] border border-yellow-500/30 flex items-center gap-3"><svg class="animate-spin shrink-0 h-4 w-4" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M21 12a9 9 0 1 1-6.219-8.56"></path></svg><span>Processing...</span></div></div>';
@@ -3189,9 +3470,11 @@ document.addEventListener('DOMContentLoaded', () => {
                                         refImgsRaw.push(localRefPreview.src);
                                     }
 
-                                    // Safely convert URL images to base64 to pass to backend APIs
+                                    // Library/media images go by reference; other URL images are converted to base64
                                     const refImgs = await Promise.all(refImgsRaw.map(async (url) => {
                                         if (url.startsWith('data:')) return url;
+                                        const mediaRef = toServerMediaRef(url);
+                                        if (mediaRef) return mediaRef;
                                         try {
                                             const res = await fetch(url);
                                             const blob = await res.blob();
@@ -3265,6 +3548,8 @@ document.addEventListener('DOMContentLoaded', () => {
                                             node.data.generatedTextResult = resultUrl;
                                             node.data.resultType = 'text';
                                             node.data.statusText = 'Completed';
+                                            node.data.resultSignature = signature;
+                                            dom.dataset.resultSignature = signature;
                                             if (resultContainer) {
                                                 resultContainer.innerHTML = `<textarea class="node-result-text w-full h-full bg-transparent px-4 pt-14 pb-14 text-sm text-zinc-100 outline-none resize-none custom-scrollbar">${resultUrl}</textarea>`;
                                                 setGeneratorView(dom, 'result');
@@ -3294,16 +3579,30 @@ document.addEventListener('DOMContentLoaded', () => {
                                             for (let i = 0; i < imageCount; i++) promptsToRun.push(scenarios[0]);
                                         }
 
-                                        const urls = [];
-                                        for (let i = 0; i < promptsToRun.length; i++) {
-                                            if (resultContainer && promptsToRun.length > 1) {
+                                        let urls = [];
+                                        if (promptsToRun.length > 1) {
+                                            const batchConfig = {
+                                                modelId: modelSelect ? modelSelect.value : 'gemini-3-pro-image-preview',
+                                                style,
+                                                aspectRatio,
+                                                resolution
+                                            };
+                                            const showBatchProgress = (completed) => {
+                                                if (!resultContainer) return;
                                                 resultContainer.classList.remove('hidden');
-                                                resultContainer.innerHTML = `<div class="text-xs text-yellow-500 py-2 text-center bg-yellow-900/20 rounded border border-yellow-700/30">Generating image ${i + 1}/${promptsToRun.length}...</div>`;
+                                                resultContainer.innerHTML = `<div class="text-xs text-yellow-500 py-2 text-center bg-yellow-900/20 rounded border border-yellow-700/30">Generating images ${completed}/${promptsToRun.length}...</div>`;
                                                 setGeneratorView(dom, 'result');
-                                            }
-
+                                            };
+                                            showBatchProgress(0);
+                                            urls = await runImageBatch(
+                                                promptsToRun.map((prompt) => ({ prompt })),
+                                                { config: batchConfig, referenceImages: refImgs },
+                                                (event) => { if (event.completed) showBatchProgress(event.completed); }
+                                            );
+                                        } else {
                                             const reqBody = {
-                                                prompt: promptsToRun[i],
+                                                prompt: promptsToRun[0],
+                                                responseMode: 'url',
                                                 config: {
                                                     modelId: modelSelect ? modelSelect.value : 'gemini-3-pro-image-preview',
                                                     style,
@@ -3341,6 +3640,8 @@ document.addEventListener('DOMContentLoaded', () => {
                                             node.data.generatedTextResult = '';
                                             node.data.resultType = 'image';
                                             node.data.statusText = 'Completed';
+                                            node.data.resultSignature = signature;
+                                            dom.dataset.resultSignature = signature;
                                             if (resultContainer) {
                                                 if (urls.length === 1) {
                                                     resultContainer.innerHTML = `<img src="${urls[0]}" class="w-full h-auto object-cover border border-zinc-700/50 rounded cursor-pointer hover:opacity-90 transition-opacity" onclick="window.openImageModal(this.src, '')">`;
@@ -3393,15 +3694,11 @@ document.addEventListener('DOMContentLoaded', () => {
                                                     cameraMovement
                                                 }
                                             };
-                                            const res = await fetch('/api/generate-video', {
-                                                method: 'POST',
-                                                headers: { 'Content-Type': 'application/json' },
-                                                body: JSON.stringify(reqBody)
+                                            const data = await runVideoJob(reqBody, (job) => {
+                                                if (resultContainer && job.status === 'running') {
+                                                    resultContainer.innerHTML = `<div class="text-xs text-yellow-400 py-2 text-center bg-yellow-900/20 rounded border border-yellow-700/30">Generating video ${i + 1}/${scenarios.length} (running)...</div>`;
+                                                }
                                             });
-                                            const data = await res.json();
-                                            if (!res.ok) {
-                                                throw new Error(data.error || `Video generation failed (${res.status})`);
-                                            }
                                             if (!data.url) {
                                                 throw new Error(data.error || 'Video generation failed');
                                             }
@@ -3416,6 +3713,8 @@ document.addEventListener('DOMContentLoaded', () => {
                                         node.data.generatedVideoUrls = videoUrls;
                                         node.data.generatedTextResult = '';
                                         node.data.resultType = 'video';
+                                        node.data.resultSignature = signature;
+                                        dom.dataset.resultSignature = signature;
                                         node.data.statusText = videoUrls.length > 1 ? `Completed (${videoUrls.length} videos)` : 'Completed';
                                         if (resultContainer) {
                                             if (videoUrls.length === 1) {
@@ -3441,7 +3740,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                     }
                                     if (referenceImages.length > 0) {
                                         const content = referenceImages[0];
-                                        if (typeof content === 'string' && content.startsWith('data:image')) {
+                                        if (isImageResultUrl(content)) {
                                             outDisplay.innerHTML = `<img src="${content}" class="w-full h-auto object-contain rounded">`;
                                         } else if (typeof content === 'string' && (content.includes('/generated_videos/') || /\.(mp4|webm|mov)(\?|$)/i.test(content))) {
                                             outDisplay.innerHTML = `<video src="${content}" class="w-full h-auto object-contain rounded bg-black" controls playsinline></video>`;
@@ -3461,7 +3760,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                     if (titleBox) titleBox.classList.add('bg-emerald-900/40');
                                 } else if (resultUrl && node.name !== 'output_result') {
                                     if (resultContainer) {
-                                        if (typeof resultUrl === 'string' && resultUrl.startsWith('data:image')) {
+                                        if (isImageResultUrl(resultUrl)) {
                                             resultContainer.innerHTML = `<img src="${resultUrl}" class="w-full h-auto object-cover border border-zinc-700/50 rounded cursor-pointer hover:opacity-90 transition-opacity" onclick="window.openImageModal(this.src, '')">`;
                                         } else if (typeof resultUrl === 'string' && (resultUrl.includes('/generated_videos/') || /\.(mp4|webm|mov)(\?|$)/i.test(resultUrl))) {
                                             resultContainer.innerHTML = `<video src="${resultUrl}" class="w-full h-auto object-cover border border-zinc-700/50 rounded bg-black" controls playsinline></video>`;
@@ -3490,11 +3789,11 @@ document.addEventListener('DOMContentLoaded', () => {
                         iterationCount++;
                     }
                     await saveActiveWorkflow(workflowStore, false);
-                    if (targetNodeId && reusedNodeIds.size > 0) {
+                    if (reusedNodeIds.size > 0) {
                         const runBtn = document.getElementById('runWorkflowBtn');
                         if (runBtn) {
                             const currentText = runBtn.innerHTML;
-                            runBtn.innerHTML = `<i data-lucide="database-zap" class="w-4 h-4"></i> Reused ${reusedNodeIds.size} upstream`;
+                            runBtn.innerHTML = `<i data-lucide="database-zap" class="w-4 h-4"></i> Reused ${reusedNodeIds.size} ${targetNodeId ? 'upstream' : 'unchanged'}`;
                             safeCreateIcons();
                             setTimeout(() => {
                                 runBtn.innerHTML = currentText;
@@ -3513,8 +3812,9 @@ document.addEventListener('DOMContentLoaded', () => {
             };
 
             // Run Workflow button logic
-            document.getElementById('runWorkflowBtn').addEventListener('click', async () => {
-                await runWorkflowPipeline(null);
+            document.getElementById('runWorkflowBtn').addEventListener('click', async (e) => {
+                // Shift+click regenerates every node instead of reusing unchanged results.
+                await runWorkflowPipeline(null, { force: e.shiftKey });
             });
 
             const applyHeadingFromSelect = (selectEl) => {
@@ -4331,11 +4631,11 @@ document.addEventListener('DOMContentLoaded', () => {
     };
 
     // Library Pagination State
-    window.libraryState = { page: 1, hasMore: true, isLoading: false, filter: 'all' };
+    window.libraryState = { cursor: null, hasMore: true, isLoading: false, filter: 'all' };
 
     const renderLibraryView = async (append = false) => {
         if (!append) {
-            window.libraryState = { ...window.libraryState, page: 1, hasMore: true, isLoading: false };
+            window.libraryState = { ...window.libraryState, cursor: null, hasMore: true, isLoading: false };
             const activeFilter = window.libraryState.filter || 'all';
             els.viewContainer.innerHTML = `
                 <div class="w-full h-full p-6 flex flex-col max-w-7xl mx-auto">
@@ -4373,25 +4673,25 @@ document.addEventListener('DOMContentLoaded', () => {
         window.libraryState.isLoading = true;
 
         try {
-            const res = await fetch(`/api/images?page=${window.libraryState.page}&limit=20`);
+            const params = new URLSearchParams({ limit: '20', type: window.libraryState.filter || 'all' });
+            if (window.libraryState.cursor) params.set('cursor', window.libraryState.cursor);
+            const res = await fetch(`/api/images?${params.toString()}`);
             const data = await res.json();
+            if (!res.ok) throw new Error(data.error || 'Request failed');
             const grid = document.getElementById('masonryGrid');
             const trigger = document.getElementById('loadMoreTrigger');
 
-            if (data.images && data.images.length > 0) {
-                const filteredItems = data.images.filter((item) => {
-                    if (window.libraryState.filter === 'all') return true;
-                    return (item.media_type || 'image') === window.libraryState.filter;
-                });
-
-                const html = filteredItems.map(item => {
+            if ((data.images && data.images.length > 0) || window.libraryState.filter !== 'all') {
+                const html = (data.images || []).map(item => {
                     const safePrompt = item.prompt ? item.prompt.replace(/'/g, "\\'").replace(/"/g, '&quot;').replace(/\n/g, ' ') : '';
                     const safeUrl = item.url ? item.url.replace(/'/g, "\\'") : '';
                     const safeKey = item.key ? item.key.replace(/'/g, "\\'") : '';
                     const mediaType = item.media_type || 'image';
-                    const mediaPreview = mediaType === 'video'
+                    const thumbUrl = item.thumb_url || item.url;
+                    const thumbSrcset = item.thumb_url && item.preview_url ? ` srcset="${item.thumb_url} 1x, ${item.preview_url} 2x"` : '';
+                    const mediaPreview = mediaType === 'video' && !item.poster_url
                         ? `<video src="${safeUrl}" class="w-full h-auto object-cover bg-black opacity-0 transition-opacity duration-500" muted playsinline preload="metadata" onloadeddata="document.getElementById('skeleton-${safeKey}')?.remove(); this.classList.remove('opacity-0')"></video>`
-                        : `<img src="${safeUrl}" onload="document.getElementById('skeleton-${safeKey}')?.remove(); this.classList.remove('opacity-0')" class="w-full h-auto object-cover bg-black opacity-0 transition-opacity duration-500">`;
+                        : `<img src="${mediaType === 'video' ? item.poster_url : thumbUrl}"${mediaType === 'video' ? '' : thumbSrcset} loading="lazy" decoding="async" onload="document.getElementById('skeleton-${safeKey}')?.remove(); this.classList.remove('opacity-0')" class="w-full h-auto object-cover bg-black opacity-0 transition-opacity duration-500">`;
 
                     return `
                             <div class="relative group rounded-xl overflow-hidden border border-zinc-800 bg-zinc-900 cursor-pointer break-inside-avoid shadow-sm hover:shadow-yellow-500/10 transition-all duration-300 transform hover:-translate-y-1" onclick="window.openMediaModal('${safeUrl}', '${safePrompt}', '${mediaType}')">
@@ -4420,7 +4720,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
 
                 // Pagination check
-                if (window.libraryState.page >= data.num_pages) {
+                if (!data.has_more || !data.next_cursor) {
                     window.libraryState.hasMore = false;
                     if (trigger) {
                         const hasRenderedItems = grid && grid.children && grid.children.length > 0;
@@ -4429,7 +4729,7 @@ document.addEventListener('DOMContentLoaded', () => {
                             : '<span class="text-zinc-600 text-xs">No items in this filter</span>';
                     }
                 } else {
-                    window.libraryState.page++;
+                    window.libraryState.cursor = data.next_cursor;
                     if (trigger) trigger.innerHTML = '<button onclick="window.loadMoreLibrary()" class="px-4 py-2 bg-zinc-800 hover:bg-zinc-700 rounded-lg text-sm">Load More</button>';
                 }
             } else if (!append) {
@@ -4575,15 +4875,19 @@ document.addEventListener('DOMContentLoaded', () => {
         btnElement.classList.add('pointer-events-none', 'opacity-80');
 
         try {
-            // Convert existing image to base64 so we can send it as a reference
-            const imgRes = await fetch(originalUrl);
-            const blob = await imgRes.blob();
-            const base64Image = await fileToBase64(blob);
+            // Library images are referenced by path; anything else is sent as base64
+            let base64Image = toServerMediaRef(originalUrl);
+            if (!base64Image) {
+                const imgRes = await fetch(originalUrl);
+                const blob = await imgRes.blob();
+                base64Image = await fileToBase64(blob);
+            }
 
             // Build Payload for Upscale
             const payload = {
                 prompt: prompt || 'Upscale this image securely resolving details.',
                 referenceImages: [base64Image],
+                responseMode: 'url',
                 config: {
                     resolution: resolution, // '2K' | '4K' | '8K'
                     generatorKind: 'image', // explicit
@@ -4635,11 +4939,11 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Source Library Logic ---
 
     // Source Library Pagination State
-    window.sourceLibraryState = { page: 1, hasMore: true, isLoading: false };
+    window.sourceLibraryState = { cursor: null, hasMore: true, isLoading: false };
 
     const renderSourceLibraryView = async (append = false) => {
         if (!append) {
-            window.sourceLibraryState = { page: 1, hasMore: true, isLoading: false };
+            window.sourceLibraryState = { cursor: null, hasMore: true, isLoading: false };
             els.viewContainer.innerHTML = `
                 <div class="w-full h-full flex flex-col p-6 max-w-6xl mx-auto">
                      <div class="flex justify-between items-center mb-6 shrink-0">
@@ -4663,7 +4967,8 @@ document.addEventListener('DOMContentLoaded', () => {
         window.sourceLibraryState.isLoading = true;
 
         try {
-            const res = await fetch(`/api/source?page=${window.sourceLibraryState.page}&limit=20`);
+            const cursorParam = window.sourceLibraryState.cursor ? `&cursor=${encodeURIComponent(window.sourceLibraryState.cursor)}` : '';
+            const res = await fetch(`/api/source?limit=20${cursorParam}`);
             const data = await res.json();
             const grid = document.getElementById('sourceMasonryGrid');
             const trigger = document.getElementById('sourceLoadMoreTrigger');
@@ -4674,7 +4979,7 @@ document.addEventListener('DOMContentLoaded', () => {
                              <div class="absolute inset-0 flex items-center justify-center bg-zinc-900" id="src-skeleton-${img.id}">
                                  <i data-lucide="image" class="w-6 h-6 text-zinc-700 animate-pulse"></i>
                              </div>
-                             <img src="${img.url}" onload="document.getElementById('src-skeleton-${img.id}')?.remove(); this.classList.remove('opacity-0')" class="w-full h-auto object-cover opacity-0 transition-opacity duration-500">
+                             <img src="${img.thumb_url || img.url}" loading="lazy" decoding="async" onload="document.getElementById('src-skeleton-${img.id}')?.remove(); this.classList.remove('opacity-0')" class="w-full h-auto object-cover opacity-0 transition-opacity duration-500">
                              <div class="absolute inset-0 bg-black/60 opacity-0 group-hover:opacity-100 transition-opacity duration-300 flex items-center justify-center gap-2">
                                   <button onclick="window.downloadImage('${img.url}')" class="p-2.5 bg-zinc-800/90 hover:bg-zinc-700 rounded-full text-white backdrop-blur-sm transition-colors transform hover:scale-110">
                                      <i data-lucide="download" class="w-5 h-5"></i>
@@ -4688,11 +4993,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
                 if (grid) grid.insertAdjacentHTML('beforeend', html);
 
-                if (window.sourceLibraryState.page >= data.num_pages) {
+                if (!data.has_more || !data.next_cursor) {
                     window.sourceLibraryState.hasMore = false;
                     if (trigger) trigger.innerHTML = '<span class="text-zinc-600 text-xs">No more sources</span>';
                 } else {
-                    window.sourceLibraryState.page++;
+                    window.sourceLibraryState.cursor = data.next_cursor;
                     if (trigger) trigger.innerHTML = '<button onclick="window.loadMoreSource()" class="px-4 py-2 bg-zinc-800 hover:bg-zinc-700 rounded-lg text-sm">Load More</button>';
                 }
             } else if (!append) {
@@ -4804,8 +5109,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 libraryGrid.innerHTML = libraryData.images.map(img => {
                     const isVideo = img.media_type === 'video' || (img.url && img.url.match(/\.(mp4|webm|mov)$/i));
                     const mediaElement = isVideo
-                        ? `<video src="${img.url}" class="w-full h-full object-cover pointer-events-none" muted loop autoplay playsinline></video>`
-                        : `<img src="${img.url}" class="w-full h-full object-contain pointer-events-none">`;
+                        ? (img.poster_url
+                            ? `<img src="${img.poster_url}" loading="lazy" class="w-full h-full object-cover pointer-events-none">`
+                            : `<video src="${img.url}" class="w-full h-full object-cover pointer-events-none" muted loop autoplay playsinline></video>`)
+                        : `<img src="${img.thumb_url || img.url}" loading="lazy" decoding="async" class="w-full h-full object-contain pointer-events-none">`;
 
                     return `
                         <div class="aspect-square bg-black border border-zinc-800 rounded cursor-pointer hover:border-yellow-500 overflow-hidden relative group"
@@ -4824,8 +5131,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 sourceGrid.innerHTML = sourceData.images.map(img => {
                     const isVideo = img.media_type === 'video' || (img.url && img.url.match(/\.(mp4|webm|mov)$/i));
                     const mediaElement = isVideo
-                        ? `<video src="${img.url}" class="w-full h-full object-cover pointer-events-none" muted loop autoplay playsinline></video>`
-                        : `<img src="${img.url}" class="w-full h-full object-contain pointer-events-none">`;
+                        ? (img.poster_url
+                            ? `<img src="${img.poster_url}" loading="lazy" class="w-full h-full object-cover pointer-events-none">`
+                            : `<video src="${img.url}" class="w-full h-full object-cover pointer-events-none" muted loop autoplay playsinline></video>`)
+                        : `<img src="${img.thumb_url || img.url}" loading="lazy" decoding="async" class="w-full h-full object-contain pointer-events-none">`;
 
                     return `
                         <div class="aspect-square bg-black border border-zinc-800 rounded cursor-pointer hover:border-yellow-500 overflow-hidden relative group"
@@ -5458,7 +5767,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const payload = {
                 prompt: state.prompt,
                 config: state.config,
-                referenceImages: refImages
+                referenceImages: refImages,
+                responseMode: 'url'
             };
 
             // Add mask if it exists (Generic)
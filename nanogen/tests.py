@@ -1,3 +1,117 @@
-from django.test import TestCase
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from . import services
+from .clients import GeminiFileCache
+
+
+class FakeFiles:
+    """
+    Stands in for client.files: hands out numbered uploads that expire after `ttl`.
+    """
+
+    def __init__(self, ttl=timedelta(hours=48), fail=False):
+        self.ttl = ttl
+        self.fail = fail
+        self.uploads = []
+
+    def upload(self, file, config):
+        if self.fail:
+            raise ConnectionError("upload refused")
+        name = f"files/{len(self.uploads) + 1}"
+        self.uploads.append(file.read())
+        return SimpleNamespace(
+            name=name,
+            uri=f"https://files.example/{name}",
+            mime_type=config['mime_type'],
+            state='ACTIVE',
+            expiration_time=datetime.now(timezone.utc) + self.ttl,
+        )
+
+    def get(self, name):
+        raise AssertionError("active uploads should not be polled")
+
+
+class GeminiFileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.files = FakeFiles()
+        self.client = SimpleNamespace(files=self.files)
+        self.cache = GeminiFileCache(enabled=True, reuse_margin_sec=3600, max_entries=16)
+
+    def test_same_image_is_uploaded_once(self):
+        first = self.cache.get_part(self.client, b'image-a', 'image/png')
+        second = self.cache.get_part(self.client, b'image-a', 'image/png')
+
+        self.assertEqual(len(self.files.uploads), 1)
+        self.assertEqual(first.file_data.file_uri, second.file_data.file_uri)
+        self.assertEqual(second.file_data.mime_type, 'image/png')
+        stats = self.cache.stats()
+        self.assertEqual((stats['uploads'], stats['reused']), (1, 1))
+
+    def test_different_images_are_uploaded_separately(self):
+        self.cache.get_part(self.client, b'image-a', 'image/png')
+        self.cache.get_part(self.client, b'image-b', 'image/png')
+
+        self.assertEqual(self.files.uploads, [b'image-a', b'image-b'])
+
+    def test_file_close_to_expiry_is_uploaded_again(self):
+        # Expires inside the reuse margin, so the cached handle must not be reused.
+        self.files.ttl = timedelta(minutes=30)
+        first = self.cache.get_part(self.client, b'image-a', 'image/png')
+        self.files.ttl = timedelta(hours=48)
+        second = self.cache.get_part(self.client, b'image-a', 'image/png')
+
+        self.assertEqual(len(self.files.uploads), 2)
+        self.assertNotEqual(first.file_data.file_uri, second.file_data.file_uri)
+        stats = self.cache.stats()
+        self.assertEqual((stats['uploads'], stats['expired'], stats['reused']), (2, 1, 0))
+
+    def test_file_reused_until_it_nears_expiry(self):
+        self.cache.get_part(self.client, b'image-a', 'image/png')
+        later = time.time() + 47 * 3600 + 60
+        with mock.patch('nanogen.clients.time.time', return_value=later):
+            self.cache.get_part(self.client, b'image-a', 'image/png')
+
+        self.assertEqual(len(self.files.uploads), 2)
+        self.assertEqual(self.cache.stats()['expired'], 1)
+
+    def test_upload_failure_is_counted_and_not_cached(self):
+        self.files.fail = True
+        with self.assertRaises(ConnectionError):
+            self.cache.get_part(self.client, b'image-a', 'image/png')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['upload_failures'], stats['cached_files']), (1, 0))
+
+
+class BuildReferencePartTests(SimpleTestCase):
+    def test_upload_failure_falls_back_to_inline_bytes(self):
+        client = SimpleNamespace(files=FakeFiles(fail=True))
+        cache = GeminiFileCache(enabled=True, max_entries=16)
+        with mock.patch.object(services, 'gemini_file_cache', cache), mock.patch('builtins.print'):
+            part = services.build_reference_part(client, b'image-a', 'image/png')
+
+        self.assertIsNone(part.file_data)
+        self.assertEqual(part.inline_data.data, b'image-a')
+        self.assertEqual(part.inline_data.mime_type, 'image/png')
+
+    def test_files_api_disabled_sends_inline_bytes(self):
+        files = FakeFiles()
+        cache = GeminiFileCache(enabled=False, max_entries=16)
+        with mock.patch.object(services, 'gemini_file_cache', cache):
+            part = services.build_reference_part(SimpleNamespace(files=files), b'image-a', 'image/png')
+
+        self.assertEqual(part.inline_data.data, b'image-a')
+        self.assertEqual(files.uploads, [])
+
+    def test_uploaded_file_is_sent_by_uri(self):
+        client = SimpleNamespace(files=FakeFiles())
+        cache = GeminiFileCache(enabled=True, max_entries=16)
+        with mock.patch.object(services, 'gemini_file_cache', cache):
+            part = services.build_reference_part(client, b'image-a', 'image/png')
+
+        self.assertEqual(part.file_data.file_uri, 'https://files.example/files/1')
+        self.assertIsNone(part.inline_data)
@@ -6,11 +6,26 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('', views.index, name='index'),
     path('api/workflow/store', views.workflow_store_view, name='workflow_store'),
+    path('api/workflow/workflows/<str:workflow_id>', views.workflow_detail_view, name='workflow_detail'),
+    path('api/stats', views.runtime_stats_view, name='runtime_stats'),
+    path('api/models/health', views.model_health_view, name='model_health'),
     path('api/generate', views.generate_image_view, name='generate_image'),
+    path('api/generate/batch', views.generate_image_batch_view, name='generate_image_batch'),
     path('api/generate-video', views.generate_video_view, name='generate_video'),
+    path('api/async/generate', views.async_generate_image_view, name='async_generate_image'),
+    path('api/async/generate-video', views.async_generate_video_view, name='async_generate_video'),
+    path('api/async/prompt/midjourney', views.async_generate_midjourney_prompt_view, name='async_generate_midjourney_prompt'),
+    path('api/generate-video/jobs', views.submit_video_job_view, name='submit_video_job'),
+    path('api/generate-video/jobs/<uuid:job_id>', views.video_job_status_view, name='video_job_status'),
+    path('api/generate-video/jobs/<uuid:job_id>/result', views.video_job_result_view, name='video_job_result'),
+    path('api/workflow/runs', views.submit_workflow_run_view, name='submit_workflow_run'),
+    path('api/workflow/runs/<uuid:run_id>', views.workflow_run_status_view, name='workflow_run_status'),
+    path('api/workflow/runs/<uuid:run_id>/cancel', views.cancel_workflow_run_view, name='cancel_workflow_run'),
+    path('api/workflow/node-cache', views.workflow_node_cache_view, name='workflow_node_cache'),
     path('api/images', views.list_images, name='list_images'),
     path('api/images/<int:image_id>/delete', views.delete_image, name='delete_image'),
     path('api/library/<str:item_key>/delete', views.delete_library_item, name='delete_library_item'),
+    path('api/media/<str:item_key>/<str:size>', views.media_derivative_view, name='media_derivative'),
     
     # Source Library
     path('api/source', views.list_source_images, name='list_source_images'),
@@ -19,6 +34,7 @@ urlpatterns = [
     
     # Prompt Gen
     path('api/prompt/midjourney', views.generate_midjourney_prompt_view, name='generate_midjourney_prompt'),
+    path('api/prompt/midjourney/batch', views.generate_midjourney_prompt_batch_view, name='generate_midjourney_prompt_batch'),
     path('api/prompt/presets', views.get_midjourney_presets, name='get_midjourney_presets'),
     
     # Prompt Gen Edit API
@@ -0,0 +1,168 @@
+import os
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import VeoAttemptStat
+
+
+PRIMARY = 'primary'
+COMPRESSED = 'compressed'
+
+# Failure categories. The deterministic ones fail the same way for any prompt, so a
+# combination that keeps hitting them is skipped; the rest only lower its ranking.
+REFERENCE_UNSUPPORTED = 'reference_unsupported'
+MODEL_UNSUPPORTED = 'model_unsupported'
+SAFETY = 'safety'
+TIMEOUT = 'timeout'
+QUOTA = 'quota'
+NO_VIDEO = 'no_video'
+OTHER = 'other'
+DETERMINISTIC = (REFERENCE_UNSUPPORTED, MODEL_UNSUPPORTED)
+
+
+def classify_veo_failure(reason):
+    text = str(reason).lower()
+    if ('image' in text or 'reference' in text) and any(
+        marker in text for marker in ('not supported', 'unsupported', 'does not support', "isn't supported")
+    ):
+        return REFERENCE_UNSUPPORTED
+    if '404' in text or 'not_found' in text or 'not found' in text:
+        return MODEL_UNSUPPORTED
+    if 'safety' in text or 'filtered' in text or 'responsible ai' in text or 'blocked' in text:
+        return SAFETY
+    if 'timed out' in text or 'timeout' in text or 'deadline' in text:
+        return TIMEOUT
+    if '429' in text or 'resource_exhausted' in text or 'quota' in text:
+        return QUOTA
+    if 'generated_videos was empty' in text or 'video object missing' in text or 'bytes are empty' in text:
+        return NO_VIDEO
+    return OTHER
+
+
+def _settings():
+    return {
+        'skip_after': max(1, int(os.environ.get('VEO_PLAN_SKIP_AFTER', '2'))),
+        'retry_after': timedelta(seconds=float(os.environ.get('VEO_PLAN_RETRY_AFTER_SEC', str(3 * 86400)))),
+        'min_samples': max(1, int(os.environ.get('VEO_PLAN_MIN_SAMPLES', '3'))),
+        'default_minutes': float(os.environ.get('VEO_PLAN_DEFAULT_MINUTES', '3')),
+        'min_success': float(os.environ.get('VEO_PLAN_MIN_SUCCESS', '0.2')),
+        'max_attempts': int(os.environ.get('VEO_MAX_ATTEMPTS', '4')),
+    }
+
+
+def known_failure(stat, settings=None, now=None):
+    """
+    The deterministic failure category this combination keeps hitting, or ''.
+    Forgotten after a success or once VEO_PLAN_RETRY_AFTER_SEC has passed.
+    """
+    settings = settings or _settings()
+    now = now or timezone.now()
+    category = stat.last_failure_category
+    if category not in DETERMINISTIC or not stat.last_failure_at:
+        return ''
+    if stat.last_success_at and stat.last_success_at > stat.last_failure_at:
+        return ''
+    if now - stat.last_failure_at > settings['retry_after']:
+        return ''
+    return category if (stat.failure_counts or {}).get(category, 0) >= settings['skip_after'] else ''
+
+
+def success_per_minute(stat, settings):
+    """
+    Laplace-smoothed success probability divided by the mean attempt duration in minutes.
+    Combinations with fewer than VEO_PLAN_MIN_SAMPLES attempts get the neutral prior.
+    """
+    if stat is None or stat.attempts < settings['min_samples']:
+        return 0.5 / settings['default_minutes']
+    probability = (stat.successes + 1) / (stat.attempts + 2)
+    minutes = max(0.1, stat.total_seconds / stat.attempts / 60)
+    return probability / minutes
+
+
+def plan_veo_attempts(attempt_plan, requested_model):
+    """
+    Orders (model, prompt, use_reference, variant) attempts by learned success per
+    expected minute and drops combinations known to fail. Attempts on the requested
+    model stay ahead unless it has been succeeding less than VEO_PLAN_MIN_SUCCESS.
+    At most VEO_MAX_ATTEMPTS attempts are kept (0 = no cap).
+    Returns (plan, skipped) where skipped lists "model ref=...: reason" strings.
+    """
+    settings = _settings()
+    now = timezone.now()
+    stats = {
+        (stat.model_id, stat.with_reference, stat.prompt_variant): stat
+        for stat in VeoAttemptStat.objects.filter(model_id__in={attempt[0] for attempt in attempt_plan})
+    }
+
+    kept = []
+    skipped = []
+    for attempt in attempt_plan:
+        model_id, _, use_ref, variant = attempt
+        stat = stats.get((model_id, use_ref, variant))
+        failure = known_failure(stat, settings, now) if stat else ''
+        if failure:
+            skipped.append(f"{model_id} ref={use_ref} {variant}: skipped, known {failure} ({stat.last_failure[:120]})")
+            continue
+        poor = (
+            stat is not None and stat.attempts >= settings['min_samples']
+            and (stat.successes + 1) / (stat.attempts + 2) < settings['min_success']
+        )
+        preferred = model_id == requested_model and not poor
+        kept.append((0 if preferred else 1, -success_per_minute(stat, settings), attempt))
+
+    kept.sort(key=lambda item: item[:2])
+    plan = [attempt for _, _, attempt in kept]
+    if settings['max_attempts'] > 0 and len(plan) > settings['max_attempts']:
+        for model_id, _, use_ref, variant in plan[settings['max_attempts']:]:
+            skipped.append(f"{model_id} ref={use_ref} {variant}: skipped, over VEO_MAX_ATTEMPTS")
+        plan = plan[:settings['max_attempts']]
+    return plan, skipped
+
+
+def record_veo_attempts(outcomes):
+    """
+    Persists attempt outcomes collected by services._veo_attempts: dicts with model_id,
+    with_reference, prompt_variant, seconds, and either success=True or category/reason.
+    """
+    now = timezone.now()
+    for outcome in outcomes:
+        try:
+            with transaction.atomic():
+                stat, _ = VeoAttemptStat.objects.select_for_update().get_or_create(
+                    model_id=outcome['model_id'],
+                    with_reference=outcome['with_reference'],
+                    prompt_variant=outcome['prompt_variant'],
+                )
+                stat.attempts += 1
+                stat.total_seconds += outcome['seconds']
+                if outcome.get('success'):
+                    stat.successes += 1
+                    stat.last_success_at = now
+                else:
+                    counts = dict(stat.failure_counts or {})
+                    counts[outcome['category']] = counts.get(outcome['category'], 0) + 1
+                    stat.failure_counts = counts
+                    stat.last_failure_category = outcome['category']
+                    stat.last_failure = str(outcome.get('reason', ''))[:1000]
+                    stat.last_failure_at = now
+                stat.save()
+        except Exception as e:
+            print(f"Failed to record Veo attempt outcome: {e}")
+
+
+def veo_plan_stats():
+    settings = _settings()
+    now = timezone.now()
+    return [
+        {
+            'model': stat.model_id,
+            'with_reference': stat.with_reference,
+            'prompt_variant': stat.prompt_variant,
+            'attempts': stat.attempts,
+            'successes': stat.successes,
+            'mean_minutes': round(stat.total_seconds / stat.attempts / 60, 2) if stat.attempts else None,
+            'failures': stat.failure_counts,
+            'skipped': bool(known_failure(stat, settings, now)),
+        }
+        for stat in VeoAttemptStat.objects.order_by('model_id', '-with_reference', 'prompt_variant')
+    ]
@@ -1,14 +1,21 @@
+import os
 import json
+import time
 import base64
-import uuid
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.base import ContentFile
 from django.templatetags.static import static
 from django.shortcuts import redirect
 from django.conf import settings
-from .models import GeneratedImage, GeneratedVideo, SourceImage, MidjourneyOption, WorkflowStore
+from django.core.files.storage import default_storage
+from django.db.models import F, IntegerField, Q, Value
+from .models import GeneratedImage, GeneratedVideo, SourceImage, MidjourneyOption, VideoJob, Workflow, WorkflowRun
+from .workflows import (
+    WorkflowConflict, workflow_etag, parse_if_match, serialize_workflow, get_active_workflow_id,
+    set_active_workflow_id, save_workflow, delete_workflow, replace_all_workflows
+)
 
 
 def index(request):
@@ -22,35 +29,48 @@ def favicon_view(request):
         return JsonResponse({'status': 'ok'})
 
 
-def _empty_workflow_store():
-    return {'workflows': [], 'activeId': None}
-
-
-def _normalize_workflow_store(store):
-    if not isinstance(store, dict):
-        return _empty_workflow_store()
-    workflows = store.get('workflows')
-    if not isinstance(workflows, list):
-        workflows = []
-    active_id = store.get('activeId', None)
-    normalized = {
-        'workflows': workflows,
-        'activeId': active_id
-    }
-    if 'updatedAt' in store:
-        normalized['updatedAt'] = store.get('updatedAt')
-    return normalized
+def _workflow_conflict_response(conflict):
+    current = conflict.current
+    response = JsonResponse({
+        'error': str(conflict),
+        'workflowId': current.id if current else None,
+        'currentVersion': current.version if current else None
+    }, status=412)
+    if current:
+        response['ETag'] = workflow_etag(current)
+    return response
 
 
 @csrf_exempt
 def workflow_store_view(request):
+    """
+    GET: workflow metadata (id, name, version, updatedAt) plus activeId; graphs are only
+    included with ?include=graphs. PATCH: {"activeId": ...}. POST: legacy full-document save;
+    existing workflows must carry their loaded `version` (412 otherwise) and none are deleted.
+    """
     if request.method == 'GET':
         try:
-            obj = WorkflowStore.objects.filter(key='default').first()
-            store = _normalize_workflow_store(obj.data if obj else _empty_workflow_store())
+            include_graphs = request.GET.get('include') == 'graphs'
+            workflows = Workflow.objects.all()
+            if not include_graphs:
+                workflows = workflows.defer('graph')
+            store = {
+                'workflows': [serialize_workflow(w, include_graph=include_graphs) for w in workflows],
+                'activeId': get_active_workflow_id()
+            }
             return JsonResponse({'store': store})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
+    if request.method == 'PATCH':
+        try:
+            body = json.loads(request.body or '{}')
+            active_id = body.get('activeId')
+            if active_id is not None and not Workflow.objects.filter(id=active_id).exists():
+                return JsonResponse({'error': 'Workflow not found'}, status=404)
+            set_active_workflow_id(active_id)
+            return JsonResponse({'success': True, 'activeId': active_id})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
     if request.method == 'POST':
         try:
             body = json.loads(request.body or '{}')
@@ -59,16 +79,119 @@ def workflow_store_view(request):
                 return JsonResponse({'error': 'Invalid store payload'}, status=400)
             if not isinstance(store.get('workflows'), list):
                 return JsonResponse({'error': 'Invalid workflows payload'}, status=400)
-            normalized = _normalize_workflow_store(store)
-            WorkflowStore.objects.update_or_create(
-                key='default',
-                defaults={'data': normalized}
-            )
-            return JsonResponse({'success': True, 'savedWorkflows': len(normalized.get('workflows', []))})
+            if any(isinstance(item, dict) and item.get('name') is not None and not isinstance(item['name'], str)
+                   for item in store['workflows']):
+                return JsonResponse({'error': 'Invalid workflow name'}, status=400)
+            try:
+                saved = replace_all_workflows(store['workflows'], store.get('activeId'))
+            except WorkflowConflict as conflict:
+                return _workflow_conflict_response(conflict)
+            return JsonResponse({
+                'success': True,
+                'savedWorkflows': len(saved),
+                'workflows': [serialize_workflow(workflow) for workflow in saved]
+            })
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
+
+@csrf_exempt
+def workflow_detail_view(request, workflow_id):
+    """
+    One workflow. GET returns the graph with an ETag (304 on If-None-Match); embedded media
+    is stored as /media/blobs/ URLs, and ?expand=data inlines it back as data URIs.
+    PUT replaces {name, graph}; PATCH applies {name?, graph?, nodes?} where `nodes`
+    maps Drawflow node ids to node objects (null deletes). Writes honour If-Match and
+    return 412 on a version conflict. `activate: true` also makes it the active workflow.
+    """
+    try:
+        if request.method == 'GET':
+            workflow = Workflow.objects.filter(id=workflow_id).first()
+            if not workflow:
+                return JsonResponse({'error': 'Workflow not found'}, status=404)
+            expand = request.GET.get('expand') == 'data'
+            etag = workflow_etag(workflow)
+            if request.headers.get('If-None-Match') == etag and not expand:
+                response = HttpResponseNotModified()
+            else:
+                data = serialize_workflow(workflow, include_graph=True)
+                if expand:
+                    data['graph'] = expand_blob_refs(data['graph'])
+                response = JsonResponse({'workflow': data})
+            response['ETag'] = etag
+            return response
+
+        if request.method in ('PUT', 'PATCH'):
+            body = json.loads(request.body or '{}')
+            name = body.get('name')
+            graph = body.get('graph')
+            nodes = body.get('nodes')
+            if name is not None and (not isinstance(name, str) or not name.strip()):
+                return JsonResponse({'error': 'Invalid workflow name'}, status=400)
+            if graph is not None and not isinstance(graph, dict):
+                return JsonResponse({'error': 'Invalid graph payload'}, status=400)
+            if nodes is not None and not isinstance(nodes, dict):
+                return JsonResponse({'error': 'Invalid nodes payload'}, status=400)
+            if request.method == 'PUT' and graph is None:
+                return JsonResponse({'error': 'PUT requires a full graph'}, status=400)
+
+            try:
+                workflow, created = save_workflow(
+                    workflow_id,
+                    expected_version=parse_if_match(request),
+                    name=name.strip()[:255] if name else None,
+                    graph=graph,
+                    nodes=None if request.method == 'PUT' else nodes
+                )
+            except WorkflowConflict as conflict:
+                return _workflow_conflict_response(conflict)
+            if body.get('activate'):
+                set_active_workflow_id(workflow.id)
+
+            response = JsonResponse({'success': True, 'workflow': serialize_workflow(workflow)}, status=201 if created else 200)
+            response['ETag'] = workflow_etag(workflow)
+            return response
+
+        if request.method == 'DELETE':
+            try:
+                deleted = delete_workflow(workflow_id, expected_version=parse_if_match(request))
+            except WorkflowConflict as conflict:
+                return _workflow_conflict_response(conflict)
+            if not deleted:
+                return JsonResponse({'error': 'Workflow not found'}, status=404)
+            return JsonResponse({'success': True})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+@csrf_exempt
+def runtime_stats_view(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    from .clients import genai_client_pool, kling_client, kling_token_cache, gemini_file_cache
+    from .poller import poller_stats
+    from .references import reference_cache
+    from .prompt_cache import prompt_cache_stats
+    from .hedging import hedging_stats
+    from .veo_plan import veo_plan_stats
+    return JsonResponse({
+        'genai_clients': genai_client_pool.stats(),
+        'kling_http': kling_client.stats(),
+        'kling_tokens': kling_token_cache.stats(),
+        'gemini_files': gemini_file_cache.stats(),
+        'video_poller': poller_stats(),
+        'reference_cache': reference_cache.stats(),
+        'workflow_node_cache': node_output_cache.stats(),
+        'prompt_cache': prompt_cache_stats(),
+        'prompt_batch_rate': prompt_rate_limiter.stats(),
+        'image_batch_rate': image_rate_limiter.stats(),
+        'image_model_slots': image_model_limiter.stats(),
+        'image_hedging': hedging_stats(),
+        'model_health': model_health.snapshot(),
+        'veo_attempts': veo_plan_stats(),
+    })
+
 # --- Midjourney Prompt Gen Data ---
 
 DEFAULT_PRESETS = {
@@ -266,28 +389,58 @@ def reset_midjourney_options(request):
 
 @csrf_exempt
 def list_source_images(request):
+    """
+    Source library ordered by (-created_at, -id). Pass `cursor` (from `next_cursor`) for
+    keyset pagination; `page` is still accepted for offset-based clients.
+    Totals come from a cached COUNT and are only computed in page mode or with include_total=1.
+    """
     try:
-        from django.core.paginator import Paginator
-        page = request.GET.get('page', 1)
-        limit = request.GET.get('limit', 20)
-        
-        images_query = SourceImage.objects.all().order_by('-created_at')
-        paginator = Paginator(images_query, limit)
-        images = paginator.get_page(page)
-        
+        limit = parse_limit(request.GET.get('limit', 20))
+        cursor_param = request.GET.get('cursor')
+        images_query = SourceImage.objects.order_by('-created_at', '-id')
+
+        page = 1
+        if cursor_param:
+            try:
+                cursor_at, cursor_id = decode_cursor(cursor_param, 2)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            rows = list(images_query.filter(keyset_before(cursor_at, cursor_id))[:limit + 1])
+        else:
+            try:
+                page = max(1, int(request.GET.get('page', 1)))
+            except (TypeError, ValueError):
+                page = 1
+            offset = (page - 1) * limit
+            rows = list(images_query[offset:offset + limit + 1])
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
         data = []
-        for img in images:
-            data.append({
+        for img in rows:
+            item = {
                 'id': img.id,
                 'url': img.image.url,
                 'created_at': img.created_at.isoformat()
-            })
-        return JsonResponse({
+            }
+            item.update(derivative_urls(f"src:{img.id}", img.image.name, 'image'))
+            data.append(item)
+
+        result = {
             'images': data,
-            'page': images.number,
-            'num_pages': paginator.num_pages,
-            'total': paginator.count
-        })
+            'has_more': has_more,
+            'next_cursor': encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        }
+        if not cursor_param or request.GET.get('include_total') == '1':
+            total = cached_count('source_images', SourceImage.objects.all())
+            result['total'] = total
+            if not cursor_param:
+                result.update({
+                    'page': page,
+                    'num_pages': max(1, -(-total // limit))
+                })
+        return JsonResponse(result)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -301,6 +454,8 @@ def upload_source_image(request):
             
             image_file = request.FILES['image']
             source_image = SourceImage.objects.create(image=image_file)
+            schedule_derivatives(source_image.image.name)
+            invalidate_count('source_images')
             
             return JsonResponse({
                 'success': True,
@@ -318,14 +473,31 @@ def delete_source_image(request, image_id):
     if request.method == 'DELETE':
         try:
             image = get_object_or_404(SourceImage, id=image_id)
+            delete_derivatives(image.image.name)
             image.image.delete()
             image.delete()
+            invalidate_count('source_images')
             return JsonResponse({'success': True})
         except Exception as e:
              return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
-from .services import generate_image_with_gemini, generate_midjourney_prompt, generate_video_with_veo
+from .services import generate_image_with_gemini, generate_midjourney_prompt
+from .async_services import agenerate_image_with_gemini, agenerate_video, agenerate_midjourney_prompt
+from .jobs import (
+    generate_and_store_video, generate_and_store_image, store_generated_image, store_generated_video,
+    submit_video_job, serialize_video_job
+)
+from .workflow_engine import submit_workflow_run, serialize_workflow_run, request_cancel, load_run_graph, node_output_cache
+from .blobs import expand_blob_refs
+from .model_health import model_health
+from .deadline import request_deadline, DeadlineExceeded
+from .batching import (
+    iter_batch_results, batch_concurrency, prompt_rate_limiter, image_rate_limiter,
+    image_model_limiter, ndjson_line, sse_event
+)
+from .pagination import encode_cursor, decode_cursor, keyset_before, parse_limit, cached_count, invalidate_count
+from .derivatives import ensure_derivative, derivative_urls, delete_derivatives, schedule_derivatives, IMAGE_SIZES, POSTER_SIZE
 
 # ... existing code ...
 
@@ -340,13 +512,71 @@ def generate_midjourney_prompt_view(request):
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
+
+@csrf_exempt
+def generate_midjourney_prompt_batch_view(request):
+    """
+    Runs many generate_midjourney_prompt payloads concurrently and streams NDJSON in
+    completion order: one {"index", "prompt"} or {"index", "error"} line per item, then
+    a {"done": true, ...} summary line.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    items = req_data.get('items')
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'items must be a non-empty list'}, status=400)
+    max_items = int(os.environ.get('PROMPT_BATCH_MAX_ITEMS', '500'))
+    if len(items) > max_items:
+        return JsonResponse({'error': f'At most {max_items} items per batch'}, status=400)
+
+    concurrency = batch_concurrency(
+        req_data.get('concurrency'), 'PROMPT_BATCH_CONCURRENCY', '4', 'PROMPT_BATCH_MAX_CONCURRENCY', '16'
+    )
+
+    def _generate(item):
+        if not isinstance(item, dict):
+            raise ValueError('Each item must be an object')
+        return generate_midjourney_prompt(item, raise_errors=True)
+
+    def _stream():
+        started = time.monotonic()
+        succeeded = 0
+        for index, prompt, error in iter_batch_results(items, _generate, concurrency, prompt_rate_limiter):
+            if error is None:
+                succeeded += 1
+                yield ndjson_line({'index': index, 'prompt': prompt})
+            else:
+                yield ndjson_line({'index': index, 'error': str(error)})
+        yield ndjson_line({
+            'done': True,
+            'total': len(items),
+            'succeeded': succeeded,
+            'failed': len(items) - succeeded,
+            'elapsed_ms': int((time.monotonic() - started) * 1000),
+        })
+
+    response = StreamingHttpResponse(_stream(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # --- Generated Image Views ---
 
+def _image_data_uri(image_bytes, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+
+
 @csrf_exempt
 def generate_image_view(request):
     if request.method == 'POST':
         try:
             req_data = json.loads(request.body)
+            deadline = request_deadline('image', req_data.get('deadlineSec'))
             prompt = req_data.get('prompt')
             config = req_data.get('config', {})
             reference_images = req_data.get('referenceImages', [])
@@ -355,50 +585,143 @@ def generate_image_view(request):
             if not prompt:
                 return JsonResponse({'error': 'Prompt is required'}, status=400)
             
-            # Generate image (returns base64 data URI)
-            image_b64_uri = generate_image_with_gemini(prompt, config, reference_images, mask_image)
-            
+            # 'inline' (default) also returns the image as a data URI; 'url' returns only the saved file URL.
+            response_mode = req_data.get('responseMode') or request.GET.get('response', 'inline')
+
+            image_bytes, mime_type = generate_image_with_gemini(prompt, config, reference_images, mask_image, deadline)
+
             # Save to Database (GeneratedImage only; do not auto-save to Source Library)
             try:
-                if 'base64,' in image_b64_uri:
-                    format_str, imgstr = image_b64_uri.split(';base64,') 
-                    ext = format_str.split('/')[-1]
-                    image_bytes = base64.b64decode(imgstr)
-
-                    generated_filename = f"generated_{uuid.uuid4()}.{ext}"
-
-                    generated_image = GeneratedImage.objects.create(
-                        image=ContentFile(image_bytes, name=generated_filename),
-                        prompt=prompt
-                    )
-                    
-                    # Return inline URL for immediate display + saved image record
-                    return JsonResponse({
-                        'url': image_b64_uri,
-                        'saved_image': {
-                            'id': generated_image.id,
-                            'url': generated_image.image.url
-                        }
-                    })
+                generated_image = store_generated_image(image_bytes, mime_type, prompt)
             except Exception as save_error:
                 print(f"Error saving image: {save_error}")
-                # If saving fails, still return the generated image but log error
-                return JsonResponse({'url': image_b64_uri})
+                generated_image = None
 
-            # Non-base64 response fallback (e.g., direct URL string)
-            return JsonResponse({'url': image_b64_uri})
+            return _generated_image_response(image_bytes, mime_type, generated_image, response_mode)
 
         except Exception as e:
             import traceback
             traceback.print_exc()
-            status_code = 500
-            if 'Overloaded' in str(e):
-                status_code = 503
-            return JsonResponse({'error': str(e)}, status=status_code)
+            return _generate_image_error_response(e)
     
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
+def _generated_image_response(image_bytes, mime_type, generated_image, response_mode):
+    if generated_image is None:
+        # If saving failed, still return the generated image inline
+        return JsonResponse({'url': _image_data_uri(image_bytes, mime_type), 'mimeType': mime_type})
+
+    saved_image = {
+        'id': generated_image.id,
+        'url': generated_image.image.url
+    }
+    if response_mode == 'url':
+        return JsonResponse({
+            'url': saved_image['url'],
+            'mimeType': mime_type,
+            'saved_image': saved_image
+        })
+
+    # Return inline URL for immediate display + saved image record
+    return JsonResponse({
+        'url': _image_data_uri(image_bytes, mime_type),
+        'mimeType': mime_type,
+        'saved_image': saved_image
+    })
+
+
+def _generate_image_error_response(e):
+    status_code = 500
+    if isinstance(e, DeadlineExceeded):
+        status_code = 504
+    elif 'Overloaded' in str(e):
+        status_code = 503
+    return JsonResponse({'error': str(e)}, status=status_code)
+
+
+def _generate_video_error_response(e):
+    return JsonResponse({'error': str(e)}, status=504 if isinstance(e, DeadlineExceeded) else 500)
+
+
+@csrf_exempt
+def generate_image_batch_view(request):
+    """
+    Generates many images concurrently. Body: {items: [{prompt, config?, referenceImages?,
+    maskImage?}], config?, referenceImages?, concurrency?, stream?}; top-level config and
+    referenceImages are defaults for items that omit them. Each image is saved as soon as it
+    finishes and reported as a progress event, as NDJSON by default or as SSE when
+    stream is 'sse' or the client accepts text/event-stream.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    items = req_data.get('items')
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'items must be a non-empty list'}, status=400)
+    max_items = int(os.environ.get('IMAGE_BATCH_MAX_ITEMS', '100'))
+    if len(items) > max_items:
+        return JsonResponse({'error': f'At most {max_items} items per batch'}, status=400)
+
+    default_config = req_data.get('config') or {}
+    default_references = req_data.get('referenceImages') or []
+    concurrency = batch_concurrency(
+        req_data.get('concurrency'), 'IMAGE_BATCH_CONCURRENCY', '8', 'IMAGE_BATCH_MAX_CONCURRENCY', '32'
+    )
+    use_sse = req_data.get('stream') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+
+    def _generate(item):
+        if not isinstance(item, dict) or not item.get('prompt'):
+            raise ValueError('Prompt is required')
+        config = item.get('config') or default_config
+        references = item.get('referenceImages') if item.get('referenceImages') is not None else default_references
+        # Each item's budget starts when a worker picks it up.
+        deadline = request_deadline('image', item.get('deadlineSec', req_data.get('deadlineSec')))
+        generated_image, mime_type = generate_and_store_image(item['prompt'], config, references, item.get('maskImage'), deadline)
+        return {
+            'url': generated_image.image.url,
+            'mimeType': mime_type,
+            'saved_image': {'id': generated_image.id, 'url': generated_image.image.url}
+        }
+
+    def _emit(event, data):
+        if use_sse:
+            return sse_event(event, data)
+        return ndjson_line({'event': event, **data})
+
+    def _stream():
+        started = time.monotonic()
+        completed = 0
+        succeeded = 0
+        yield _emit('accepted', {'total': len(items), 'concurrency': concurrency})
+        for index, result, error in iter_batch_results(items, _generate, concurrency, image_rate_limiter):
+            completed += 1
+            progress = {'index': index, 'completed': completed, 'total': len(items)}
+            if error is None:
+                succeeded += 1
+                yield _emit('result', {**progress, **result})
+            else:
+                print(f"Batch image {index} failed: {error}")
+                yield _emit('error', {**progress, 'error': str(error)})
+        yield _emit('done', {
+            'total': len(items),
+            'succeeded': succeeded,
+            'failed': len(items) - succeeded,
+            'elapsed_ms': int((time.monotonic() - started) * 1000),
+        })
+
+    response = StreamingHttpResponse(
+        _stream(), content_type='text/event-stream' if use_sse else 'application/x-ndjson'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @csrf_exempt
 def generate_video_view(request):
     if request.method != 'POST':
@@ -406,6 +729,7 @@ def generate_video_view(request):
 
     try:
         req_data = json.loads(request.body or '{}')
+        deadline = request_deadline('video', req_data.get('deadlineSec'))
         prompt = req_data.get('prompt')
         config = req_data.get('config', {}) or {}
         reference_images = req_data.get('referenceImages', []) or []
@@ -413,91 +737,332 @@ def generate_video_view(request):
         if not prompt:
             return JsonResponse({'error': 'Prompt is required'}, status=400)
             
-        model_id = config.get('modelId', '')
-
-        if model_id.startswith('kling'):
-            from .services import generate_video_with_kling
-            video_bytes, mime_type, used_model = generate_video_with_kling(
-                prompt=prompt,
-                config=config,
-                reference_images=reference_images
-            )
-        else:
-            video_bytes, mime_type, used_model = generate_video_with_veo(
-                prompt=prompt,
-                config=config,
-                reference_images=reference_images
-            )
+        generated_video, mime_type, used_model = generate_and_store_video(prompt, config, reference_images, deadline)
+        return _generated_video_response(generated_video, mime_type, used_model)
 
-        ext = 'mp4'
-        if isinstance(mime_type, str):
-            lower = mime_type.lower()
-            if 'webm' in lower:
-                ext = 'webm'
-            elif 'quicktime' in lower or 'mov' in lower:
-                ext = 'mov'
-
-        filename = f"generated_video_{uuid.uuid4()}.{ext}"
-        generated_video = GeneratedVideo.objects.create(
-            video=ContentFile(video_bytes, name=filename),
-            prompt=prompt
-        )
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _generate_video_error_response(e)
 
-        return JsonResponse({
-            'url': generated_video.video.url,
-            'mimeType': mime_type,
-            'model': used_model,
-            'saved_video': {
-                'id': generated_video.id,
-                'url': generated_video.video.url
-            }
-        })
 
+def _generated_video_response(generated_video, mime_type, used_model):
+    return JsonResponse({
+        'url': generated_video.video.url,
+        'mimeType': mime_type,
+        'model': used_model,
+        'saved_video': {
+            'id': generated_video.id,
+            'url': generated_video.video.url
+        }
+    })
+
+# --- Async (ASGI) Generation Views ---
+# Same request/response contracts as the views above, but the upstream wait is awaited on
+# the event loop via client.aio, so an ASGI worker holds hundreds of in-flight generations
+# without a thread each. Under WSGI Django runs these in a per-request event loop, which
+# works but gains nothing; serve nanogen_django.asgi:application to benefit.
+
+@csrf_exempt
+async def async_generate_image_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+        deadline = request_deadline('image', req_data.get('deadlineSec'))
+        prompt = req_data.get('prompt')
+        config = req_data.get('config', {}) or {}
+        reference_images = req_data.get('referenceImages', []) or []
+        mask_image = req_data.get('maskImage', None)
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        response_mode = req_data.get('responseMode') or request.GET.get('response', 'inline')
+
+        image_bytes, mime_type = await agenerate_image_with_gemini(prompt, config, reference_images, mask_image, deadline)
+
+        try:
+            generated_image = await sync_to_async(store_generated_image)(image_bytes, mime_type, prompt)
+        except Exception as save_error:
+            print(f"Error saving image: {save_error}")
+            generated_image = None
+
+        return _generated_image_response(image_bytes, mime_type, generated_image, response_mode)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _generate_image_error_response(e)
+
+
+@csrf_exempt
+async def async_generate_video_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+        deadline = request_deadline('video', req_data.get('deadlineSec'))
+        prompt = req_data.get('prompt')
+        config = req_data.get('config', {}) or {}
+        reference_images = req_data.get('referenceImages', []) or []
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        video, mime_type, used_model = await agenerate_video(prompt, config, reference_images, deadline)
+        generated_video = await sync_to_async(store_generated_video)(video, mime_type, prompt)
+        return _generated_video_response(generated_video, mime_type, used_model)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _generate_video_error_response(e)
+
+
+@csrf_exempt
+async def async_generate_midjourney_prompt_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        data = json.loads(request.body)
+        prompt = await agenerate_midjourney_prompt(data)
+        return JsonResponse({'prompt': prompt})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+def submit_video_job_view(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+        prompt = req_data.get('prompt')
+        config = req_data.get('config', {}) or {}
+        reference_images = req_data.get('referenceImages', []) or []
+
+        if not prompt:
+            return JsonResponse({'error': 'Prompt is required'}, status=400)
+
+        job = submit_video_job(prompt, config, reference_images)
+        return JsonResponse(serialize_video_job(job), status=202)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+def video_job_status_view(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    job = get_object_or_404(VideoJob.objects.select_related('video'), id=job_id)
+    return JsonResponse(serialize_video_job(job))
+
+
+@csrf_exempt
+def video_job_result_view(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    job = get_object_or_404(VideoJob.objects.select_related('video'), id=job_id)
+    data = serialize_video_job(job)
+    if job.status == 'failed':
+        return JsonResponse(data, status=500)
+    if job.status != 'succeeded':
+        return JsonResponse(data, status=409)
+    if not job.video_id:
+        data['error'] = 'Generated video was deleted.'
+        return JsonResponse(data, status=410)
+    return JsonResponse(data)
+
+
+@csrf_exempt
+def submit_workflow_run_view(request):
+    """
+    Starts a server-side run of a saved workflow (or an explicit `graph` snapshot).
+    With `targetNodeId` only that node and its upstream dependencies are executed.
+    Unchanged generator nodes reuse memoized outputs; `force` / `forceNodeIds` regenerate them.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        req_data = json.loads(request.body or '{}')
+        workflow_id = req_data.get('workflowId')
+        graph = req_data.get('graph')
+        if not workflow_id and not isinstance(graph, dict):
+            return JsonResponse({'error': 'workflowId or graph is required'}, status=400)
+        if graph is not None and not isinstance(graph, dict):
+            return JsonResponse({'error': 'graph must be an object'}, status=400)
+
+        try:
+            graph, workflow = load_run_graph(workflow_id, graph)
+        except Workflow.DoesNotExist:
+            return JsonResponse({'error': 'Workflow not found'}, status=404)
+
+        force_node_ids = req_data.get('forceNodeIds') or []
+        if not isinstance(force_node_ids, list):
+            return JsonResponse({'error': 'forceNodeIds must be a list'}, status=400)
+        run = submit_workflow_run(
+            graph, workflow, req_data.get('targetNodeId'),
+            force=bool(req_data.get('force')),
+            force_node_ids=force_node_ids
+        )
+        return JsonResponse(serialize_workflow_run(run), status=202)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JsonResponse({'error': str(e)}, status=500)
 
+
+@csrf_exempt
+def workflow_run_status_view(request, run_id):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    run = get_object_or_404(WorkflowRun, id=run_id)
+    return JsonResponse(serialize_workflow_run(run))
+
+
+@csrf_exempt
+def cancel_workflow_run_view(request, run_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    run = get_object_or_404(WorkflowRun, id=run_id)
+    if run.status in ('queued', 'running'):
+        # Nodes already executing finish; nothing new is scheduled.
+        request_cancel(run.id)
+        run.refresh_from_db()
+    return JsonResponse(serialize_workflow_run(run), status=202)
+
+@csrf_exempt
+def workflow_node_cache_view(request):
+    """
+    GET reports the node output cache; DELETE drops every memoized node output.
+    """
+    if request.method == 'GET':
+        return JsonResponse(node_output_cache.stats())
+    if request.method == 'DELETE':
+        node_output_cache.clear()
+        return JsonResponse(node_output_cache.stats())
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+@csrf_exempt
+def model_health_view(request):
+    """
+    GET reports per-model circuit state for the image and prompt fallback chains;
+    DELETE forgets all recorded health so every model is tried again.
+    """
+    if request.method == 'GET':
+        return JsonResponse(model_health.snapshot())
+    if request.method == 'DELETE':
+        model_health.reset()
+        return JsonResponse(model_health.snapshot())
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+# Sort order between media types that share a created_at timestamp.
+LIBRARY_KIND_IMAGE = 0
+LIBRARY_KIND_VIDEO = 1
+
+
+def _library_queryset(model, file_field, kind, cursor=None):
+    qs = model.objects.annotate(
+        kind=Value(kind, output_field=IntegerField()),
+        file=F(file_field)
+    ).values('created_at', 'kind', 'id', 'file', 'prompt').order_by()
+    if cursor:
+        cursor_at, cursor_kind, cursor_id = cursor
+        condition = Q(created_at__lt=cursor_at)
+        if kind < cursor_kind:
+            condition |= Q(created_at=cursor_at)
+        elif kind == cursor_kind:
+            condition |= Q(created_at=cursor_at, id__lt=cursor_id)
+        qs = qs.filter(condition)
+    return qs
+
+
 @csrf_exempt
 def list_images(request):
+    """
+    Unified image/video library, paginated in the database with a UNION ALL ordered
+    by (-created_at, -kind, -id). Pass `cursor` (from `next_cursor`) for keyset
+    pagination; `page` is still accepted for offset-based clients.
+    Totals come from a cached COUNT and are only computed in page mode or with include_total=1.
+    """
     try:
-        from django.core.paginator import Paginator
-        from django.utils.dateparse import parse_datetime
-        page = request.GET.get('page', 1)
-        limit = int(request.GET.get('limit', 20))
+        limit = parse_limit(request.GET.get('limit', 20))
+        media_type = request.GET.get('type', 'all')
+        cursor_param = request.GET.get('cursor')
+        cursor = None
+        if cursor_param:
+            try:
+                cursor = decode_cursor(cursor_param, 3)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
 
-        items = []
-        for img in GeneratedImage.objects.all().only('id', 'image', 'prompt', 'created_at'):
-            items.append({
-                'key': f"img:{img.id}",
-                'id': img.id,
-                'media_type': 'image',
-                'url': img.image.url,
-                'prompt': img.prompt,
-                'created_at': img.created_at.isoformat()
-            })
+        sources = []
+        counters = []
+        if media_type in ('all', 'image'):
+            sources.append(_library_queryset(GeneratedImage, 'image', LIBRARY_KIND_IMAGE, cursor))
+            counters.append(('generated_images', GeneratedImage.objects.all()))
+        if media_type in ('all', 'video'):
+            sources.append(_library_queryset(GeneratedVideo, 'video', LIBRARY_KIND_VIDEO, cursor))
+            counters.append(('generated_videos', GeneratedVideo.objects.all()))
+        if not sources:
+            return JsonResponse({'error': 'Invalid media type'}, status=400)
 
-        for vid in GeneratedVideo.objects.all().only('id', 'video', 'prompt', 'created_at'):
-            items.append({
-                'key': f"vid:{vid.id}",
-                'id': vid.id,
-                'media_type': 'video',
-                'url': vid.video.url,
-                'prompt': vid.prompt,
-                'created_at': vid.created_at.isoformat()
-            })
+        combined = sources[0].union(*sources[1:], all=True) if len(sources) > 1 else sources[0]
+        combined = combined.order_by('-created_at', '-kind', '-id')
 
-        items.sort(key=lambda x: parse_datetime(x['created_at']), reverse=True)
+        page = 1
+        if cursor is None:
+            try:
+                page = max(1, int(request.GET.get('page', 1)))
+            except (TypeError, ValueError):
+                page = 1
+        offset = (page - 1) * limit
+        rows = list(combined[offset:offset + limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
-        paginator = Paginator(items, limit)
-        page_obj = paginator.get_page(page)
+        items = []
+        for row in rows:
+            is_video = row['kind'] == LIBRARY_KIND_VIDEO
+            media_type = 'video' if is_video else 'image'
+            key = f"{'vid' if is_video else 'img'}:{row['id']}"
+            item = {
+                'key': key,
+                'id': row['id'],
+                'media_type': media_type,
+                'url': default_storage.url(row['file']),
+                'prompt': row['prompt'],
+                'created_at': row['created_at'].isoformat()
+            }
+            item.update(derivative_urls(key, row['file'], media_type))
+            items.append(item)
 
-        return JsonResponse({
-            'images': list(page_obj.object_list),
-            'page': page_obj.number,
-            'num_pages': paginator.num_pages,
-            'total': paginator.count
-        })
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = encode_cursor(last['created_at'], last['kind'], last['id'])
+
+        data = {
+            'images': items,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+        }
+        if cursor is None or request.GET.get('include_total') == '1':
+            total = sum(cached_count(name, queryset) for name, queryset in counters)
+            data['total'] = total
+            if cursor is None:
+                data.update({
+                    'page': page,
+                    'num_pages': max(1, -(-total // limit))
+                })
+        return JsonResponse(data)
     except Exception as e:
         print(f"Error listing images: {e}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -507,8 +1072,10 @@ def delete_image(request, image_id):
     if request.method == 'DELETE':
         try:
             image = get_object_or_404(GeneratedImage, id=image_id)
+            delete_derivatives(image.image.name)
             image.image.delete() # Delete file
             image.delete() # Delete record
+            invalidate_count('generated_images')
             return JsonResponse({'success': True})
         except Exception as e:
              return JsonResponse({'error': str(e)}, status=500)
@@ -528,16 +1095,58 @@ def delete_library_item(request, item_key):
 
         if prefix == 'img':
             image = get_object_or_404(GeneratedImage, id=item_id)
+            delete_derivatives(image.image.name)
             image.image.delete()
             image.delete()
+            invalidate_count('generated_images')
             return JsonResponse({'success': True})
 
         if prefix == 'vid':
             video = get_object_or_404(GeneratedVideo, id=item_id)
+            delete_derivatives(video.video.name)
             video.video.delete()
             video.delete()
+            invalidate_count('generated_videos')
             return JsonResponse({'success': True})
 
         return JsonResponse({'error': 'Unsupported item type'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+def media_derivative_view(request, item_key, size):
+    """
+    Lazily generates a thumbnail/preview (images) or poster frame (videos) and redirects to it.
+    Falls back to the original file when the derivative cannot be produced.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        prefix, _, raw_id = item_key.partition(':')
+        if not raw_id.isdigit():
+            return JsonResponse({'error': 'Invalid item key'}, status=400)
+        if prefix == 'img':
+            field = get_object_or_404(GeneratedImage, id=int(raw_id)).image
+        elif prefix == 'src':
+            field = get_object_or_404(SourceImage, id=int(raw_id)).image
+        elif prefix == 'vid':
+            field = get_object_or_404(GeneratedVideo, id=int(raw_id)).video
+        else:
+            return JsonResponse({'error': 'Unsupported item type'}, status=400)
+
+        is_video = prefix == 'vid'
+        if (is_video and size != POSTER_SIZE) or (not is_video and size not in IMAGE_SIZES):
+            return JsonResponse({'error': 'Unsupported derivative size'}, status=400)
+
+        name = ensure_derivative(field.name, size)
+        if not name:
+            if is_video:
+                return JsonResponse({'error': 'Poster frame unavailable'}, status=404)
+            return redirect(field.url)
+        return redirect(default_storage.url(name))
+    except Http404:
+        raise
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,728 @@
+import os
+import re
+import json
+import hashlib
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse, unquote
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import Workflow, WorkflowRun
+from .blobs import extract_inline_media
+from .cache import BoundedLRUCache
+from .services import generate_midjourney_prompt, PROMPT_ERROR_PREFIX
+from .jobs import generate_and_store_video, generate_and_store_image
+from .batching import iter_batch_results, batch_concurrency, image_rate_limiter
+from .leases import lease_fields, recover_stale, register_recovery
+
+
+# Node semantics mirror runWorkflowPipeline in static/nanogen/js/app.js.
+GENERATOR_NODE_NAMES = {'generator', 'prompt_gen', 'image_gen', 'video_gen', 'base_gen', 'modifier'}
+DEFAULT_NODE_TITLES = {
+    'text_input': 'Text Input',
+    'image_input': 'Image Input',
+    'video_input': 'Video Input',
+    'generator': 'Generator',
+    'prompt_gen': 'Prompt Agent',
+    'image_gen': 'Image Generator',
+    'video_gen': 'Video Generator',
+    'output_result': 'Output Result',
+}
+AGENT_RESULT_MARKER = '[PROMPT_AGENT_RESULT]'
+
+# Node data that determines its output; layout, status text and stored results are ignored.
+NODE_SIGNATURE_FIELDS = (
+    'generatorKind', 'outputType', 'modelId', 'agentPrompt', 'agentOutputFormat', 'textPrompt',
+    'count', 'style', 'aspectRatio', 'resolution', 'durationSeconds', 'klingMode', 'cameraMovement',
+    'localReferenceImage', 'text', 'imageBase64', 'videoUrl',
+)
+# Bump when execute_node changes what a node produces for the same inputs.
+NODE_CACHE_VERSION = '1'
+
+_IMAGE_EXT_RE = re.compile(r'\.(jpeg|jpg|png|webp|gif|bmp)(\?.*)?$')
+_VIDEO_EXT_RE = re.compile(r'\.(mp4|webm|mov)(\?.*)?$')
+_VIDEO_SIGNAL_RE = re.compile(r'\b(video|sora|runway|luma|veo|shot|scene|cinematography|dialogue|background sound|camera movement)\b')
+_SINGLE_GRID_RE = re.compile(r'multi[-_ ]?shot|multi[-_ ]?scene|contact sheet|split image|(\d+)\s*분할|timeline|sequence', re.IGNORECASE)
+_LIST_ITEM_RE = re.compile(r'^(example\s*\d+|단락\s*\d+|상황\s*\d+|shot\s*\d+|scene\s*\d+|\d+\.|-|\*)\s*[:.]?', re.IGNORECASE)
+_STYLE_RE = re.compile(r'style\s*:', re.IGNORECASE)
+_RESULT_IMAGE_RE = re.compile(r'\.(png|jpe?g|webp|gif|bmp)(\?|$)', re.IGNORECASE)
+_RESULT_VIDEO_RE = re.compile(r'\.(mp4|webm|mov)(\?|$)', re.IGNORECASE)
+
+_run_executor = None
+_node_executor = None
+_executor_lock = threading.Lock()
+
+
+class NodeExecutionError(Exception):
+    pass
+
+
+# Generator outputs keyed by node signature, so re-runs skip unchanged subgraphs.
+# Entries are small (URLs or prompt text); the byte bound guards against huge agent outputs.
+node_output_cache = BoundedLRUCache(
+    max_entries=int(os.environ.get('WORKFLOW_NODE_CACHE_MAX_ENTRIES', '2048')),
+    max_bytes=int(float(os.environ.get('WORKFLOW_NODE_CACHE_MAX_MB', '16')) * 1024 * 1024),
+    sizeof=lambda outcome: len(json.dumps(outcome))
+)
+
+
+def _get_executors():
+    """
+    Lazily creates the run coordinator pool and the bounded node worker pool, and starts
+    heartbeating the runs this process owns (see leases.py).
+    """
+    global _run_executor, _node_executor
+    with _executor_lock:
+        if _run_executor is None:
+            run_workers = max(1, int(os.environ.get('WORKFLOW_RUN_WORKERS', '2')))
+            node_workers = max(1, int(os.environ.get('WORKFLOW_NODE_WORKERS', '4')))
+            _run_executor = ThreadPoolExecutor(max_workers=run_workers, thread_name_prefix='workflow-run')
+            _node_executor = ThreadPoolExecutor(max_workers=node_workers, thread_name_prefix='workflow-node')
+            register_recovery(WorkflowRun, recover_interrupted_runs)
+        return _run_executor, _node_executor
+
+
+def recover_interrupted_runs():
+    """
+    Marks queued/running runs failed when the process that owned them stopped heartbeating.
+    Runs of live worker processes are left alone. Returns the number of runs failed.
+    """
+    return recover_stale(WorkflowRun, 'Interrupted by server restart. Please run the workflow again.')
+
+
+# --- Graph helpers ---
+
+def graph_nodes(graph):
+    data = (((graph or {}).get('drawflow') or {}).get('Home') or {}).get('data')
+    return data if isinstance(data, dict) else {}
+
+
+def upstream_ids(node):
+    """
+    Source node ids feeding a node, in input-port then connection order.
+    """
+    ids = []
+    inputs = node.get('inputs') if isinstance(node, dict) else None
+    for port in (inputs or {}).values():
+        for conn in (port or {}).get('connections') or []:
+            if isinstance(conn, dict) and conn.get('node') is not None:
+                ids.append(str(conn['node']))
+    return ids
+
+
+def collect_dependency_ids(nodes, target_id):
+    needed = set()
+    stack = [str(target_id)]
+    while stack:
+        node_id = stack.pop()
+        if node_id in needed or node_id not in nodes:
+            continue
+        needed.add(node_id)
+        stack.extend(upstream_ids(nodes[node_id]))
+    return needed
+
+
+def node_display_name(node_id, node):
+    data = node.get('data') or {}
+    title = str(data.get('customTitle') or '').strip()
+    if title:
+        return title
+    return DEFAULT_NODE_TITLES.get(node.get('name'), f"Node {node_id}")
+
+
+def normalize_generator_kind(kind, fallback_output_type='image'):
+    if kind in ('agent', 'image', 'video'):
+        return kind
+    if fallback_output_type == 'prompt':
+        return 'agent'
+    if fallback_output_type == 'video':
+        return 'video'
+    return 'image'
+
+
+def output_type_for_kind(kind):
+    if kind == 'agent':
+        return 'prompt'
+    if kind == 'video':
+        return 'video'
+    return 'image'
+
+
+def generator_output_type(node):
+    data = node.get('data') or {}
+    name = node.get('name')
+    legacy = data.get('outputType') or ('prompt' if name == 'prompt_gen' else ('video' if name == 'video_gen' else 'image'))
+    return output_type_for_kind(normalize_generator_kind(data.get('generatorKind'), legacy))
+
+
+def reusable_node_result(node):
+    """
+    The result a node already holds from a previous run, or None (see getReusableNodeResult).
+    """
+    data = node.get('data') or {}
+    name = node.get('name')
+    if name == 'text_input':
+        text = data.get('text').strip() if isinstance(data.get('text'), str) else ''
+        return text or None
+    if name == 'image_input':
+        return data.get('imageBase64') or None
+    if name == 'video_input':
+        return data.get('videoUrl') or None
+    if name in GENERATOR_NODE_NAMES:
+        result_type = data.get('resultType') or ''
+        if result_type == 'image':
+            urls = [u for u in data.get('generatedImageUrls') or [] if u]
+            return urls[0] if urls else None
+        if result_type == 'video':
+            many = [u for u in data.get('generatedVideoUrls') or [] if u]
+            return many[0] if many else (data.get('generatedVideoUrl') or None)
+        if result_type == 'text':
+            text = data.get('generatedTextResult')
+            return text.strip() if isinstance(text, str) and text.strip() else None
+    return None
+
+
+def is_image_url(value):
+    if not isinstance(value, str):
+        return False
+    if value.startswith('data:image/'):
+        return True
+    lower = value.lower()
+    return bool(_IMAGE_EXT_RE.search(lower)) or ('/media/' in lower and not re.search(r'\.(mp4|webm|mov)$', lower))
+
+
+def is_video_url(value):
+    if not isinstance(value, str):
+        return False
+    return bool(_VIDEO_EXT_RE.search(value.lower()))
+
+
+def format_agent_result_text(raw_text, output_format):
+    text = str(raw_text or '')
+    if (output_format or 'text') != 'list':
+        return text
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    return '\n'.join(line if line.startswith('- ') else f"- {line}" for line in lines)
+
+
+def split_video_scenarios(raw_text):
+    text = str(raw_text or '').strip()
+    if not text:
+        return []
+    if _SINGLE_GRID_RE.search(text):
+        return [text]
+
+    starts = [m.start() for m in _STYLE_RE.finditer(text)]
+
+    list_blocks = []
+    current = []
+    list_detected = False
+    for line in text.split('\n'):
+        if _LIST_ITEM_RE.match(line.strip()):
+            if current:
+                list_blocks.append('\n'.join(current).strip())
+            current = [line]
+            list_detected = True
+        elif current:
+            current.append(line)
+    if current and list_detected:
+        list_blocks.append('\n'.join(current).strip())
+
+    if len(list_blocks) >= 2:
+        return [block for block in list_blocks if block][:8]
+
+    if len(starts) >= 2:
+        blocks = []
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(text)
+            chunk = text[start:end].strip()
+            if chunk:
+                blocks.append(chunk)
+        return blocks[:8]
+
+    return [text]
+
+
+def to_media_reference(url):
+    """
+    Reference form passed between nodes: inline data URIs are moved to blob storage once,
+    same-origin media URLs are reduced to their /media/ path.
+    """
+    if not isinstance(url, str) or not url:
+        return url
+    if url.startswith('data:'):
+        return extract_inline_media(url)
+    path = unquote(urlparse(url).path)
+    media_url = '/' + settings.MEDIA_URL.strip('/') + '/'
+    return path if path.startswith(media_url) else url
+
+
+def _hash_payload(payload):
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def node_signature(node, inputs):
+    """
+    Hash of a node's type, output-relevant config and its inputs, where `inputs` is a list of
+    (display name, upstream result) pairs. Inputs are hashed by value, so regenerating an
+    upstream node invalidates everything below it. Display names are included because
+    @mentions resolve against them.
+    """
+    data = node.get('data') or {}
+    config = {field: data[field] for field in NODE_SIGNATURE_FIELDS if data.get(field) not in (None, '')}
+    inputs = [[name, _hash_payload(result)] for name, result in inputs]
+    return _hash_payload([NODE_CACHE_VERSION, node.get('name'), config, inputs])
+
+
+def _media_outputs_exist(outcome):
+    media_url = '/' + settings.MEDIA_URL.strip('/') + '/'
+    for url in outcome.get('urls') or []:
+        if isinstance(url, str) and url.startswith(media_url):
+            path = os.path.join(settings.MEDIA_ROOT, *unquote(url[len(media_url):]).split('/'))
+            if not os.path.isfile(path):
+                return False
+    return True
+
+
+def cached_node_output(signature):
+    """
+    Returns the memoized outcome for a signature, dropping entries whose media files were deleted.
+    """
+    outcome = node_output_cache.get(signature)
+    if outcome is not None and not _media_outputs_exist(outcome):
+        node_output_cache.pop(signature)
+        return None
+    return outcome
+
+
+def _cacheable_outcome(outcome):
+    """
+    Only real results are memoized: no empty output, and no prompt-generation error text
+    that would otherwise be replayed to every later run.
+    """
+    result = outcome.get('result')
+    if not isinstance(result, str) or not result.strip():
+        return False
+    if outcome.get('resultType') == 'text':
+        text = result.replace(AGENT_RESULT_MARKER, '', 1).strip()
+        # List-formatted agent output prefixes the text with "- ".
+        return bool(text) and not text.lstrip('- ').startswith(PROMPT_ERROR_PREFIX)
+    return bool(outcome.get('urls'))
+
+
+def _clamp_int(value, low, high, default):
+    try:
+        number = int(float(value))
+    except (TypeError, ValueError):
+        return default
+    return max(low, min(high, number or default))
+
+
+# --- Node execution ---
+
+def _run_generator(node_id, node, upstream, mention_values):
+    data = node.get('data') or {}
+    output_type = generator_output_type(node)
+    local_prompt = str(data.get('textPrompt') or '').strip()
+    agent_prompt = str(data.get('agentPrompt') or '').strip()
+
+    used_mentions = set()
+    for name, result in mention_values.items():
+        if isinstance(result, str) and not is_image_url(result) and not is_video_url(result):
+            clean_text = result.replace(AGENT_RESULT_MARKER, '', 1).strip() if AGENT_RESULT_MARKER in result else result
+            token = f"@{name}"
+            if token in local_prompt or token in agent_prompt:
+                local_prompt = local_prompt.replace(token, clean_text)
+                agent_prompt = agent_prompt.replace(token, clean_text)
+                used_mentions.add(result)
+
+    executed_from_agent = []
+    regular_ref_texts = []
+    for value in upstream:
+        if isinstance(value, str) and not is_image_url(value) and not is_video_url(value):
+            if value in used_mentions:
+                continue
+            if AGENT_RESULT_MARKER in value:
+                executed_from_agent.append(value.replace(AGENT_RESULT_MARKER, '', 1).strip())
+            else:
+                regular_ref_texts.append(value)
+
+    ref_images = [v for v in upstream if is_image_url(v)]
+    if data.get('localReferenceImage'):
+        ref_images.append(data['localReferenceImage'])
+    ref_images = [to_media_reference(v) for v in ref_images]
+
+    combined_prompt = '\n\n'.join(filter(None, [
+        f"[AGENT INSTRUCTION]\n{agent_prompt}" if agent_prompt else '',
+        "[EXECUTION PROMPT]\n" + '\n\n'.join(executed_from_agent) if executed_from_agent else '',
+        f"[NODE PROMPT]\n{local_prompt}" if local_prompt else '',
+        "[UPSTREAM TEXT INPUTS]\n" + '\n\n'.join(regular_ref_texts) if regular_ref_texts else '',
+    ]))
+    prompt_signal = '\n'.join([agent_prompt, local_prompt, '\n'.join(regular_ref_texts), '\n'.join(executed_from_agent)]).lower()
+    inferred_media_type = 'video' if _VIDEO_SIGNAL_RE.search(prompt_signal) else 'image'
+    image_count = _clamp_int(data.get('count'), 1, 8, 1)
+    aspect_ratio = data.get('aspectRatio') or '16:9'
+    resolution = data.get('resolution') or '1K'
+
+    if output_type == 'prompt':
+        if not combined_prompt and not ref_images:
+            raise NodeExecutionError('Prompt Agent requires an execution prompt or reference inputs.')
+    elif not combined_prompt:
+        raise NodeExecutionError('Generator requires text input (Agent Prompt, Text Prompt, or upstream text).')
+
+    if output_type == 'prompt':
+        try:
+            prompt = generate_midjourney_prompt({
+                'executionPrompt': local_prompt or agent_prompt,
+                'knowledgeAndBrief': '\n\n'.join(regular_ref_texts),
+                'referenceImages': ref_images,
+                'config': {
+                    'modelId': data.get('modelId') or 'gemini-2.5-flash',
+                    'aspectRatio': aspect_ratio,
+                    'resolution': resolution
+                },
+                'media_type': inferred_media_type
+            }, raise_errors=True)
+        except Exception as e:
+            print(f"Gemini Prompt Gen Error: {e}")
+            raise NodeExecutionError(f"Prompt generation failed: {e}") from e
+        if not prompt:
+            raise NodeExecutionError('Prompt generation failed')
+        text = f"{AGENT_RESULT_MARKER}\n" + format_agent_result_text(prompt, data.get('agentOutputFormat'))
+        return {'result': text, 'resultType': 'text', 'urls': []}
+
+    execution_source = '\n\n'.join(executed_from_agent) or agent_prompt
+    scenarios = split_video_scenarios(execution_source)
+    if not execution_source or len(scenarios) < 2:
+        scenarios = [combined_prompt]
+    else:
+        scenarios = ['\n\n'.join(filter(None, [
+            f"[EXECUTION PROMPT]\n{scenario}",
+            f"[NODE PROMPT]\n{local_prompt}" if local_prompt else '',
+            "[UPSTREAM TEXT INPUTS]\n" + '\n\n'.join(regular_ref_texts) if regular_ref_texts else '',
+        ])) for scenario in scenarios]
+
+    if output_type == 'image':
+        prompts = scenarios if len(scenarios) > 1 else scenarios * image_count
+        config = {
+            'modelId': data.get('modelId') or 'gemini-3-pro-image-preview',
+            'style': data.get('style') or 'auto',
+            'aspectRatio': aspect_ratio,
+            'resolution': resolution
+        }
+        # Variants are independent, so they run concurrently like /api/generate/batch.
+        concurrency = batch_concurrency(None, 'IMAGE_BATCH_CONCURRENCY', '8', 'IMAGE_BATCH_MAX_CONCURRENCY', '32')
+        urls = [None] * len(prompts)
+        for index, generated_image, error in iter_batch_results(
+            prompts, lambda prompt: generate_and_store_image(prompt, config, ref_images)[0], concurrency, image_rate_limiter
+        ):
+            if error is not None:
+                raise error
+            urls[index] = generated_image.image.url
+        return {'result': urls[0], 'resultType': 'image', 'urls': urls}
+
+    if output_type == 'video':
+        if not scenarios or (len(scenarios) == 1 and not scenarios[0]):
+            raise NodeExecutionError('Video Generator requires at least one prompt scenario.')
+        config = {
+            'modelId': data.get('modelId') or 'veo-3.1-fast-generate-preview',
+            'aspectRatio': aspect_ratio,
+            'resolution': resolution,
+            'durationSeconds': _clamp_int(data.get('durationSeconds'), 4, 10, 8),
+            'klingMode': data.get('klingMode') or 'std',
+            'cameraMovement': data.get('cameraMovement') or ''
+        }
+        urls = []
+        for scenario in scenarios:
+            generated_video, _, _ = generate_and_store_video(scenario, config, ref_images)
+            urls.append(generated_video.video.url)
+        return {'result': urls[0], 'resultType': 'video', 'urls': urls}
+
+    raise NodeExecutionError(f"Unsupported generator output type: {output_type}")
+
+
+def execute_node(node_id, node, upstream, mention_values):
+    """
+    Runs one node. `upstream` lists the results of its source nodes in input order and
+    `mention_values` maps their display names to those results. Returns a result dict.
+    """
+    name = node.get('name')
+    data = node.get('data') or {}
+
+    if name == 'text_input':
+        return {'result': str(data.get('text') or '').strip(), 'resultType': 'text', 'urls': []}
+    if name == 'image_input':
+        image = data.get('imageBase64')
+        if not image:
+            raise NodeExecutionError('Image node requires an uploaded image.')
+        image = to_media_reference(image)
+        return {'result': image, 'resultType': 'image', 'urls': [image]}
+    if name == 'video_input':
+        video = data.get('videoUrl')
+        if not video:
+            raise NodeExecutionError('Video node requires an uploaded video.')
+        video = to_media_reference(video)
+        return {'result': video, 'resultType': 'video', 'urls': [video]}
+    if name in GENERATOR_NODE_NAMES:
+        return _run_generator(node_id, node, upstream, mention_values)
+    if name == 'output_result':
+        if not upstream:
+            return {'result': 'No inputs provided.', 'resultType': 'text', 'urls': []}
+        content = upstream[0]
+        if isinstance(content, str) and (content.startswith('data:image') or _RESULT_IMAGE_RE.search(content)):
+            return {'result': content, 'resultType': 'image', 'urls': [content]}
+        if isinstance(content, str) and ('/generated_videos/' in content or _RESULT_VIDEO_RE.search(content)):
+            return {'result': content, 'resultType': 'video', 'urls': [content]}
+        return {'result': '' if content is None else str(content), 'resultType': 'text', 'urls': []}
+    raise NodeExecutionError(f"Unsupported node type: {name}")
+
+
+def _execute_node_task(node_id, node, upstream, mention_values):
+    close_old_connections()
+    try:
+        return execute_node(node_id, node, upstream, mention_values)
+    finally:
+        close_old_connections()
+
+
+# --- Run coordination ---
+
+class WorkflowRunner:
+    """
+    Schedules one run: every node whose inputs are resolved is submitted to the shared
+    node pool, so independent branches execute concurrently. A failed node marks its
+    dependents skipped while unrelated branches finish.
+    """
+
+    def __init__(self, run, force=False, force_node_ids=None):
+        self.run = run
+        self.nodes = graph_nodes(run.graph)
+        self.states = {}
+        self.results = {}
+        self.signatures = {}
+        self.force = force
+        self.force_node_ids = {str(node_id) for node_id in force_node_ids or []}
+        self.cancelled = False
+        self._cancel_checked_at = None
+        self._dirty = False
+        if run.target_node:
+            # Running a single node is an explicit request to regenerate it.
+            self.force_node_ids.add(run.target_node)
+
+    def _now(self):
+        return timezone.now().isoformat()
+
+    def _save(self, **fields):
+        WorkflowRun.objects.filter(id=self.run.id).update(node_states=self.states, **fields)
+        self._dirty = False
+
+    def _flush(self):
+        # Scheduling ticks that changed no node state don't rewrite node_states.
+        if self._dirty:
+            self._save()
+
+    def _set_state(self, node_id, **values):
+        state = self.states.setdefault(node_id, {
+            'name': self.nodes[node_id].get('name'),
+            'title': node_display_name(node_id, self.nodes[node_id]),
+        })
+        state.update(values)
+        self._dirty = True
+
+    def _use_cache(self, node_id):
+        if self.force or node_id in self.force_node_ids:
+            return False
+        return self.nodes[node_id].get('name') in GENERATOR_NODE_NAMES
+
+    def _cancel_requested(self):
+        """
+        Whether a cancel was requested for this run, from any worker process. The flag is
+        re-read from the database at most once per WORKFLOW_CANCEL_POLL_SEC.
+        """
+        if self.cancelled:
+            return True
+        now = time.monotonic()
+        interval = float(os.environ.get('WORKFLOW_CANCEL_POLL_SEC', '1'))
+        if self._cancel_checked_at is None or now - self._cancel_checked_at >= interval:
+            self._cancel_checked_at = now
+            self.cancelled = is_cancel_requested(self.run.id)
+        return self.cancelled
+
+    def _scope(self):
+        target = self.run.target_node
+        if target:
+            return collect_dependency_ids(self.nodes, target)
+        return set(self.nodes)
+
+    def execute(self):
+        _, node_executor = _get_executors()
+        target = self.run.target_node
+        scope = self._scope()
+        if target and target not in scope:
+            raise NodeExecutionError(f"Target node not found: {target}")
+
+        # Partial runs reuse upstream results already stored on the nodes.
+        if target:
+            for node_id in scope - {target}:
+                cached = reusable_node_result(self.nodes[node_id])
+                if cached not in (None, ''):
+                    self.results[node_id] = cached
+                    self._set_state(node_id, status='reused', result=cached)
+
+        deps = {
+            node_id: [src for src in upstream_ids(self.nodes[node_id]) if src in scope]
+            for node_id in scope
+        }
+        pending = {node_id for node_id in scope if node_id not in self.results}
+        for node_id in pending:
+            self._set_state(node_id, status='pending')
+        self._save(status='running', started_at=timezone.now())
+
+        running = {}
+        failed = set()
+        while pending or running:
+            if self._cancel_requested():
+                for node_id in pending:
+                    self._set_state(node_id, status='cancelled')
+                pending.clear()
+
+            for node_id in sorted(pending):
+                if any(src in failed for src in deps[node_id]):
+                    pending.discard(node_id)
+                    failed.add(node_id)
+                    self._set_state(node_id, status='skipped', error='An upstream node failed.')
+                    continue
+                if all(src in self.results for src in deps[node_id]):
+                    pending.discard(node_id)
+                    node = self.nodes[node_id]
+                    signature = node_signature(node, [
+                        (node_display_name(src, self.nodes[src]), self.results[src]) for src in deps[node_id]
+                    ])
+                    self.signatures[node_id] = signature
+                    if self._use_cache(node_id):
+                        outcome = cached_node_output(signature)
+                        if outcome is not None:
+                            self.results[node_id] = outcome['result']
+                            self._set_state(node_id, status='cached', signature=signature, **outcome)
+                            continue
+                    upstream = [self.results[src] for src in deps[node_id]]
+                    mentions = {node_display_name(src, self.nodes[src]): self.results[src] for src in deps[node_id]}
+                    future = node_executor.submit(_execute_node_task, node_id, self.nodes[node_id], upstream, mentions)
+                    running[future] = node_id
+                    self._set_state(node_id, status='running', startedAt=self._now())
+            self._flush()
+
+            if not running:
+                if pending:
+                    for node_id in pending:
+                        self._set_state(node_id, status='failed', error='Unfulfilled inputs or circular dependency detected in node graph.')
+                    failed.update(pending)
+                    pending.clear()
+                break
+
+            done, _ = wait(list(running), timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                node_id = running.pop(future)
+                try:
+                    outcome = future.result()
+                    self.results[node_id] = outcome['result']
+                    if self.nodes[node_id].get('name') in GENERATOR_NODE_NAMES and _cacheable_outcome(outcome):
+                        node_output_cache.set(self.signatures[node_id], outcome)
+                    self._set_state(node_id, status='succeeded', signature=self.signatures[node_id], finishedAt=self._now(), **outcome)
+                except Exception as e:
+                    if not isinstance(e, NodeExecutionError):
+                        traceback.print_exc()
+                    failed.add(node_id)
+                    self._set_state(node_id, status='failed', error=str(e), finishedAt=self._now())
+            self._flush()
+
+        if self._cancel_requested():
+            return 'cancelled', 'Run cancelled.'
+        if failed:
+            failed_titles = [self.states[n]['title'] for n in failed if self.states[n].get('status') == 'failed']
+            return 'failed', f"Node(s) failed: {', '.join(failed_titles)}"
+        return 'succeeded', ''
+
+
+def _run_workflow(run_id, force=False, force_node_ids=None):
+    close_old_connections()
+    try:
+        run = WorkflowRun.objects.filter(id=run_id, status='queued').first()
+        if not run:
+            return
+        runner = WorkflowRunner(run, force, force_node_ids)
+        try:
+            status, error = runner.execute()
+        except Exception as e:
+            traceback.print_exc()
+            status, error = 'failed', str(e)
+        runner._save(status=status, error=error, finished_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def submit_workflow_run(graph, workflow=None, target_node=None, force=False, force_node_ids=None):
+    """
+    Persists a queued WorkflowRun for a graph snapshot and starts it. Returns the run.
+    Unchanged generator nodes reuse memoized outputs unless `force` is set or their id is
+    listed in `force_node_ids`.
+    """
+    run_executor, _ = _get_executors()
+    run = WorkflowRun.objects.create(
+        workflow=workflow,
+        graph=graph,
+        target_node=str(target_node) if target_node not in (None, '') else '',
+        **lease_fields()
+    )
+    run_executor.submit(_run_workflow, run.id, force, force_node_ids)
+    return run
+
+
+def request_cancel(run_id):
+    # Persisted, so the worker process executing the run sees it whichever process handled the request.
+    WorkflowRun.objects.filter(id=run_id, status__in=['queued', 'running']).update(cancel_requested=True)
+
+
+def is_cancel_requested(run_id):
+    return WorkflowRun.objects.filter(id=run_id, cancel_requested=True).exists()
+
+
+def serialize_workflow_run(run):
+    states = run.node_states or {}
+    counts = {}
+    for state in states.values():
+        counts[state.get('status')] = counts.get(state.get('status'), 0) + 1
+    return {
+        'runId': str(run.id),
+        'workflowId': run.workflow_id,
+        'targetNodeId': run.target_node or None,
+        'status': run.status,
+        'error': run.error or None,
+        'cancelRequested': run.cancel_requested,
+        'progress': {
+            'total': len(states),
+            'done': sum(counts.get(s, 0) for s in ('succeeded', 'reused', 'cached')),
+            'running': counts.get('running', 0),
+            'cached': counts.get('cached', 0),
+            'failed': counts.get('failed', 0) + counts.get('skipped', 0),
+        },
+        'nodes': states,
+        'created_at': run.created_at.isoformat() if run.created_at else None,
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+def load_run_graph(workflow_id=None, graph=None):
+    """
+    Resolves the graph to run: an explicit graph snapshot wins, otherwise the saved workflow.
+    Returns (graph, workflow) or raises Workflow.DoesNotExist.
+    """
+    workflow = Workflow.objects.get(id=workflow_id) if workflow_id else None
+    if graph is None:
+        graph = workflow.graph if workflow else {}
+    return graph, workflow
@@ -0,0 +1,199 @@
+import copy
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Workflow, WorkflowStore
+from .blobs import extract_inline_media
+
+
+class WorkflowConflict(Exception):
+    """
+    Raised when an If-Match version does not match the stored workflow.
+    `current` is the stored Workflow (None if it no longer exists).
+    """
+
+    def __init__(self, current=None):
+        super().__init__('Workflow was modified by another session')
+        self.current = current
+
+
+def workflow_etag(workflow):
+    return f'"v{workflow.version}"'
+
+
+def parse_if_match(request):
+    """
+    Returns None when If-Match is absent, '*' for a wildcard, otherwise the
+    version number it names (-1 if it cannot be parsed, which never matches).
+    """
+    header = request.headers.get('If-Match')
+    if header is None:
+        return None
+    value = header.strip()
+    if value == '*':
+        return '*'
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    if value.startswith('v') and value[1:].isdigit():
+        return int(value[1:])
+    return -1
+
+
+def serialize_workflow(workflow, include_graph=False):
+    data = {
+        'id': workflow.id,
+        'name': workflow.name,
+        'version': workflow.version,
+        'updatedAt': workflow.updated_at.isoformat() if workflow.updated_at else None,
+    }
+    if include_graph:
+        data['graph'] = workflow.graph
+    return data
+
+
+def get_active_workflow_id():
+    store = WorkflowStore.objects.filter(key='default').only('data').first()
+    data = store.data if store and isinstance(store.data, dict) else {}
+    return data.get('activeId')
+
+
+def set_active_workflow_id(workflow_id):
+    store, _ = WorkflowStore.objects.get_or_create(key='default', defaults={'data': {}})
+    store.data = {'activeId': workflow_id}
+    store.save(update_fields=['data', 'updated_at'])
+
+
+def apply_node_delta(graph, nodes, module='Home'):
+    """
+    Merges changed nodes into a Drawflow graph; a None value removes the node.
+    """
+    merged = copy.deepcopy(graph) if isinstance(graph, dict) else {}
+    drawflow = merged.setdefault('drawflow', {})
+    module_data = drawflow.setdefault(module, {}).setdefault('data', {})
+    for node_id, node in nodes.items():
+        if node is None:
+            module_data.pop(str(node_id), None)
+        else:
+            module_data[str(node_id)] = node
+    return merged
+
+
+def _check_version(current, expected_version):
+    if expected_version in (None, '*'):
+        return
+    if current.version != expected_version:
+        raise WorkflowConflict(current)
+
+
+def save_workflow(workflow_id, expected_version=None, name=None, graph=None, nodes=None):
+    """
+    Creates or updates one workflow. `graph` replaces the whole graph, `nodes` patches
+    individual Drawflow nodes. Raises WorkflowConflict when expected_version is stale.
+    Inline base64 media is moved to blob storage before anything is written.
+    Returns (workflow, created).
+    """
+    if graph is not None:
+        graph = extract_inline_media(graph)
+    if nodes:
+        nodes = extract_inline_media(nodes)
+
+    with transaction.atomic():
+        current = Workflow.objects.select_for_update().filter(id=workflow_id).first()
+        if current is None:
+            if expected_version is not None:
+                raise WorkflowConflict(None)
+            if graph is None:
+                graph = apply_node_delta({}, nodes) if nodes else {}
+            position = (Workflow.objects.aggregate(max_pos=Max('position'))['max_pos'] or 0) + 1
+            try:
+                with transaction.atomic():
+                    workflow = Workflow.objects.create(
+                        id=workflow_id,
+                        name=name or 'Untitled Workflow',
+                        graph=graph,
+                        position=position
+                    )
+            except IntegrityError:
+                raise WorkflowConflict(Workflow.objects.filter(id=workflow_id).first())
+            return workflow, True
+
+        _check_version(current, expected_version)
+        fields = {}
+        if name is not None:
+            fields['name'] = name
+        if graph is not None:
+            fields['graph'] = graph
+        elif nodes:
+            fields['graph'] = apply_node_delta(current.graph, nodes)
+        fields = {field: value for field, value in fields.items() if getattr(current, field) != value}
+        if not fields:
+            # Nothing changed (e.g. an empty node delta): keep the version so other tabs don't get 412s.
+            return current, False
+        fields.update(version=current.version + 1, updated_at=timezone.now())
+
+        # Compare-and-swap on the version so concurrent writers cannot both succeed.
+        updated = Workflow.objects.filter(id=workflow_id, version=current.version).update(**fields)
+        if not updated:
+            raise WorkflowConflict(Workflow.objects.filter(id=workflow_id).first())
+        for field, value in fields.items():
+            setattr(current, field, value)
+        return current, False
+
+
+def delete_workflow(workflow_id, expected_version=None):
+    """
+    Deletes a workflow, clearing the active id if it pointed at it. Returns False if missing.
+    """
+    with transaction.atomic():
+        current = Workflow.objects.select_for_update().filter(id=workflow_id).first()
+        if current is None:
+            return False
+        _check_version(current, expected_version)
+        current.delete()
+        if get_active_workflow_id() == workflow_id:
+            set_active_workflow_id(None)
+        return True
+
+
+def replace_all_workflows(workflows, active_id):
+    """
+    Legacy full-document save: upserts every posted workflow. Each one that already exists
+    must carry the `version` it was loaded at; if any is missing or stale nothing is written
+    and WorkflowConflict is raised. Workflows absent from the payload are kept (deletes go
+    through DELETE with If-Match), so a stale tab cannot remove workflows made elsewhere.
+    Returns the saved workflows.
+    """
+    with transaction.atomic():
+        saved = {}
+        for position, item in enumerate(workflows):
+            if not isinstance(item, dict) or not item.get('id'):
+                continue
+            workflow_id = str(item['id'])[:100]
+            if workflow_id in saved:
+                continue
+            name = str(item.get('name') or 'Untitled Workflow')[:255]
+            graph = extract_inline_media(item.get('graph')) if isinstance(item.get('graph'), dict) else {}
+            current = Workflow.objects.select_for_update().filter(id=workflow_id).first()
+            if current is None:
+                try:
+                    with transaction.atomic():
+                        current = Workflow.objects.create(id=workflow_id, name=name, graph=graph, position=position)
+                except IntegrityError:
+                    raise WorkflowConflict(Workflow.objects.filter(id=workflow_id).first())
+            else:
+                version = item.get('version')
+                if isinstance(version, bool) or not isinstance(version, int) or version != current.version:
+                    raise WorkflowConflict(current)
+                if current.graph != graph or current.name != name or current.position != position:
+                    fields = {
+                        'name': name, 'graph': graph, 'position': position,
+                        'version': current.version + 1, 'updated_at': timezone.now()
+                    }
+                    Workflow.objects.filter(id=workflow_id, version=current.version).update(**fields)
+                    for field, value in fields.items():
+                        setattr(current, field, value)
+            saved[workflow_id] = current
+        if active_id is None or active_id in saved or Workflow.objects.filter(id=active_id).exists():
+            set_active_workflow_id(active_id)
+        return list(saved.values())
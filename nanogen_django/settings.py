@@ -129,3 +129,25 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Increase max upload size to 100MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100 MB
+
+# Caches
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# 'prompts' stores generated prompt text (nanogen/prompt_cache.py). Point PROMPT_CACHE_BACKEND /
+# PROMPT_CACHE_LOCATION at Redis or a shared file/DB cache when running several processes.
+
+PROMPT_CACHE_BACKEND = os.environ.get('PROMPT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'prompts': {
+        'BACKEND': PROMPT_CACHE_BACKEND,
+        'LOCATION': os.environ.get('PROMPT_CACHE_LOCATION', 'nanogen-prompts'),
+        'TIMEOUT': int(os.environ.get('PROMPT_CACHE_TTL_SEC', '86400')),
+        # Redis bounds memory server-side (maxmemory-policy allkeys-lru); the others cull by entry count.
+        'OPTIONS': {} if 'redis' in PROMPT_CACHE_BACKEND.lower() else {
+            'MAX_ENTRIES': int(os.environ.get('PROMPT_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+}
@@ -14,7 +14,10 @@ if exist venv\Scripts\activate (
 timeout /t 2 /nobreak >nul
 start http://127.0.0.1:8000
 
-:: 3. Django 서버 실행
+:: 3. 이전 실행에서 중단된 백그라운드 작업 정리
+python manage.py recover_interrupted_work
+
+:: 4. Django 서버 실행
 python manage.py runserver
 
 pause